@@ -5,14 +5,14 @@ statistics generated from comparing a set of 20 Feature .mat Files:
 - 10 "Experiment" files and
 - 10 "Control" files.
 
-This can be a bit slow so we picke the results ...
+This can be a bit slow so we save the histograms ...
 
-Pickled data saved in the /examples code folder as "pickled_histograms.dat"
+The histograms are saved in the /examples code folder as
+"exp_histograms.h5" and "ctl_histograms.h5"
 
 """
 import sys
 import os
-import pickle
 import matplotlib.pyplot as plt
 
 # We must add .. to the path so that we can perform the
@@ -27,7 +27,7 @@ def main():
     root_path = os.path.join(base_path, '30m_wait')
 
     exp_histogram_manager, ctl_histogram_manager = \
-        obtain_histograms(root_path, "pickled_histograms.dat")
+        obtain_histograms(root_path, "exp_histograms.h5", "ctl_histograms.h5")
 
     # ctl_histogram_manager.plot_information()
 
@@ -70,22 +70,22 @@ def main():
     # List if the mean is available or color red if not.
 
 
-def obtain_histograms(root_path, pickle_file_path):
+def obtain_histograms(root_path, exp_store_path, ctl_store_path):
     """
     Compute histograms for 10 experiment and 10 control feature files.
 
-    Uses Python's pickle module to save results to disk to save time
-    on future times the function is run.
+    The histograms are saved to disk, as HistogramStore files, to save
+    time on future times the function is run.
 
     Parameters
     ----------
     root_path: string
         A path that has two subfolders, L and R, containing some .mat files,
         for the experiment and control samples, respectively.
-    pickle_file_path: string
-        A relative path, to the pickle file that has serialized the
-        histograms.  This is generally found in the examples folder
-        if one wishes to delete it to rerun the code fresh.
+    exp_store_path, ctl_store_path: string
+        Relative paths to the HistogramStore files of the experiment and
+        control histograms. These are generally found in the examples
+        folder if one wishes to delete them to rerun the code fresh.
 
     Returns
     -------
@@ -93,16 +93,17 @@ def obtain_histograms(root_path, pickle_file_path):
         Both instances of HistogramManager
 
     """
-    if os.path.isfile(pickle_file_path):
-        print("Found a pickled version of the histogram managers "
-              "at:\n%s\n" % pickle_file_path + "Let's attempt to "
-              "unpickle rather than re-calculate, to save time...")
-        with open(pickle_file_path, "rb") as pickle_file:
-            exp_histogram_manager = pickle.load(pickle_file)
-            ctl_histogram_manager = pickle.load(pickle_file)
+    if os.path.isfile(exp_store_path) and os.path.isfile(ctl_store_path):
+        print("Found saved versions of the histograms at:\n%s\n%s\n"
+              % (exp_store_path, ctl_store_path) + "Let's load them "
+              "rather than re-calculate, to save time...")
+        exp_histogram_manager = \
+            mv.HistogramManager.from_store(exp_store_path)
+        ctl_histogram_manager = \
+            mv.HistogramManager.from_store(ctl_store_path)
     else:
-        print("Could not find a pickled version of the histogram "
-              "managers so let's calculate from scratch and then pickle")
+        print("Could not find saved versions of the histograms "
+              "so let's calculate from scratch and then save them")
 
         experiment_path = os.path.join(root_path, 'L')
         control_path = os.path.join(root_path, 'R')
@@ -139,11 +140,12 @@ def obtain_histograms(root_path, pickle_file_path):
         print('Starting histograms')
         ctl_histogram_manager = mv.HistogramManager(new_control_features)
 
-        # Store a pickle file in the same folder as this script
+        # Save the histograms in the same folder as this script
         # (i.e. movement_validation/examples/)
-        with open(pickle_file_path, "wb") as pickle_file:
-            pickle.dump(exp_histogram_manager, pickle_file)
-            pickle.dump(ctl_histogram_manager, pickle_file)
+        # Overwrite rather than append, in case one of the stores was
+        # written by a previous run
+        exp_histogram_manager.to_store(exp_store_path, overwrite=True)
+        ctl_histogram_manager.to_store(ctl_store_path, overwrite=True)
 
     print("Experiment has a total of " +
           str(len(exp_histogram_manager.merged_histograms)) + " histograms")
@@ -37,6 +37,7 @@ from .features.feature_processing_options import FeatureProcessingOptions
 from .statistics.histogram_manager import HistogramManager
 from .statistics.statistics_manager import StatisticsManager
 from .statistics.histogram import Histogram, MergedHistogram
+from .statistics.histogram_store import HistogramStore
 
 # JAH: Putting this on hold for now 2016-02-17
 #from .statistics.pathplot import *
@@ -61,4 +62,5 @@ __all__ = ['__version__',
            'HistogramManager',
            'StatisticsManager',
            'Histogram',
-           'MergedHistogram']
+           'MergedHistogram',
+           'HistogramStore']
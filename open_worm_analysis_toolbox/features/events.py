@@ -71,7 +71,6 @@ import operator
 import h5py
 import warnings
 
-from itertools import groupby
 from .. import utils
 
 
@@ -139,6 +138,33 @@ class EventFinder:
         # of the data matching our above speed criteria
         event_candidates = self.get_start_stop_indices(speed_data, speed_mask)
 
+        return self.get_events_from_candidates(event_candidates,
+                                               distance_data)
+
+    def get_events_from_candidates(self, event_candidates, distance_data):
+        """
+        Filters candidate events by the temporal and distance thresholds
+        of this instance.
+
+        This is the second half of get_events(). It is exposed so that the
+        candidate events can be obtained by other means, e.g. from
+        get_state_start_stop_indices() for several mutually exclusive states
+        at once.
+
+        Parameters
+        ----------
+        event_candidates : 2-d int numpy array
+            (start, stop) of each candidate event, see
+            get_start_stop_indices()
+        distance_data : 1-d numpy array of length n
+            See get_events()
+
+        Returns
+        -------
+        EventList
+
+        """
+
         # ERROR: start is not at 0
         #??? Starts might all be off by 1 ...
 
@@ -276,41 +302,35 @@ class EventFinder:
         # are caught
         bracketed_event_mask = np.concatenate([[False], event_mask, [False]])
 
-        # Let's obtain the "x-coordinates" of the True entries.
-        # e.g. If our bracketed_event_mask is
-        # [False, False, False, True, False True, True, True, False], then
-        # we obtain the array [3, 5, 6, 7]
-        x = np.flatnonzero(bracketed_event_mask) - 1
-
-        # Group these together using a fancy trick from
-        # http://stackoverflow.com/questions/2154249/, since
-        # the lambda function x:x[0]-x[1] on an enumerated list will
-        # group consecutive integers together
-        # e.g. [[(0, 3)], [(1, 5), (2, 6), (3, 7)]]
-        # list(group)
-        x_grouped = [list(group) for key, group in
-                     groupby(enumerate(x), lambda i:i[0] - i[1])]
-
-        # We want to know the first element from each "run", and the
-        # last element e.g. [[3, 4], [5, 7]]
-        event_candidates = [(i[0][1], i[-1][1]) for i in x_grouped]
+        # A run of Trues starts where the bracketed mask goes from False to
+        # True and stops the frame before it goes from True to False.
+        # Since the diff is taken on the bracketed mask, diff[i] compares
+        # event_mask[i - 1] to event_mask[i]
+        # e.g. for the example above
+        #   0 1 2 3 4 5 6     <- diff indices
+        #   0 0 1 0 -1 0 0    <- diff of bracketed_event_mask
+        # so starts = [2] and stops = [4 - 1] = [3]
+        transitions = np.diff(bracketed_event_mask.astype(np.int8))
+        starts = np.flatnonzero(transitions == 1)
+        stops = np.flatnonzero(transitions == -1) - 1
+
+        event_candidates = np.column_stack((starts, stops))
 
         # Early exit if we have no starts and stops at all
-        if not event_candidates:
-            return np.array(event_candidates)
+        if not event_candidates.size:
+            return event_candidates
 
         # If a run of NaNs precedes the first start index, all the way back to
         # the first element, then revise our first (start, stop) entry to
         # include all those NaNs.
-        if np.all(np.isnan(event_data[:event_candidates[0][0]])):
-            event_candidates[0] = (0, event_candidates[0][1])
+        if np.all(np.isnan(event_data[:event_candidates[0, 0]])):
+            event_candidates[0, 0] = 0
 
         # Same but with NaNs succeeding the final end index.
-        if np.all(np.isnan(event_data[event_candidates[-1][1] + 1:])):
-            event_candidates[-1] = (event_candidates[-1]
-                                    [0], event_data.size - 1)
+        if np.all(np.isnan(event_data[event_candidates[-1, 1] + 1:])):
+            event_candidates[-1, 1] = event_data.size - 1
 
-        return np.array(event_candidates)
+        return event_candidates
 
     def remove_gaps(self, event_candidates, threshold,
                     comparison_operator):
@@ -341,26 +361,19 @@ class EventFinder:
                comparison_operator == operator.gt or
                comparison_operator == operator.ge)
 
-        new_event_candidates = []
-        num_groups = np.shape(event_candidates)[0]
+        # The number of frames between each event and the next one
+        gaps = event_candidates[1:, 0] - event_candidates[:-1, 1] - 1
 
-        i = 0
-        while(i < num_groups):
-            # Now advance through groups to the right,
-            # continuing as long as they satisfy our comparison operator
-            ii = i
-            while(ii + 1 < num_groups and comparison_operator(
-                    event_candidates[ii + 1][0] - event_candidates[ii][1] - 1,
-                    threshold)):
-                ii += 1
+        # Each event is merged with the next one if their gap satisfies the
+        # comparison. Chains of merges make a single event which starts at
+        # the first event of the chain and stops at the last one.
+        merge_with_next = comparison_operator(gaps, threshold)
 
-            # Add this largest possible start/stop duple to our NEW revised
-            # list
-            new_event_candidates.append((event_candidates[i][0],
-                                         event_candidates[ii][1]))
-            i = ii + 1
+        is_chain_start = np.concatenate(([True], ~merge_with_next))
+        is_chain_end = np.concatenate((~merge_with_next, [True]))
 
-        return np.array(new_event_candidates)
+        return np.column_stack((event_candidates[is_chain_start, 0],
+                                event_candidates[is_chain_end, 1]))
 
     def remove_too_small_events(self, event_candidates):
         """
@@ -429,14 +442,12 @@ class EventFinder:
 
         num_runs = np.shape(event_candidates)[0]
 
+        starts = event_candidates[:, 0]
+        stops = event_candidates[:, 1]
+
         # Sum the actual distance travelled by the worm during each candidate
-        # event
-        event_sums = np.empty(num_runs, dtype=float)
-        for i in range(num_runs):
-            event_sums[i] = np.nansum(
-                distance_data[
-                    event_candidates[i][0]:(
-                        event_candidates[i][1] + 1)])
+        # event, ignoring NaN values (i.e. nansum)
+        event_sums = h__sumOverEvents(distance_data, starts, stops)[0]
 
         # self.min_distance_threshold contains a 1-d n-element array of
         # skeleton lengths * 5% or whatever proportion we've decided the
@@ -449,20 +460,14 @@ class EventFinder:
         # threshold at all.
         min_threshold_sums = np.empty(num_runs, dtype=float)
         if self.min_distance_threshold is not None:
-            for i in range(num_runs):
-                min_threshold_sums[i] = np.nanmean(
-                    self.min_distance_threshold[
-                        event_candidates[i][0]:(
-                            event_candidates[i][1] + 1)])
+            min_threshold_sums = h__meanOverEvents(
+                self.min_distance_threshold, starts, stops)
 
         # Same procedure as above, but for the maximum distance threshold.
         max_threshold_sums = np.empty(num_runs, dtype=float)
         if self.max_distance_threshold is not None:
-            for i in range(num_runs):
-                max_threshold_sums[i] = np.nanmean(
-                    self.max_distance_threshold[
-                        event_candidates[i][0]:(
-                            event_candidates[i][1] + 1)])
+            max_threshold_sums = h__meanOverEvents(
+                self.max_distance_threshold, starts, stops)
 
         # Actual filtering of the candidate events
         # --------------------------------------------------------
@@ -488,6 +493,112 @@ class EventFinder:
         return event_candidates[np.flatnonzero(~events_to_remove)]
 
 
+def get_state_start_stop_indices(event_data, state_masks):
+    """
+    Batched form of EventFinder.get_start_stop_indices() for several
+    mutually exclusive masks (states), e.g. forward, backward and paused.
+
+    Every frame is labelled with the state it is in (if any) and the
+    candidate events of all states are obtained from a single run-length
+    encoding of these labels.
+
+    Parameters
+    ----------
+    event_data : 1-d float numpy array
+        See EventFinder.get_start_stop_indices()
+    state_masks : list of 1-d boolean numpy arrays
+        For each state, True if the frame is a possible event candidate for
+        that state. A frame may not be a candidate for more than one state.
+
+    Returns
+    -------
+    list of 2-d int numpy arrays
+        (start, stop) of each run, for each state. See
+        EventFinder.get_start_stop_indices()
+
+    """
+
+    num_frames = len(event_data)
+
+    state_masks = np.asarray(state_masks, dtype=bool).reshape(-1, num_frames)
+    assert(np.all(np.sum(state_masks, axis=0) <= 1))
+
+    # -1 means the frame is not in any state
+    labels = np.full(num_frames, -1, dtype=int)
+    for state_I, state_mask in enumerate(state_masks):
+        labels[state_mask] = state_I
+
+    # Run-length encoding of the labels
+    run_starts = np.flatnonzero(np.diff(labels)) + 1
+    run_starts = np.concatenate(([0], run_starts)).astype(int)
+    run_stops = np.concatenate((run_starts[1:] - 1, [num_frames - 1]))
+    run_labels = labels[run_starts]
+
+    # If a run of NaNs precedes the first labelled run, all the way back
+    # to the first element, it is swallowed into that run, and the same for
+    # NaNs following the last labelled run. Labelled frames never have NaN
+    # data so only the very first and last labelled runs can be extended.
+    is_labelled = np.flatnonzero(run_labels >= 0)
+    if is_labelled.size:
+        first_I = is_labelled[0]
+        last_I = is_labelled[-1]
+        if np.all(np.isnan(event_data[:run_starts[first_I]])):
+            run_starts[first_I] = 0
+        if np.all(np.isnan(event_data[run_stops[last_I] + 1:])):
+            run_stops[last_I] = num_frames - 1
+
+    return [np.column_stack((run_starts[run_labels == state_I],
+                             run_stops[run_labels == state_I]))
+            for state_I in range(len(state_masks))]
+
+
+def h__nanCumsum(data):
+    """
+    Cumulative sum of data, ignoring NaN values, with a leading 0.
+
+    The output has one more element than the input so that the sum over
+    data[a:b] (i.e. a slice) is output[b] - output[a].
+    """
+    return np.concatenate(([0], np.cumsum(np.where(np.isnan(data), 0, data))))
+
+
+def h__sumOverEvents(data, starts, stops):
+    """
+    Sums data over each event, ignoring NaN values, using prefix sums.
+
+    Parameters
+    ----------
+    data : 1-d numpy array
+    starts, stops : 1-d int numpy arrays
+        Event bounds, inclusive (i.e. data[starts[i]:stops[i] + 1])
+
+    Returns
+    -------
+    (sums, counts)
+        The nansum of each event and the # of non-NaN values it contains.
+    """
+    is_valid = ~np.isnan(data)
+
+    cum_data = h__nanCumsum(data)
+    cum_valid = np.concatenate(([0], np.cumsum(is_valid)))
+
+    sums = cum_data[stops + 1] - cum_data[starts]
+    counts = cum_valid[stops + 1] - cum_valid[starts]
+
+    return sums, counts
+
+
+def h__meanOverEvents(data, starts, stops):
+    """
+    Nan-aware mean of data over each event, see h__sumOverEvents. Events
+    without any valid data have a NaN mean.
+    """
+    sums, counts = h__sumOverEvents(data, starts, stops)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
 class EventList(object):
     """
     The EventList class is a relatively straightforward class specifying
@@ -654,11 +765,14 @@ class EventList(object):
         if num_frames is None:
             num_frames = self.last_event_frame + 1
 
-        mask = np.zeros(max(self.last_event_frame +
-                            1, num_frames), dtype='bool')
+        mask_length = max(self.last_event_frame + 1, num_frames)
 
-        for i_event in range(self.__len__):
-            mask[self.start_frames[i_event]:self.end_frames[i_event] + 1] = True
+        # Each event adds 1 at its start and removes it after its end, so
+        # the cumulative sum is positive only within events
+        delta = np.zeros(mask_length + 1, dtype=int)
+        np.add.at(delta, self.start_frames, 1)
+        np.add.at(delta, self.end_frames + 1, -1)
+        mask = np.cumsum(delta[:-1]) > 0
 
         #??? Why are we slicing the output?
         # This appears to be because last_event_frame+1 could be larger
@@ -864,32 +978,27 @@ class EventListWithFeatures(EventList):
         self.time_between_events = (
             self.start_frames[1:] - self.end_frames[:-1] - 1) / fps
 
+        # Cumulative distance moved, ignoring NaN values, such that the
+        # distance moved over frames [a, b) is cum_distance[b] - cum_distance[a]
+        cum_distance = h__nanCumsum(self.distance_per_frame)
+
         # Old Name: interDistance
         # Distance moved during events
         if compute_distance_during_event:
-            self.distance_during_events = np.zeros(self.__len__)
-            for i in range(self.__len__):
-                self.distance_during_events[i] = np.nansum(
-                    self.distance_per_frame[
-                        self.start_frames[i]:self.end_frames[i] + 1])
-            self.data_ratio = np.nansum(self.distance_during_events) \
-                / np.nansum(self.distance_per_frame)
+            self.distance_during_events = \
+                cum_distance[self.end_frames + 1] - \
+                cum_distance[self.start_frames]
+            self.data_ratio = np.sum(self.distance_during_events) \
+                / cum_distance[-1]
         else:
             self.distance_during_events = np.array([])
             self.data_ratio = np.NaN
 
         # Old Name: distance
         # Distance moved between events
-        self.distance_between_events = np.zeros(self.__len__ - 1)
-        for i in range(self.__len__ - 1):
-            # Suppress "FutureWarning: In Numpy 1.9 the sum along empty
-            # slices will be zero."
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore', category=FutureWarning)
-                self.distance_between_events[i] = \
-                    np.nansum(
-                        self.distance_per_frame[self.end_frames[i] + 1:
-                                                self.start_frames[i + 1]])
+        self.distance_between_events = \
+            cum_distance[self.start_frames[1:]] - \
+            cum_distance[self.end_frames[:-1] + 1]
 
         #self.distance_between_events[-1] = np.NaN
 
@@ -5,6 +5,9 @@ Module : feature_manipulations
 Public Methods:
 expand_mrc_features : 
 
+Public Classes:
+MovementFeatureView : lazily computed expanded movement feature
+
 TODO: The processing for expand_mrc_features should go in its own module. Just
 the entry function should be here ...
 
@@ -218,6 +221,12 @@ def _create_new_movement_feature(feature, m_masks, d_masks, m_type, d_type):
         Movement type
     d_type : string
         Data type
+
+    Returns
+    -------
+    MovementFeatureView
+        The values are only computed from the original feature when they
+        are first requested
     """
 
     # Spec adjustment
@@ -226,28 +235,80 @@ def _create_new_movement_feature(feature, m_masks, d_masks, m_type, d_type):
     FEATURE_NAME_FORMAT_STR = '%s.%s_data_with_%s_movement'
 
     cur_mask = m_masks[m_type] & d_masks[d_type]
-    temp_feature = feature.copy()
-    temp_spec = temp_feature.spec
+    temp_spec = feature.spec.copy()
     temp_spec.type = 'expanded_movement'
     temp_spec.is_time_series = False
     temp_spec.name = FEATURE_NAME_FORMAT_STR % (temp_spec.name, d_type, m_type)
 
-    # We might want to change this to load from the spec
-    temp_feature.name = temp_spec.name
     # display_name?
     # short_display_name?
     #
     # has_zero_bin => stays the same
     # is_signed => maybe ...
     temp_spec.is_signed = temp_spec.is_signed and d_type == 'all'
-    if d_type == 'absolute':
-        temp_feature.value = np.absolute(feature.value[cur_mask])
-    else:
-        temp_feature.value = feature.value[cur_mask]
 
-    temp_feature.spec = temp_spec
+    return MovementFeatureView(feature, temp_spec, cur_mask,
+                               d_type == 'absolute')
 
-    return temp_feature
 
+class MovementFeatureView(generic_features.Feature):
+
+    """
+    An expanded movement feature, i.e. the values of a movement feature
+    for a given motion type (all/forward/paused/backward) and data type
+    (all/absolute/positive/negative).
+
+    Rather than holding a copy of the selected values this holds a reference
+    to the values of the original feature along with the mask that selects
+    them. The values are computed when first requested, e.g. when a
+    histogram is created, so that expanding the features doesn't multiply
+    the memory used by the features.
+
+    Attributes
+    ----------
+    value : numpy.array
+        The selected values, computed on first access
+    mask : numpy.array
+        Which of the original values are selected, based on the motion type
+        and the data type. None once the values have been computed.
+    is_absolute : bool
+        Whether the absolute value of the selected values is taken
 
+    """
 
+    def __init__(self, feature, spec, mask, is_absolute):
+
+        # Everything but the value is shared with the original feature
+        for key, temp in feature.__dict__.items():
+            if key not in ('value', 'spec'):
+                setattr(self, key, copy.copy(temp))
+
+        self.name = spec.name
+        self.spec = spec
+        self.mask = mask
+        self.is_absolute = is_absolute
+
+        self._base_value = feature.value
+        self._value = None
+        self._is_value_computed = False
+
+    @property
+    def value(self):
+        if not self._is_value_computed:
+            temp_value = self._base_value[self.mask]
+            if self.is_absolute:
+                temp_value = np.absolute(temp_value)
+            self._set_value(temp_value)
+
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._set_value(value)
+
+    def _set_value(self, value):
+        self._value = value
+        self._is_value_computed = True
+        # The original values and the mask are no longer needed
+        self._base_value = None
+        self.mask = None
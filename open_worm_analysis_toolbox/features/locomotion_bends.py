@@ -16,13 +16,14 @@ Contains two classes:
       .amplitude
       .frequency
 
-  LocomotionForagingBends, which yields properties:
+  ForagingBends, which yields properties:
     .amplitude
-    .angleSpeed
+    .angle_speed
 
 """
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import scipy.ndimage.filters as filters
 
 import warnings
@@ -31,6 +32,12 @@ from . import generic_features
 from .generic_features import Feature
 from .. import utils
 
+# The maximum number of windows that go into a single batched fft call
+# in BendHelper.h__getBendData. Each row of the fft is
+# fft_n_samples / 2 + 1 complex values so this bounds the memory used.
+STFT_BLOCK_SIZE = 256
+
+
 class BendHelper(object):
     def h__getBendData(self, avg_bend_angles, bound_info, options, fps):
         """
@@ -85,70 +92,133 @@ class BendHelper(object):
             round(options.initial_max_I_pct * max_freq_I)
 
         # Convert each element from float to int
-        right_bounds = right_bounds.astype(int)
-        left_bounds = left_bounds.astype(int)
-
-        for iFrame in np.flatnonzero(~is_bad_mask):
-            windowed_data = avg_bend_angles[
-                left_bounds[iFrame]:right_bounds[iFrame]]
-            data_win_length = len(windowed_data)
-
-            #
-            # fft frequency and bandwidth
-            #
-            # Compute the real part of the STFT.
-            # These two steps take a lot of time ...
-
-            # New code:
-            fft_data = abs(np.fft.rfft(windowed_data, fft_n_samples))
-
-            # Find the peak frequency.
-            maxPeakI = np.argmax(fft_data)
-            maxPeak = fft_data[maxPeakI]
-
-            # NOTE: If this is true, we'll never bound the peak on the left.
-            # We are looking for a hump with a peak, not just a decaying
-            # signal.
-            if maxPeakI == 0:
+        good_frames_I = np.flatnonzero(~is_bad_mask)
+        right_bounds = right_bounds[good_frames_I].astype(int)
+        left_bounds = left_bounds[good_frames_I].astype(int)
+        win_lengths = right_bounds - left_bounds
+
+        # The STFT is computed in blocks of frames that share a window
+        # length, so that each block is a single 2D rfft. Blocks are capped
+        # in size since each row of the (zero padded) fft is large.
+        for data_win_length in np.unique(win_lengths):
+            if data_win_length <= 0:
                 continue
 
-            unsigned_freq = freq_scalar * maxPeakI
+            length_I = np.flatnonzero(win_lengths == data_win_length)
+            all_windows = sliding_window_view(avg_bend_angles,
+                                              data_win_length)
 
-            if not (min_freq <= unsigned_freq <= max_freq):
-                continue
+            for block_start in range(0, length_I.size, STFT_BLOCK_SIZE):
+                block_I = length_I[block_start:block_start + STFT_BLOCK_SIZE]
+                frames_I = good_frames_I[block_I]
+                windowed_data = all_windows[left_bounds[block_I]]
 
-            peakStartI, peakEndI = \
-                self.h__getBandwidth(data_win_length,
-                                     fft_data,
-                                     maxPeakI,
-                                     INIT_MAX_I_FOR_BANDWIDTH)
-            
-            if np.isnan(peakStartI) or np.isnan(peakEndI):
-                #wrong indexes, next loop
-                continue
+                block_amps, block_freqs = \
+                    self.h__getBendDataBlock(windowed_data,
+                                             fft_n_samples,
+                                             freq_scalar,
+                                             min_freq,
+                                             max_freq,
+                                             max_amp_pct_bandwidth,
+                                             peak_energy_threshold,
+                                             INIT_MAX_I_FOR_BANDWIDTH)
 
-            # Store data
-            #------------------------------------------------------------------
-            fenergy = fft_data**2
-            tot_energy = np.sum(fenergy)
-            peak_energy = np.sum(fenergy[peakStartI:peakEndI])
-
-            peak_amplitud_treshold = (max_amp_pct_bandwidth * maxPeak)
-            if not (# The minima can't be too big:
-                    fft_data[peakStartI] > peak_amplitud_treshold or
-                    fft_data[peakEndI] > peak_amplitud_treshold or
-                    # Needs to have enough energy:
-                    (peak_energy < (peak_energy_threshold * tot_energy))
-                    ):
-
-                # Convert the peak to a time frequency.
-                dataSign = np.sign(np.nanmean(windowed_data))  # sign the data
-                amps[iFrame] = (2 * fft_data[maxPeakI] /
-                                data_win_length) * dataSign
-                freqs[iFrame] = unsigned_freq * dataSign
+                amps[frames_I] = block_amps
+                freqs[frames_I] = block_freqs
 
         return amps, freqs
 
+    def h__getBendDataBlock(self, windowed_data, fft_n_samples, freq_scalar,
+                            min_freq, max_freq, max_amp_pct_bandwidth,
+                            peak_energy_threshold, INIT_MAX_I_FOR_BANDWIDTH):
+        """
+        Compute the bend amplitude and frequency for a set of frames whose
+        windows all have the same length.
+
+        Called by: h__getBendData
+
+        Parameters
+        ----------
+        windowed_data: numpy.array
+            [n_windows x data_win_length], the bend angles in the window
+            around each frame
+        (see h__getBendData for the rest)
+
+        Returns
+        -------
+        amps: numpy.array [n_windows]
+        freqs: numpy.array [n_windows]
+            NaN for windows where no valid bend was found
+
+        """
+        n_windows, data_win_length = windowed_data.shape
+        amps = np.full(n_windows, np.NaN)
+        freqs = np.full(n_windows, np.NaN)
+
+        #
+        # fft frequency and bandwidth
+        #
+        # Compute the real part of the STFT.
+        fft_data = np.abs(np.fft.rfft(windowed_data, fft_n_samples, axis=1))
+
+        # Find the peak frequency.
+        max_peak_I = np.argmax(fft_data, axis=1)
+        row_I = np.arange(n_windows)
+        max_peak = fft_data[row_I, max_peak_I]
+
+        unsigned_freq = freq_scalar * max_peak_I
+
+        # NOTE: If max_peak_I is 0, we'll never bound the peak on the left.
+        # We are looking for a hump with a peak, not just a decaying
+        # signal.
+        candidate_I = np.flatnonzero((max_peak_I != 0) &
+                                     (min_freq <= unsigned_freq) &
+                                     (unsigned_freq <= max_freq))
+
+        # Find the minima bounding the peak
+        peak_start_I, peak_end_I = \
+            self.h__getBandwidth(data_win_length,
+                                 fft_data[candidate_I],
+                                 max_peak_I[candidate_I],
+                                 INIT_MAX_I_FOR_BANDWIDTH)
+
+        has_bandwidth = (peak_start_I != -1) & (peak_end_I != -1)
+        candidate_I = candidate_I[has_bandwidth]
+        peak_start_I = peak_start_I[has_bandwidth]
+        peak_end_I = peak_end_I[has_bandwidth]
+
+        if candidate_I.size == 0:
+            return amps, freqs
+
+        # Energy of the whole spectrum and of the peak, with the latter
+        # taken from a running sum over each row
+        fenergy = fft_data[candidate_I]**2
+        tot_energy = np.sum(fenergy, axis=1)
+        cum_energy = np.zeros((candidate_I.size, fenergy.shape[1] + 1))
+        np.cumsum(fenergy, axis=1, out=cum_energy[:, 1:])
+        cand_row_I = np.arange(candidate_I.size)
+        peak_energy = (cum_energy[cand_row_I, peak_end_I] -
+                       cum_energy[cand_row_I, peak_start_I])
+
+        peak_amplitude_threshold = (max_amp_pct_bandwidth *
+                                    max_peak[candidate_I])
+        is_good = ~(
+            # The minima can't be too big:
+            (fft_data[candidate_I, peak_start_I] > peak_amplitude_threshold) |
+            (fft_data[candidate_I, peak_end_I] > peak_amplitude_threshold) |
+            # Needs to have enough energy:
+            (peak_energy < (peak_energy_threshold * tot_energy)))
+
+        good_I = candidate_I[is_good]
+
+        # Convert the peak to a time frequency.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            data_sign = np.sign(np.nanmean(windowed_data[good_I], axis=1))
+        amps[good_I] = (2 * max_peak[good_I] / data_win_length) * data_sign
+        freqs[good_I] = unsigned_freq[good_I] * data_sign
+
+        return amps, freqs
 
     def h__getBandwidth(self, data_win_length, fft_data,
                         max_peak_I, INIT_MAX_I_FOR_BANDWIDTH):
@@ -160,7 +230,10 @@ class BendHelper(object):
         range of frequencies, as execution time is proportional to the length
         of the input data.  If this fails we use the full data set.
 
-        Called by: h__getBendData
+        All windows are processed together, since they share the same
+        data_win_length (see h__getBendData).
+
+        Called by: h__getBendDataBlock
 
         Parameters
         ----------
@@ -169,10 +242,10 @@ class BendHelper(object):
           went into computing the FFT
 
         fft_data
-          Output of the fft function
+          Output of the fft function [n_windows x n_fft_values]
 
         max_peak_I
-          Location (index) of the maximum of fft_data
+          Location (index) of the maximum of each row of fft_data
 
         INIT_MAX_I_FOR_BANDWIDTH
           See code
@@ -180,9 +253,10 @@ class BendHelper(object):
 
         Returns
         -------
-        peak_start_I: scalar
+        peak_start_I: numpy.array [n_windows]
 
-        peak_end_I: scalar
+        peak_end_I: numpy.array [n_windows]
+          -1 where no bounding minimum was found
 
 
         Notes
@@ -195,54 +269,65 @@ class BendHelper(object):
 
         """
 
-        peakWinSize = round(np.sqrt(data_win_length))
+        peakWinSize = int(round(np.sqrt(data_win_length)))
+
+        n_windows = fft_data.shape[0]
+        peak_start_I = np.full(n_windows, -1)
+        peak_end_I = np.full(n_windows, -1)
 
         # Find the peak bandwidth.
-        if max_peak_I < INIT_MAX_I_FOR_BANDWIDTH:
-            # NOTE: It is incorrect to filter by the maximum here, as we want to
-            # allow matching a peak that will later be judged invalid. If we
-            # filter here we may find another smaller peak which will not be
-            # judged invalid later on.
-            min_peaks, min_peaks_I = utils.separated_peaks(
-                fft_data[:INIT_MAX_I_FOR_BANDWIDTH],
+        #
+        # NOTE: It is incorrect to filter by the maximum here, as we want to
+        # allow matching a peak that will later be judged invalid. If we
+        # filter here we may find another smaller peak which will not be
+        # judged invalid later on.
+        use_init = max_peak_I < INIT_MAX_I_FOR_BANDWIDTH
+        if use_init.any():
+            is_min_peak = utils.separated_peaks_2D(
+                fft_data[use_init, :INIT_MAX_I_FOR_BANDWIDTH],
                 peakWinSize,
                 use_max=False,
                 value_cutoff=np.inf)
-
-            del min_peaks   # this part of max_peaks_dist's return is unused
-
-            # TODO: This is wrong, replace add find to utils ...
-            peak_start_I = min_peaks_I[utils.find(min_peaks_I < max_peak_I, 1)]
-            peak_end_I = min_peaks_I[utils.find(min_peaks_I > max_peak_I, 1)]
-        else:
-            peak_start_I = np.array([])
-            peak_end_I = np.array([])
+            peak_start_I[use_init], peak_end_I[use_init] = \
+                self.h__getBoundingPeaks(is_min_peak, max_peak_I[use_init])
 
         # NOTE: Besides checking for an empty value, we also need to ensure that
         # the minimum didn't come too close to the data border, as more data
         # could invalidate the result we have.
         #
         # NOTE: In order to save time we only look at a subset of the FFT data.
-        if (peak_end_I.size == 0) | \
-                (peak_end_I + peakWinSize >= INIT_MAX_I_FOR_BANDWIDTH):
+        rerun = (peak_end_I == -1) | \
+            (peak_end_I + peakWinSize >= INIT_MAX_I_FOR_BANDWIDTH)
+        if rerun.any():
             # If true, then rerun on the full set of data
-            [min_peaks, min_peaks_I] = utils.separated_peaks(
-                fft_data, peakWinSize, use_max=False, value_cutoff=np.inf)
+            is_min_peak = utils.separated_peaks_2D(
+                fft_data[rerun], peakWinSize,
+                use_max=False, value_cutoff=np.inf)
+            peak_start_I[rerun], peak_end_I[rerun] = \
+                self.h__getBoundingPeaks(is_min_peak, max_peak_I[rerun])
 
-            del(min_peaks)  # This part of max_peaks_dist's return is unused
+        return peak_start_I, peak_end_I
 
-            peak_start_I = min_peaks_I[utils.find(min_peaks_I < max_peak_I, 1)]
-            peak_end_I = min_peaks_I[utils.find(min_peaks_I > max_peak_I, 1)]
+    def h__getBoundingPeaks(self, is_min_peak, max_peak_I):
+        """
+        For each row, get the first minimum and the first minimum after the
+        maximum peak, -1 if there is none.
 
-        assert peak_start_I.size <= 1
-        assert peak_end_I.size <= 1
-        
-        #return an array it is problematic, and can give rise to deprecation errors. Let's return a tuple instead.
-        peak_start_Int = int(peak_start_I[0]) if peak_start_I.size == 1 else np.nan
-        peak_end_Int = int(peak_end_I[0]) if peak_end_I.size == 1 else np.nan
+        Called by: h__getBandwidth
+
+        """
+        # TODO: The start should be the last minimum before the maximum,
+        # but this mimics the old code
+        has_peak = is_min_peak.any(axis=1)
+        first_I = np.argmax(is_min_peak, axis=1)
+        peak_start_I = np.where(has_peak & (first_I < max_peak_I), first_I, -1)
+
+        is_after = is_min_peak & \
+            (np.arange(is_min_peak.shape[1]) > max_peak_I[:, np.newaxis])
+        peak_end_I = np.where(is_after.any(axis=1),
+                              np.argmax(is_after, axis=1), -1)
 
-        # TODO: Why is this not a tuple - tuple would be more consistent
-        return (peak_start_Int, peak_end_Int)
+        return peak_start_I, peak_end_I
 
 class LocomotionBend(object):
     """
@@ -484,349 +569,6 @@ class LocomotionCrawlingBends(BendHelper):
 #%%
 
 
-class LocomotionForagingBends(object):
-
-    """
-    Locomotion Foraging Bends Feature.
-
-    Attributes
-    ----------
-    amplitude
-    angleSpeed
-
-
-    Methods
-    ---------------------------------------
-    __init__
-    h__computeNoseBends
-    h__computeAvgAngles
-    h__interpData
-    h__getNoseInterpolationIndices
-    h__foragingData
-    h__getAmps
-
-    Notes
-    ---------------------------------------
-    Formerly +segworm/+features/@locomotion/getForaging
-
-    Originally, part of wormBends.m
-
-    """
-
-    def __init__(self, features_ref, is_segmented_mask, ventral_mode):
-        """
-        Initialize an instance of LocomotionForagingBends
-
-        Parameters
-        ----------
-        nw: NormalizedWorm instance
-        is_segmented_mask: boolean numpy array [1 x n_frames]
-        ventral_mode: int
-            0, 1, or 2 depending on the orientation of the worm.
-
-        """
-
-        options = features_ref.options.locomotion.foraging_bends
-
-        if not features_ref.options.should_compute_feature(
-                'locomotion.foraging_bends', features_ref):
-            self.amplitude = None
-            self.angle_speed = None
-            return
-
-        timer = features_ref.timer
-        timer.tic()
-
-        # self.amplitude  = None  # DEBUG
-        # self.angleSpeed = None # DEBUG
-
-        fps = features_ref.video_info.fps
-
-        nose_x, nose_y = \
-            features_ref.nw.get_partition('head_tip',
-                                          data_key='skeleton',
-                                          split_spatial_dimensions=True)
-
-        neck_x, neck_y = \
-            features_ref.nw.get_partition('head_base',
-                                          data_key='skeleton',
-                                          split_spatial_dimensions=True)
-
-        # TODO: Add "reversed" and "interpolated" options to the get_partition
-        # function, to replace the below blocks of code!
-        #----------------------------------------------------------------------
-
-        # We need to flip the orientation (i.e. reverse the entries along the
-        # first, or skeleton index, axis) for angles and consistency with old
-        # code:
-        nose_x = nose_x[::-1, :]
-        nose_y = nose_y[::-1, :]
-        neck_x = neck_x[::-1, :]
-        neck_y = neck_y[::-1, :]
-
-        # Step 1: Interpolation of skeleton indices
-        #---------------------------------------
-        # TODO: ensure that we are excluding the points at the beginning
-        # and ending of the second dimension (the frames list) of nose_x, etc.
-        # from being interpolated.  (this was a step in
-        # h__getNoseInterpolationIndices, that we no longer have since I've
-        # put the interpolation code into
-        # utils.interpolate_with_threshold_2D instead.  But we
-        # might be okay, since the beginning and end are going to be left alone
-        # since I've set left=np.NaN and right=np.NaN in the underlying
-        # utils.interpolate_with_threshold code.
-        interp = utils.interpolate_with_threshold_2D
-
-        max_samples_interp = options.max_samples_interp_nose(fps)
-
-        nose_xi = interp(nose_x, threshold=max_samples_interp)
-        nose_yi = interp(nose_y, threshold=max_samples_interp)
-        neck_xi = interp(neck_x, threshold=max_samples_interp)
-        neck_yi = interp(neck_y, threshold=max_samples_interp)
-        #----------------------------------------------------------------------
-
-        # Step 2: Calculation of the bend angles
-        #---------------------------------------
-        nose_bends = self.h__computeNoseBends(
-            nose_xi, nose_yi, neck_xi, neck_yi)
-
-        # Step 3:
-        #---------------------------------------
-        [nose_amps, nose_freqs] = \
-            self.h__foragingData(fps, nose_bends,
-                                 options.min_nose_window_samples(fps))
-
-        if ventral_mode > 1:
-            nose_amps = -nose_amps
-            nose_freqs = -nose_freqs
-
-        self.amplitude = nose_amps
-        self.angle_speed = nose_freqs
-
-        timer.toc('locomotion.foraging_bends')
-
-    def h__computeNoseBends(self, nose_x, nose_y, neck_x, neck_y):
-        """
-        Compute the difference in angles between the nose and neck (really the
-        head tip and head base).
-
-        Parameters
-        ----------
-        nose_x: [4 x n_frames]
-        nose_y: [4 x n_frames]
-        neck_x: [4 x n_frames]
-        neck_y: [4 x n_frames]
-
-        Returns
-        -------
-        nose_bends_d
-
-        Notes
-        ---------------------------------------
-        Formerly nose_bends_d = h__computeNoseBends(nose_x,nose_y,neck_x,neck_y)
-
-        """
-
-        nose_angles = self.h__computeAvgAngles(nose_x, nose_y)
-        neck_angles = self.h__computeAvgAngles(neck_x, neck_y)
-
-        # TODO: These three should be a method, calculating the difference
-        # in angles and ensuring all results are within +/- 180
-        nose_bends_d = (nose_angles - neck_angles) * (180 / np.pi)
-
-        # Suppress warnings so we can compare a numpy array that may contain NaNs
-        # without triggering a Runtime Warning
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            nose_bends_d[nose_bends_d > 180] -= 360
-            nose_bends_d[nose_bends_d < -180] += 360
-
-        return nose_bends_d
-
-    def h__computeAvgAngles(self, x, y):
-        """
-        Take average difference between successive x and y skeleton points,
-        then compute the arc tangent from those averages.
-
-        Parameters
-        ---------------------------------------
-        x : m x n float numpy array
-          m is the number of skeleton points
-          n is the number of frames
-        y : m x n float numpy array
-          (Same as x)
-
-        Returns
-        ---------------------------------------
-        1-d float numpy array of length n
-          The angles
-
-        Notes
-        ---------------------------------------
-        Simple helper for h__computeNoseBends
-
-        """
-        # Suppress RuntimeWarning: Mean of empty slice
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore', category=RuntimeWarning)
-            avg_diff_x = np.nanmean(np.diff(x, n=1, axis=0), axis=0)
-            avg_diff_y = np.nanmean(np.diff(y, n=1, axis=0), axis=0)
-
-        angles = np.arctan2(avg_diff_y, avg_diff_x)
-
-        return angles
-
-    def h__foragingData(self, fps, nose_bend_angle_d, min_win_size):
-        """
-        Compute the foraging amplitude and angular speed.
-
-        Parameters
-        ----------
-        fps :
-        nose_bend_angle_d : [n_frames x 1]
-        min_win_size : (scalar)
-
-        Returns
-        ---------------------------------------
-        amplitudes : [1 x n_frames]
-        speeds : [1 x n_frames]
-
-        Notes
-        ---------------------------------------
-        Formerly [amps,speeds] = h__foragingData(nose_bend_angle_d,
-                                                 min_win_size, fps)
-
-        """
-        if min_win_size > 0:
-            # Clean up the signal with a gaussian filter.
-            gauss_filter = utils.gausswin(2 * min_win_size + 1) / min_win_size
-            nose_bend_angle_d = filters.convolve1d(nose_bend_angle_d,
-                                                   gauss_filter,
-                                                   cval=0,
-                                                   mode='constant')
-
-            # Remove partial data frames ...
-            nose_bend_angle_d[:min_win_size] = np.NaN
-            nose_bend_angle_d[-min_win_size:] = np.NaN
-
-        # Calculate amplitudes
-        amplitudes = self.h__getAmplitudes(nose_bend_angle_d)
-        assert(np.shape(nose_bend_angle_d) == np.shape(amplitudes))
-
-        # Calculate angular speed
-        # Compute the speed centered between the back and front foraging movements.
-        #
-        # TODO: fix the below comments to conform to 0-based indexing
-        # I believe I've fixed the code already.  - @MichaelCurrie
-        #  1     2    3
-        # d1    d2     d1 = 2 - 1,   d2 = 3 - 2
-        #     x        assign to x, avg of d1 and d2
-
-        #???? - why multiply and not divide by fps????
-
-        d_data = np.diff(nose_bend_angle_d) * fps
-        speeds = np.empty(amplitudes.size) * np.NaN
-        # This will leave the first and last frame's speed as NaN:
-        speeds[1:-1] = (d_data[:-1] + d_data[1:]) / 2
-
-        # Propagate NaN for speeds to amplitudes
-        amplitudes[np.isnan(speeds)] = np.NaN
-
-        return amplitudes, speeds
-
-    def h__getAmplitudes(self, nose_bend_angle_d):
-        """
-        In between all sign changes, get the maximum or minimum value and
-        apply to all indices that have the same sign within the stretch
-
-        Parameters
-        ---------------------------------------
-        nose_bend_angle_d : 1-d numpy array of length n_frames
-
-        Returns
-        ---------------------------------------
-        1-d numpy array of length n_frames
-
-        Notes
-        ---------------------------------------
-        Formerly amps = h__getAmps(nose_bend_angle_d):
-
-        NOTE: This code is very similar to wormKinks
-
-        Example
-        ---------------------------------------
-        >>> h__getAmps(np.array[1, 2, 3, 2, 1, -1, -2, -1, 1, 2, 2, 5])
-                          array[3, 3, 3, 3, 3, -2, -2, -2, 5, 5, 5, 5]
-        (indentation is used here to line up the returned array for clarity)
-
-        """
-        n_frames = len(nose_bend_angle_d)
-
-        # Suppress warnings related to finding the sign of a numpy array that
-        # may contain NaN values.
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            data_sign = np.sign(nose_bend_angle_d)
-        sign_change_I = np.flatnonzero(data_sign[1:] != data_sign[:-1])
-
-        start_I = np.concatenate([[0], sign_change_I + 1])
-        stop_I = np.concatenate([sign_change_I, [n_frames - 1]])
-
-        # All NaN values are considered sign changes,
-        # but we don't want them considered that way.
-        # So create a mask of items to be removed:
-        mask = np.isnan(nose_bend_angle_d[start_I])
-        # Keep only those items NOT in the mask:
-        start_I = start_I[np.flatnonzero(~mask)]
-        stop_I = stop_I[np.flatnonzero(~mask)]
-
-        # Python's array index notation requires that we specify one PAST the
-        # index of the last entry in the "run"
-        end_I = stop_I + 1
-
-        amps = np.empty(n_frames) * np.NaN
-        # For each chunk, get max or min, depending on whether the data is positive
-        # or negative ...
-        for i_chunk in range(len(start_I)):
-            cur_start = start_I[i_chunk]
-            cur_end = end_I[i_chunk]
-
-            if nose_bend_angle_d[cur_start] > 0:
-                amps[cur_start:cur_end] = max(
-                    nose_bend_angle_d[cur_start:cur_end])
-            else:
-                amps[cur_start:cur_end] = min(
-                    nose_bend_angle_d[cur_start:cur_end])
-
-        return amps
-
-    @classmethod
-    def from_disk(cls, foraging_ref):
-
-        self = cls.__new__(cls)
-
-        self.amplitude = utils._extract_time_from_disk(
-            foraging_ref, 'amplitude')
-        self.angle_speed = utils._extract_time_from_disk(
-            foraging_ref, 'angleSpeed')
-
-        return self
-
-    def __repr__(self):
-        return utils.print_object(self)
-
-    def __eq__(self, other):
-        return utils.correlation(
-            self.amplitude,
-            other.amplitude,
-            'locomotion.foraging.amplitude') and utils.correlation(
-            self.angle_speed,
-            other.angle_speed,
-            'locomotion.foraging.angle_speed')
-
-#%%
-
-
 #==============================================================================
 #                       New Feature Organization
 #==============================================================================
@@ -866,10 +608,8 @@ class ForagingBends(Feature):
     __init__
     h__computeNoseBends
     h__computeAvgAngles
-    h__interpData
-    h__getNoseInterpolationIndices
     h__foragingData
-    h__getAmps
+    h__getAmplitudes
 
     Notes
     ---------------------------------------
@@ -881,19 +621,15 @@ class ForagingBends(Feature):
 
     def __init__(self, wf, feature_name):
         """
-        Initialize an instance of LocomotionForagingBends
+        Initialize an instance of ForagingBends
 
         Parameters
         ----------
-        nw: NormalizedWorm instance
-        is_segmented_mask: boolean numpy array [1 x n_frames]
-        ventral_mode: int
-            0, 1, or 2 depending on the orientation of the worm.
+        wf: WormFeatures instance
+        feature_name: str
 
         """
 
-        #features_ref, is_segmented_mask, ventral_mode
-
         self.name = feature_name
 
         options = wf.options.locomotion.foraging_bends
@@ -944,14 +680,16 @@ class ForagingBends(Feature):
         # might be okay, since the beginning and end are going to be left alone
         # since I've set left=np.NaN and right=np.NaN in the underlying
         # utils.interpolate_with_threshold code.
-        interp = utils.interpolate_with_threshold_2D
-
         max_samples_interp = options.max_samples_interp_nose(fps)
 
-        nose_xi = interp(nose_x, threshold=max_samples_interp)
-        nose_yi = interp(nose_y, threshold=max_samples_interp)
-        neck_xi = interp(neck_x, threshold=max_samples_interp)
-        neck_yi = interp(neck_y, threshold=max_samples_interp)
+        n_nose_points = nose_x.shape[0]
+        n_neck_points = neck_x.shape[0]
+        all_points = utils.interpolate_with_threshold_2D(
+            np.vstack((nose_x, nose_y, neck_x, neck_y)),
+            threshold=max_samples_interp)
+        nose_xi, nose_yi, neck_xi, neck_yi = np.split(
+            all_points,
+            np.cumsum([n_nose_points, n_nose_points, n_neck_points]))
         #----------------------------------------------------------------------
 
         # Step 2: Calculation of the bend angles
@@ -1137,33 +875,22 @@ class ForagingBends(Feature):
         sign_change_I = np.flatnonzero(data_sign[1:] != data_sign[:-1])
 
         start_I = np.concatenate([[0], sign_change_I + 1])
-        stop_I = np.concatenate([sign_change_I, [n_frames - 1]])
-
-        # All NaN values are considered sign changes,
-        # but we don't want them considered that way.
-        # So create a mask of items to be removed:
-        mask = np.isnan(nose_bend_angle_d[start_I])
-        # Keep only those items NOT in the mask:
-        start_I = start_I[np.flatnonzero(~mask)]
-        stop_I = stop_I[np.flatnonzero(~mask)]
+        run_lengths = np.diff(np.concatenate([start_I, [n_frames]]))
 
-        # Python's array index notation requires that we specify one PAST the
-        # index of the last entry in the "run"
-        end_I = stop_I + 1
+        # For each chunk, get max or min, depending on whether the data is
+        # positive or negative ...
+        #
+        # All NaN values are considered sign changes, so each NaN is a chunk
+        # of its own and its max and min are NaN, leaving it as NaN in the
+        # output.
+        chunk_max = np.maximum.reduceat(nose_bend_angle_d, start_I)
+        chunk_min = np.minimum.reduceat(nose_bend_angle_d, start_I)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            chunk_amps = np.where(nose_bend_angle_d[start_I] > 0,
+                                  chunk_max, chunk_min)
 
-        amps = np.empty(n_frames) * np.NaN
-        # For each chunk, get max or min, depending on whether the data is positive
-        # or negative ...
-        for i_chunk in range(len(start_I)):
-            cur_start = start_I[i_chunk]
-            cur_end = end_I[i_chunk]
-
-            if nose_bend_angle_d[cur_start] > 0:
-                amps[cur_start:cur_end] = max(
-                    nose_bend_angle_d[cur_start:cur_end])
-            else:
-                amps[cur_start:cur_end] = min(
-                    nose_bend_angle_d[cur_start:cur_end])
+        amps = np.repeat(chunk_amps, run_lengths)
 
         return amps
 
@@ -1551,136 +1278,125 @@ class CrawlingBendsBoundInfo(object):
 
         BAD_INDEX_VALUE = -1
 
-        # For each element in the array, these values indicate which
-        # sign change index to use ...
-        left_sign_change_I = np.zeros(n_frames)
-
-        left_sign_change_I[sign_change_I + 1] = 1
-        # We increment at values to the right of the sign changes
-        left_sign_change_I = left_sign_change_I.cumsum() - 1
-
-        # NOTE: We need to do this after the cumsum :/
-        left_sign_change_I[:sign_change_I[0]] = BAD_INDEX_VALUE
-        # The previous line is a little Matlab trick in which
-        # something like:
-        # 0  1 0 1 0 0 1 0 0 <= sign change indices
-        # 0  1 2 3 4 5 6 7 8 <= indices
-        # becomes:
-        # -1 0 0 1 1 1 2 2 2 <= -1 is off limits, values are inclusive
-        #
-        # so now at each frame, we get the index of the value that
-        # is to the left.
-        #
-        # From above; sign_change_I = [0 3 6]
-        #
-        # So at index 5, the next sign change is at sign_change_I[left_change_I[5]]
-        # or sign_change_I[1] => 3
-
-        # This does:
-        # 0  1 0 1 0 0 1  0  0 <= sign change indices
-        # 0  1 2 3 4 5 6  7  8 <= indices
-        # 0  0 1 1 2 2 2 -1 -1 <= indices of sign change to right
-        right_sign_change_I = np.zeros(n_frames)
-        right_sign_change_I[sign_change_I[:-1] + 1] = 1
-        right_sign_change_I[0] = 1
-        right_sign_change_I = right_sign_change_I.cumsum() - 1
-        # We must have nothing to the right of the last change:
-        right_sign_change_I[sign_change_I[-1] + 1:] = BAD_INDEX_VALUE
-
         # Indices that each left_sign_change_I or right_sign_change_I points to
         left_values = sign_change_I
         right_values = sign_change_I + 1  # By definition
+
+        # For each frame, the sign change to use on the left is the last one
+        # whose right value is at or before the frame, and the one to use on
+        # the right is the one after that:
+        #
+        # 0  1 0 1 0 0 1  0  0 <= sign change indices
+        # 0  1 2 3 4 5 6  7  8 <= indices
+        # -1 0 0 1 1 1 2  2  2 <= left_sign_change_I, -1 is off limits
+        # 0  0 1 1 2 2 2 -1 -1 <= right_sign_change_I (3 is off limits)
+        frame_I = np.arange(n_frames)
+        left_sign_change_I = np.searchsorted(right_values, frame_I,
+                                             side='right') - 1
+        right_sign_change_I = left_sign_change_I + 1
         #----------------------------------------------------------------
 
         back_zeros_I = np.zeros(n_frames)
         back_zeros_I[:] = BAD_INDEX_VALUE
         front_zeros_I = np.zeros(n_frames)
-        back_zeros_I[:] = BAD_INDEX_VALUE
 
-        for iFrame in range(n_frames):
-            cur_left_index = left_sign_change_I[iFrame]
-            cur_right_index = right_sign_change_I[iFrame]
+        is_bounded = (left_sign_change_I != BAD_INDEX_VALUE) & \
+            (right_sign_change_I < n_sign_changes)
 
-            if cur_left_index == BAD_INDEX_VALUE or cur_right_index == BAD_INDEX_VALUE:
-                continue
+        cur_I = np.flatnonzero(is_bounded)
+        cur_left_index = left_sign_change_I[cur_I]
+        cur_right_index = right_sign_change_I[cur_I]
+        back_zero_I = left_values[cur_left_index]
+        front_zero_I = right_values[cur_right_index]
 
-            # Convert from float to int
-            cur_left_index = int(cur_left_index)
-            cur_right_index = int(cur_right_index)
-
-            back_zero_I = left_values[cur_left_index]
-            front_zero_I = right_values[cur_right_index]
-
-            use_values = True
-
-            # Expand the zero-crossing window.
-            #----------------------------------
-            # Note from @JimHokanson:
-            #
-            # TODO: Fix and move this code to old config
-            #
-            # General problem, we specify a minimum acceptable window size,
-            # and the old code needlessly expands the window past this point
-            # by doing the following comparison:
-            #
-            # - distance from right to left > min_window_size?
-            #
-            #   The following code centers on 2x the larger of the following gaps:
-            #
-            #   - distance from left to center
-            #   - distance from right to center
-            #
-            #   So we should check if either of these is half ot the
-            #   required width.
-            #
-            # half-window sizes:
-            # left_window_size  = iFrame - back_zero_I
-            # right_window_size = front_zero_I - iFrame
-            #
-            # so in reality we should use:
-            #
-            # front_zero_I - iFrame < min_number_frames_for_bend/2 and
-            # iFrame - back_zero_I < min_number_frames_for_bend/2
-            #
-            # By not doing this, we overshoot the minimum window size that
-            # we need to use. Consider window sizes that are in terms of
-            # the minimum window size.
-            #
-            # i.e. 0.5w means the left or right window is half min_number_frames_for_bend
-            #
-            # Consider we have:
-            # 0.5w left
-            # 0.3w right
-            #
-            #   total 0.8w => not at 1w, thus old code should expand
-            #
-            #   But in reality, if we stopped now we would be at twice 0.5w
-
-            while (
-                    front_zero_I -
-                    back_zero_I +
-                    1) < min_number_frames_for_bend:
-                # Expand the smaller of the two windows
-                # -------------------------------------
-                #  left_window_size       right_window_size
-                if (iFrame - back_zero_I) < (front_zero_I - iFrame):
-                    # Expand to the left:
-                    cur_left_index = cur_left_index - 1
-                    if cur_left_index == BAD_INDEX_VALUE:
-                        use_values = False
-                        break
-                    back_zero_I = left_values[cur_left_index]
-                else:
-                    # Expand to the right:
-                    cur_right_index = cur_right_index + 1
-                    if cur_right_index >= n_sign_changes:
-                        use_values = False
-                        break
-                    front_zero_I = right_values[cur_right_index]
-
-            if use_values:
-                back_zeros_I[iFrame] = back_zero_I
-                front_zeros_I[iFrame] = front_zero_I
+        # Expand the zero-crossing window.
+        #----------------------------------
+        # Note from @JimHokanson:
+        #
+        # TODO: Fix and move this code to old config
+        #
+        # General problem, we specify a minimum acceptable window size,
+        # and the old code needlessly expands the window past this point
+        # by doing the following comparison:
+        #
+        # - distance from right to left > min_window_size?
+        #
+        #   The following code centers on 2x the larger of the following gaps:
+        #
+        #   - distance from left to center
+        #   - distance from right to center
+        #
+        #   So we should check if either of these is half ot the
+        #   required width.
+        #
+        # half-window sizes:
+        # left_window_size  = iFrame - back_zero_I
+        # right_window_size = front_zero_I - iFrame
+        #
+        # so in reality we should use:
+        #
+        # front_zero_I - iFrame < min_number_frames_for_bend/2 and
+        # iFrame - back_zero_I < min_number_frames_for_bend/2
+        #
+        # By not doing this, we overshoot the minimum window size that
+        # we need to use. Consider window sizes that are in terms of
+        # the minimum window size.
+        #
+        # i.e. 0.5w means the left or right window is half min_number_frames_for_bend
+        #
+        # Consider we have:
+        # 0.5w left
+        # 0.3w right
+        #
+        #   total 0.8w => not at 1w, thus old code should expand
+        #
+        #   But in reality, if we stopped now we would be at twice 0.5w
+        #
+        # All frames whose window is still too small are expanded by one
+        # sign change per pass, so the number of passes is bounded by the
+        # number of sign changes in the minimum window, not by n_frames.
+        is_done = (front_zero_I - back_zero_I + 1) >= \
+            min_number_frames_for_bend
+        done_I = [cur_I[is_done]]
+        done_back = [back_zero_I[is_done]]
+        done_front = [front_zero_I[is_done]]
+
+        keep = ~is_done
+        while cur_I.size > 0:
+            cur_I = cur_I[keep]
+            cur_left_index = cur_left_index[keep]
+            cur_right_index = cur_right_index[keep]
+            back_zero_I = back_zero_I[keep]
+            front_zero_I = front_zero_I[keep]
+
+            # Expand the smaller of the two windows
+            # -------------------------------------
+            #  left_window_size       right_window_size
+            expand_left = (cur_I - back_zero_I) < (front_zero_I - cur_I)
+            cur_left_index = cur_left_index - expand_left
+            cur_right_index = cur_right_index + ~expand_left
+
+            # Frames that run out of sign changes are left as invalid
+            is_valid = (cur_left_index != BAD_INDEX_VALUE) & \
+                (cur_right_index < n_sign_changes)
+            back_zero_I = np.where(
+                is_valid, left_values[np.maximum(cur_left_index, 0)], 0)
+            front_zero_I = np.where(
+                is_valid,
+                right_values[np.minimum(cur_right_index, n_sign_changes - 1)],
+                0)
+
+            is_done = is_valid & ((front_zero_I - back_zero_I + 1) >=
+                                  min_number_frames_for_bend)
+            done_I.append(cur_I[is_done])
+            done_back.append(back_zero_I[is_done])
+            done_front.append(front_zero_I[is_done])
+
+            keep = is_valid & ~is_done
+
+        done_I = np.concatenate(done_I)
+        back_zeros_I[done_I] = np.concatenate(done_back)
+        front_zeros_I[done_I] = np.concatenate(done_front)
 
         return [back_zeros_I, front_zeros_I]
 
@@ -116,6 +116,92 @@ class AverageBodyAngle(Feature):
         return self
 
 
+class LocomotionVelocity(Feature):
+
+    """
+    Temporary Feature: locomotion.velocity
+
+    This is the parent feature of the velocity sections (head_tip, head,
+    midbody, tail and tail_tip). All sections are computed together so that
+    the work they share (speed indices, partition centroids and angles) is
+    only done once.
+
+    Attributes
+    ----------
+    speed : dict
+        Keys are the segment names, values are numpy arrays of shape (n)
+    direction : dict
+        Keys are the segment names, values are numpy arrays of shape (n)
+
+    See Also
+    --------
+    LocomotionVelocitySection
+    velocity_module.compute_partition_speeds
+
+    """
+
+    segments = ['head_tip', 'head', 'midbody', 'tail', 'tail_tip']
+
+    def __init__(self, wf, feature_name):
+        """
+        Feature Dependencies
+        --------------------
+        - locomotion.velocity.avg_body_angle
+        """
+
+        self.name = feature_name
+
+        # Unpacking
+        #-------------------------
+        nw = wf.nw
+        ventral_mode = nw.video_info.ventral_mode
+        fps = nw.video_info.fps
+
+        # TODO: I'd like this to be inside the class
+        locomotion_options = wf.options.locomotion
+
+        avg_body_angle = self.get_feature(
+            wf, 'locomotion.velocity.avg_body_angle').value
+
+        # Options by segment
+        #--------------------------------------------------
+        partitions = []
+        sample_times = []
+        for segment in self.segments:
+            if segment == 'head_tip' or segment == 'tail_tip':
+                sample_times.append(locomotion_options.velocity_tip_diff)
+            else:
+                sample_times.append(locomotion_options.velocity_body_diff)
+
+            data_key = segment
+            if segment == 'midbody' and wf.options.mimic_old_behaviour:
+                data_key = 'old_midbody_velocity'
+
+            partitions.append(nw.worm_partitions[data_key])
+
+        # The actual computation
+        #----------------------
+        # If we ever move nw features into the self.get_feature approach, this
+        # would be tougher to replicate
+        #i.e. x = self.get_feature(nw,'skeleton_x')
+        # The real work ...
+        speed, direction = velocity_module.compute_partition_speeds(
+            fps, nw.skeleton_x, nw.skeleton_y, partitions, avg_body_angle,
+            sample_times, ventral_mode)[0:2]
+
+        self.speed = dict(zip(self.segments, speed))
+        self.direction = dict(zip(self.segments, direction))
+
+    @classmethod
+    def from_schafer_file(cls, wf, feature_name):
+        # The sections are loaded individually from the file
+        self = cls.__new__(cls)
+        self.name = feature_name
+        self.value = None
+        self.missing_from_disk = True
+        return self
+
+
 class LocomotionVelocitySection(Feature):
 
     """
@@ -125,7 +211,7 @@ class LocomotionVelocitySection(Feature):
     locomotion.velocity.head_tip,
     locomotion.velocity.head, etc.
 
-    This is the parent feature which computes and then temporarily holds
+    This is the parent feature which temporarily holds
     attributes for more specific child features.
 
     Attributes
@@ -150,54 +236,22 @@ class LocomotionVelocitySection(Feature):
 
         Feature Dependencies
         --------------------
-        - locomotion.velocity.avg_body_angle
+        - locomotion.velocity
 
         See Also
         --------
-        - velocity_module.compute_speed      #  This is the function that
-                                             #  does all the work
+        - LocomotionVelocity      #  This is the feature that
+                                  #  does all the work
 
         """
 
         self.name = feature_name
 
-        # Unpacking
-        #-------------------------
-        nw = wf.nw
-        ventral_mode = nw.video_info.ventral_mode
-        fps = nw.video_info.fps
-
-        # TODO: I'd like this to be inside the class
-        locomotion_options = wf.options.locomotion
-
-        avg_body_angle = self.get_feature(
-            wf, 'locomotion.velocity.avg_body_angle').value
-
-        # Options by segment
-        #--------------------------------------------------
-        if segment == 'head_tip' or segment == 'tail_tip':
-            sample_time = locomotion_options.velocity_tip_diff
-        else:
-            sample_time = locomotion_options.velocity_body_diff
-
-        data_key = segment
-        if segment == 'midbody' and wf.options.mimic_old_behaviour:
-            data_key = 'old_midbody_velocity'
-
-        # The actual computation
-        #----------------------
-        # If we ever move nw features into the self.get_feature approach, this
-        # would be tougher to replicate
-        #i.e. x = self.get_feature(nw,'skeleton_x')
-        x, y = nw.get_partition(data_key, 'skeleton', True)
-        # The real work ...
-        speed, direction = velocity_module.compute_speed(fps, x, y,
-                                                         avg_body_angle,
-                                                         sample_time,
-                                                         ventral_mode)[0:2]
+        parent_feature_name = get_parent_feature_name(feature_name)
+        velocity = self.get_feature(wf, parent_feature_name)
 
-        self.speed = speed
-        self.direction = direction
+        self.speed = velocity.speed[segment]
+        self.direction = velocity.direction[segment]
 
     @classmethod
     def from_schafer_file(cls, wf, feature_name, segment):
@@ -301,16 +355,43 @@ class MidbodyVelocityDistance(Feature):
         return self
 
 
-class MotionEvent(Feature):
+class MotionEvents(Feature):
 
     """
-    Implements:
-    locomotion.motion_events.forward
-    locomotion.motion_events.backward
-    locomotion.motion_events.paused
+    Temporary Feature: locomotion.motion_events
+
+    This is the parent feature of the forward, backward and paused motion
+    events and of the motion mode. All motion states are classified in a
+    single pass:
+    - the speed and distance thresholds are computed once from the
+      (interpolated) skeleton lengths
+    - every frame is labelled with the motion state whose speed criteria it
+      meets, and the candidate events of all states come from one
+      run-length encoding of these labels
+    - each state's candidates are then merged across short gaps and
+      filtered by duration and distance (see events.EventFinder)
+
+    Attributes
+    ----------
+    events : dict
+        Keys are the motion types, values are
+        events.EventListWithFeatures
+    mode : numpy.array
+        See MotionMode
+
+    See Also
+    --------
+    MotionEvent
+    MotionMode
+    events.get_state_start_stop_indices
+
     """
 
-    def __init__(self, wf, feature_name, motion_type):
+    motion_types = ['forward', 'backward', 'paused']
+
+    frame_values = {'forward': 1, 'backward': -1, 'paused': 0}
+
+    def __init__(self, wf, feature_name):
 
         self.name = feature_name
 
@@ -347,7 +428,7 @@ class MotionEvent(Feature):
             locomotion_options.motion_codes_distance_threshold_pct
         worm_pause_threshold = skeleton_lengths * \
             locomotion_options.motion_codes_pause_threshold_pct
-        
+
         #   Event Constraints -------
         # The minimum number of frames an event had to be taking place for
         # to be considered a legitimate event
@@ -358,43 +439,104 @@ class MotionEvent(Feature):
         max_interframes_threshold = \
             fps * locomotion_options.motion_codes_max_interframes_threshold
 
-        if motion_type == 'forward':
-            min_speed_threshold = worm_speed_threshold
-            max_speed_threshold = None
-            min_distance_threshold = worm_distance_threshold
-        elif motion_type == 'backward':
-            min_speed_threshold = None
-            max_speed_threshold = -worm_speed_threshold
-            min_distance_threshold = worm_distance_threshold
-        else:  # paused
-            min_speed_threshold = -worm_pause_threshold
-            max_speed_threshold = worm_pause_threshold
-            min_distance_threshold = None
-
-        # We will use EventFinder to determine when the
+        # We will use an EventFinder per motion type to determine when the
         # event type "motion_type" occurred
-        ef = events.EventFinder()
+        event_finders = []
+        for motion_type in self.motion_types:
+            if motion_type == 'forward':
+                min_speed_threshold = worm_speed_threshold
+                max_speed_threshold = None
+                min_distance_threshold = worm_distance_threshold
+            elif motion_type == 'backward':
+                min_speed_threshold = None
+                max_speed_threshold = -worm_speed_threshold
+                min_distance_threshold = worm_distance_threshold
+            else:  # paused
+                min_speed_threshold = -worm_pause_threshold
+                max_speed_threshold = worm_pause_threshold
+                min_distance_threshold = None
+
+            ef = events.EventFinder()
+
+            # "Space and time" constraints
+            ef.min_distance_threshold = min_distance_threshold
+            ef.max_distance_threshold = None  # we are not constraining max dist
+            ef.min_speed_threshold = min_speed_threshold
+            ef.max_speed_threshold = max_speed_threshold
+
+            # "Time" constraints
+            ef.min_frames_threshold = min_frames_threshold
+            ef.max_inter_frames_threshold = max_interframes_threshold
+
+            event_finders.append(ef)
+
+        # Label each frame with its motion state and get the candidate events
+        # of all motion states at once
+        speed_masks = [ef.get_speed_threshold_mask(midbody_speed)
+                       for ef in event_finders]
+
+        if np.all(np.sum(speed_masks, axis=0) <= 1):
+            all_event_candidates = events.get_state_start_stop_indices(
+                midbody_speed, speed_masks)
+        else:
+            # This only happens if the options make the motion states
+            # overlap (i.e. pausing at speeds at which the worm is also
+            # moving forward or backward), in which case the states can't be
+            # described by a single label per frame
+            all_event_candidates = [
+                ef.get_start_stop_indices(midbody_speed, speed_mask)
+                for ef, speed_mask in zip(event_finders, speed_masks)]
 
-        # "Space and time" constraints
-        ef.min_distance_threshold = min_distance_threshold
-        ef.max_distance_threshold = None  # we are not constraining max dist
-        ef.min_speed_threshold = min_speed_threshold
-        ef.max_speed_threshold = max_speed_threshold
+        self.events = {}
+        self.mode = np.full(num_frames, np.nan)
+        for motion_type, ef, event_candidates in \
+                zip(self.motion_types, event_finders, all_event_candidates):
 
-        # "Time" constraints
-        ef.min_frames_threshold = min_frames_threshold
-        ef.max_inter_frames_threshold = max_interframes_threshold
+            event_list = ef.get_events_from_candidates(event_candidates,
+                                                       distance_per_frame)
 
-        event_list = ef.get_events(midbody_speed, distance_per_frame)
+            # Take the start and stop indices and convert them to the
+            # structure used in the feature files
+            m_event = events.EventListWithFeatures(
+                fps, event_list, distance_per_frame,
+                compute_distance_during_event=True)
 
-        # Take the start and stop indices and convert them to the structure
-        # used in the feature files
-        m_event = events.EventListWithFeatures(
-            fps, event_list, distance_per_frame, compute_distance_during_event=True)
+            # This is temporary until a bug is fixed, at which point in time
+            # it will likeely need to move into the method directly above
+            m_event.num_video_frames = num_frames
 
-        # This is temporary until a bug is fixed, at which point in time
-        # it will likeely need to move into the method directly above
-        m_event.num_video_frames = num_frames
+            self.events[motion_type] = m_event
+
+            event_mask = m_event.get_event_mask()
+            self.mode[event_mask] = self.frame_values[motion_type]
+
+    @classmethod
+    def from_schafer_file(cls, wf, feature_name):
+        # The events and the mode are loaded individually from the file
+        self = cls.__new__(cls)
+        self.name = feature_name
+        self.value = None
+        self.missing_from_disk = True
+        return self
+
+
+class MotionEvent(Feature):
+
+    """
+    Implements:
+    locomotion.motion_events.forward
+    locomotion.motion_events.backward
+    locomotion.motion_events.paused
+
+    These are computed via MotionEvents
+    """
+
+    def __init__(self, wf, feature_name, motion_type):
+
+        self.name = feature_name
+
+        parent_feature_name = get_parent_feature_name(feature_name)
+        m_event = self.get_feature(wf, parent_feature_name).events[motion_type]
 
         self.value = m_event
 
@@ -434,29 +576,15 @@ class MotionMode(Feature):
     forward: 1
     backward: -1
     paused: 0
-    """
 
-    frame_values = {'forward': 1, 'backward': -1, 'paused': 0}
+    This is computed via MotionEvents
+    """
 
     def __init__(self, wf, feature_name):
 
         self.name = feature_name
 
-        # Hack to get num_frames
-        skeleton_lengths = self.get_feature(wf, 'morphology.length').value
-
-        # TODO: Get this from video_info
-        num_frames = len(skeleton_lengths)
-
-        # TODO: Can't we initialize NaN directly?
-        self.value = np.empty(num_frames, dtype='float') * np.NaN
-
-        for key, value in self.frame_values.items():
-            motion_type = 'locomotion.motion_events.' + key
-            event_feature = self.get_feature(wf, motion_type).value
-
-            event_mask = event_feature.get_event_mask()
-            self.value[event_mask] = value
+        self.value = self.get_feature(wf, 'locomotion.motion_events').mode
 
     @classmethod
     def from_schafer_file(cls, wf, feature_name):
@@ -48,7 +48,6 @@ import numpy as np
 import collections
 import warnings
 import operator
-import re
 
 from .generic_features import Feature
 
@@ -718,20 +717,22 @@ class OmegaTurns(object):
 
         is_good_th_direction_value = ~np.isnan(th_angle)
 
-        lastAngle = th_angle[0]
-        gapCounter = 0
+        # For each frame, the last good frame before it (or the first frame
+        # if there is none)
+        frame_I = np.arange(n_frames)
+        last_good_I = np.maximum.accumulate(
+            np.where(is_good_th_direction_value, frame_I, 0))
+        previous_I = np.concatenate(([0], last_good_I[:-1]))
 
-        th_angle_diff_temp = np.empty(th_angle.size) * np.NAN
-        for iFrame in range(n_frames)[1:]:   # formerly 2:n_frames
-            if is_good_th_direction_value[iFrame]:
-                th_angle_diff_temp[iFrame] = th_angle[iFrame] - lastAngle
-                gapCounter = 0
-                lastAngle = th_angle[iFrame]
-            else:
-                gapCounter += 1
+        # The difference is only taken at good frames, and only if the number
+        # of bad frames since the previous good frame isn't too large
+        use_diff = is_good_th_direction_value & \
+            (frame_I - previous_I - 1 <= MAX_FRAME_JUMP_FOR_ANGLE_DIFF)
+        use_diff[0] = False
 
-            if gapCounter > MAX_FRAME_JUMP_FOR_ANGLE_DIFF:
-                lastAngle = np.NaN
+        th_angle_diff_temp = np.full(n_frames, np.nan)
+        th_angle_diff_temp[use_diff] = th_angle[use_diff] - \
+            th_angle[previous_I[use_diff]]
 
         #???? - what does this really mean ??????
         # I think this basically says, instead of looking for gaps in the original
@@ -746,8 +747,8 @@ class OmegaTurns(object):
         with warnings.catch_warnings():
             warnings.simplefilter('ignore')
 
-            positiveJumps = np.flatnonzero(th_angle_diff_temp > 180)
-            negativeJumps = np.flatnonzero(th_angle_diff_temp < -180)
+            is_positive_jump = th_angle_diff_temp > 180
+            is_negative_jump = th_angle_diff_temp < -180
 
         # For example data, these are the indices I get ...
         #P - 4625
@@ -757,13 +758,10 @@ class OmegaTurns(object):
         #----------------------------------------------------
         # NOTE: We are using the identified jumps from the fixed angles to unwrap
         # the original angle vector
-        # subtract 2pi from remainging data after positive jumps
-        for j in range(len(positiveJumps)):
-            th_angle[positiveJumps[j]:] = th_angle[positiveJumps[j]:] - 2 * 180
-
+        # subtract 2pi from remainging data after positive jumps and
         # add 2pi to remaining data after negative jumps
-        for j in range(len(negativeJumps)):
-            th_angle[negativeJumps[j]:] = th_angle[negativeJumps[j]:] + 2 * 180
+        n_wraps = np.cumsum(is_negative_jump) - np.cumsum(is_positive_jump)
+        th_angle += n_wraps * (2 * 180)
 
         # Fix the th_angles through interpolation
         #----------------------------------------------------
@@ -810,30 +808,37 @@ class OmegaTurns(object):
                                  MIN_OMEGA_EVENT_LENGTH)
 
         """
-        # Let's take a boolean numpy array and change it to a string where
-        # A is false and B is true: e.g.
-        # [True, True, False] turns into 'BBA'
-        # (Note: this is all a translation of this Matlab line:
+        # Find the runs of omega frames that are long enough
+        #
+        # This is a translation of this Matlab line:
         # [start1, end1] = \
         #   regexp(is_omega_frame_as_string, gap_str, 'start', 'end')
-        is_omega_frame_as_ascii_codes = is_omega_frame.astype(int) + ord('A')
-        is_omega_frame_as_list = [chr(x)
-                                  for x in is_omega_frame_as_ascii_codes]
-        is_omega_frame_as_string = ''.join(is_omega_frame_as_list)
-        gap_re = re.compile(r'B{%d,}' % min_omega_event_length)
-        # Obtain a iterator of the results that match our regex, gap_re.
-        re_result = list(gap_re.finditer(is_omega_frame_as_string))
-        start1 = [m.start(0) for m in re_result]
-        end1 = [m.end(0) for m in re_result]
-
-        signed_omega_frames = np.zeros(is_omega_frame.size)
+        n_frames = len(is_omega_frame)
+        padded_frames = np.concatenate(([0], is_omega_frame != 0, [0]))
+        run_edges = np.flatnonzero(np.diff(padded_frames.astype(int)))
+        start1 = run_edges[0::2]
+        end1 = run_edges[1::2]
+
+        is_long_run = end1 - start1 >= max(min_omega_event_length, 1)
+        start1 = start1[is_long_run]
+        end1 = end1[is_long_run]
 
         # Note: Here we keep the long gaps instead of removing them
-        for iEvent in range(len(start1)):
-            if np.mean(body_angles_i[start1[iEvent]:end1[iEvent]]) > 0:
-                signed_omega_frames[start1[iEvent]:end1[iEvent]] = 1
-            else:
-                signed_omega_frames[start1[iEvent]:end1[iEvent]] = -1
+        if start1.size == 0:
+            return np.zeros(n_frames)
+
+        # Sign each run by its mean body angle. The padding is needed since
+        # a run may end on the last frame.
+        run_edges = np.column_stack((start1, end1)).ravel()
+        run_sums = np.add.reduceat(np.append(body_angles_i, 0),
+                                   run_edges)[0::2]
+        run_signs = np.where(run_sums / (end1 - start1) > 0, 1, -1)
+
+        # Fill the runs with their sign using a difference array
+        run_values = np.zeros(n_frames + 1)
+        run_values[start1] = run_signs
+        run_values[end1] = -run_signs
+        signed_omega_frames = np.cumsum(run_values[:-1])
 
         return signed_omega_frames
 
@@ -871,23 +876,21 @@ def getTurnEventsFromSignedFrames(signed_frames, midbody_distance, FPS):
 
     """
 
-    ef = events.EventFinder()
-    ef.include_at_frames_threshold = True
-
-    # get_events(self, speed_data, distance_data=None):
-
-    # JAH: This interface doesn't make as much sense anymore ...
-
-    # seg_worm.feature.event_finder.getEvents
-    ef.min_speed_threshold = 1
+    # Dorsal frames are positive and ventral frames negative. The two are
+    # mutually exclusive so we can get the runs of both from a single pass
+    # over the frames.
+    #
+    # This is equivalent to EventFinder.get_events() with a
+    # min_speed_threshold of 1 (dorsal) or a max_speed_threshold of -1
+    # (ventral). There are no other thresholds, so every run is an event.
+    with np.errstate(invalid='ignore'):
+        state_masks = [signed_frames >= 1, signed_frames <= -1]
 
-    frames_dorsal = ef.get_events(signed_frames)
+    dorsal_candidates, ventral_candidates = \
+        events.get_state_start_stop_indices(signed_frames, state_masks)
 
-    ef = events.EventFinder()
-    ef.include_at_frames_threshold = True
-    ef.min_speed_threshold = None
-    ef.max_speed_threshold = -1
-    frames_ventral = ef.get_events(signed_frames)
+    frames_dorsal = events.EventList(dorsal_candidates)
+    frames_ventral = events.EventList(ventral_candidates)
 
     # Unify the ventral and dorsal turns.
     [frames_merged, is_ventral] = events.EventList.merge(frames_ventral,
@@ -986,7 +989,10 @@ class TurnProcessor(Feature):
                                          'body_angles',
                                          'tail_angles',
                                          'body_angles_with_long_nans',
-                                         'is_stage_movement'])
+                                         'is_stage_movement',
+                                         'abs_head_angles',
+                                         'abs_tail_angles',
+                                         'is_body_angle_nan'])
 
         first_third = nw.get_subset_partition_mask('first_third')
         second_third = nw.get_subset_partition_mask('second_third')
@@ -1024,6 +1030,12 @@ class TurnProcessor(Feature):
         self.h__interpolateAngles(
             angles, options.max_interpolation_gap_allowed)
 
+        # These don't depend on the turn type, so they are shared by all of
+        # the condition passes below
+        angles.abs_head_angles = np.abs(angles.head_angles)
+        angles.abs_tail_angles = np.abs(angles.tail_angles)
+        angles.is_body_angle_nan = np.isnan(angles.body_angles_with_long_nans)
+
         # Get frames for each turn type
         #----------------------------------------------------------------------
         # This doesn't match was is written in the supplemental material ...
@@ -1214,7 +1226,7 @@ class TurnProcessor(Feature):
 
         with np.errstate(invalid='ignore'):
             s.startCond = fh(a.head_angles, c.head_angle_start_const) & \
-                (np.abs(a.tail_angles) < c.tail_angle_start_const)
+                (a.abs_tail_angles < c.tail_angle_start_const)
 
         # add 1 for shift due to diff
         s.startInds = find_diff(s.startCond, 1) + 1
@@ -1225,7 +1237,7 @@ class TurnProcessor(Feature):
         # the body angle is NaN but the others are not.
         with np.errstate(invalid='ignore'):
             s.midCond   = fh(a.body_angles, c.body_angle_const) | \
-                np.isnan(a.body_angles_with_long_nans)
+                a.is_body_angle_nan
 
         # add 1 for shift due to diff
         s.midStarts = find_diff(s.midCond, 1) + 1
@@ -1233,7 +1245,7 @@ class TurnProcessor(Feature):
 
         with np.errstate(invalid='ignore'):
             s.endCond = np.logical_and(fh(a.tail_angles, c.tail_angle_end_const),
-                                       np.abs(a.head_angles) <
+                                       a.abs_head_angles <
                                        c.head_angle_end_const)
 
         s.endInds = find_diff(s.endCond, -1)
@@ -1291,43 +1303,55 @@ class TurnProcessor(Feature):
 
         """
 
-        for cur_mid_start_I in s.midStarts:
-
-            # JAH NOTE: This type of searching is inefficient since the data
-            # are sorted
-            temp = np.flatnonzero(s.midEnds > cur_mid_start_I)
-
-            if temp.size != 0:
-                cur_mid_end_I = s.midEnds[temp[0]]
+        n_frames = len(s.startCond)
 
-                if ~np.all(
-                    a.is_stage_movement[
-                        cur_mid_start_I:cur_mid_end_I +
-                        1]) and s.startCond[
-                    cur_mid_start_I -
-                    1] and s.endCond[
-                    cur_mid_end_I +
-                        1]:
-
-                    temp2 = np.flatnonzero(s.startInds < cur_mid_start_I)
-                    temp3 = np.flatnonzero(s.endInds > cur_mid_end_I)
-
-                    if temp2.size != 0 and temp3.size != 0:
-                        cur_start_I = s.startInds[temp2[-1]]
-                        cur_end_I = s.endInds[temp3[0]]
-
-                        if get_upsilon_flag:
-                            # Don't populate upsilon if the data spans an omega
-                            if ~np.any(
-                                np.abs(
-                                    f.omega_frames[
-                                        cur_start_I:cur_end_I +
-                                        1])):
-                                f.upsilon_frames[
-                                    cur_start_I:cur_end_I + 1] = value_to_assign
-                        else:
-                            f.omega_frames[
-                                cur_start_I:cur_end_I + 1] = value_to_assign
+        # The index arrays are sorted, so for every middle range we can
+        # search for the indices bounding it directly.
+        #
+        # For each middle start, the first middle end after it
+        mid_starts = s.midStarts
+        mid_end_I = np.searchsorted(s.midEnds, mid_starts, side='right')
+        has_mid_end = mid_end_I < len(s.midEnds)
+        mid_starts = mid_starts[has_mid_end]
+        mid_ends = s.midEnds[mid_end_I[has_mid_end]]
+
+        # The middle range can't be all stage movement, and it must be
+        # preceded by a start condition and followed by an end condition
+        n_stage_movement = np.concatenate(
+            ([0], np.cumsum(a.is_stage_movement)))
+        is_all_stage_movement = \
+            (n_stage_movement[mid_ends + 1] - n_stage_movement[mid_starts]) == \
+            (mid_ends - mid_starts + 1)
+        is_valid = ~is_all_stage_movement & \
+            s.startCond[mid_starts - 1] & \
+            s.endCond[mid_ends + 1]
+        mid_starts = mid_starts[is_valid]
+        mid_ends = mid_ends[is_valid]
+
+        # The last start before the middle and the first end after it
+        start_I = np.searchsorted(s.startInds, mid_starts, side='left') - 1
+        end_I = np.searchsorted(s.endInds, mid_ends, side='right')
+        is_bounded = (start_I >= 0) & (end_I < len(s.endInds))
+        cur_start_I = s.startInds[start_I[is_bounded]]
+        cur_end_I = s.endInds[end_I[is_bounded]]
+
+        if get_upsilon_flag:
+            # Don't populate upsilon if the data spans an omega
+            n_omega = np.concatenate(
+                ([0], np.cumsum(f.omega_frames != 0)))
+            spans_omega = (n_omega[cur_end_I + 1] - n_omega[cur_start_I]) > 0
+            cur_start_I = cur_start_I[~spans_omega]
+            cur_end_I = cur_end_I[~spans_omega]
+            frames_to_assign = f.upsilon_frames
+        else:
+            frames_to_assign = f.omega_frames
+
+        # Mark every frame covered by at least one turn with a difference
+        # array, the turns may overlap
+        coverage = np.zeros(n_frames + 1, dtype=int)
+        np.add.at(coverage, cur_start_I, 1)
+        np.add.at(coverage, cur_end_I + 1, -1)
+        frames_to_assign[np.cumsum(coverage[:-1]) > 0] = value_to_assign
 
         # Nothing needs to be returned since we have modified our parameters
         # in place
@@ -197,6 +197,12 @@ class Duration(Feature):
             isnan_mask: bool
               [49, n_frames]
 
+            Returns
+            ----------------------------
+            list
+              [4] For each set of skeleton indices, the (indices, counts) of
+              the visited cells of the arena. Only visited cells are stored,
+              see DurationElement.
 
             """
 
@@ -204,35 +210,36 @@ class Duration(Feature):
             # assignment to the matrix based on their values being treated as
             # indices
 
-            # Filter out frames which have no valid values
+            # Linear index of each point into the arena, with the y-axis
+            # flipped to maintain consistency with Matlab. Invalid points
+            # are given an index of -1.
             #----------------------------------------------------------
-            frames_run = np.flatnonzero(np.any(~isnan_mask, axis=0))
-            n_frames_run = len(frames_run)
+            arena_height, arena_width = arena_size
+            cell_indices = (arena_height - 1 - sys) * arena_width + sxs
+            cell_indices[isnan_mask] = -1
 
             # 1 area for each set of skeleton indices
             #-----------------------------------------
-            n_points = len(s_points)
-            arenas = [None] * n_points
+            arenas = []
 
             # Loop over the different regions of the body
             #------------------------------------------------
-            for iPoint in range(n_points):
-
-                temp_arena = np.zeros(arena_size)
-                s_indices = s_points[iPoint]
+            for s_indices in s_points:
 
-                # For each frame, add +1 to the arena each time a chunk of the skeleton
-                # is located in that part
+                # For each frame, add +1 to the arena each time a chunk of the
+                # skeleton is located in that part. A cell is only counted
+                # once per frame, even if several points fall into it.
                 #--------------------------------------------------------------
-                for iFrame in range(n_frames_run):
-                    cur_frame = frames_run[iFrame]
-                    cur_x = sxs[s_indices[0]:s_indices[1], cur_frame]
-                    cur_y = sys[s_indices[0]:s_indices[1], cur_frame]
-                    
-                    temp_arena[cur_y, cur_x] += 1
+                cur_cells = np.sort(
+                    cell_indices[s_indices[0]:s_indices[1], :], axis=0)
+                is_new_cell = np.ones(cur_cells.shape, dtype=bool)
+                is_new_cell[1:] = cur_cells[1:] != cur_cells[:-1]
+                cur_cells = cur_cells[is_new_cell & (cur_cells >= 0)]
 
-                # Flip y-axis to maintain consistency with Matlab
-                arenas[iPoint] = temp_arena[::-1, :]
+                # Only the visited cells are kept, so memory scales with the
+                # number of visited cells rather than with the arena size
+                indices, counts = np.unique(cur_cells, return_counts=True)
+                arenas.append((indices, counts))
 
             return arenas
         #----------------------------------------------------------------------
@@ -246,9 +253,11 @@ class Duration(Feature):
 
         # For looking at the data
         #------------------------------------
-        # utils.imagesc(temp_arenas[0])
+        # utils.imagesc(self.worm.get_arena_coverage())
 
-        temp_duration = [DurationElement(x, fps) for x in temp_arenas]
+        temp_duration = [DurationElement.from_counts(indices, counts,
+                                                     arena_size, fps)
+                         for indices, counts in temp_arenas]
 
         self.arena = ar
         self.worm = temp_duration[0]
@@ -312,6 +321,7 @@ class DurationElement(object):
             
         self.indices = np.flatnonzero(arena_coverage)
         self.times = arena_coverage.flat[self.indices] / fps
+        self.arena_size = arena_coverage.shape
 
         #arena_coverage_r = np.reshape(arena_coverage, arena_coverage.size, 'F')
         #self.indices = np.nonzero(arena_coverage_r)[0]
@@ -321,6 +331,52 @@ class DurationElement(object):
         #self.indices = np.transpose(np.nonzero(arena_coverage))
         #self.times   = arena_coverage[self.indices[:,0],self.indices[:,1]]/fps
 
+    @classmethod
+    def from_counts(cls, indices, counts, arena_size, fps):
+        """
+        Create from the visited cells of the arena.
+
+        Parameters
+        ----------
+        indices : numpy.array 1-d
+            The (sorted) linear indices of the visited cells of the arena
+        counts : numpy.array 1-d
+            The # of frames spent in each of the visited cells
+        arena_size : (int, int)
+            The (height, width) of the arena
+        fps : float
+
+        """
+        self = cls.__new__(cls)
+        self.indices = indices
+        self.times = counts / fps
+        self.arena_size = arena_size
+
+        return self
+
+    def get_arena_coverage(self, arena_size=None):
+        """
+        Return the dense view of the arena, i.e. the time spent in each cell.
+
+        Parameters
+        ----------
+        arena_size : (int, int) (optional)
+            The (height, width) of the arena. This only needs to be specified
+            if it is not known, i.e. when loaded from disk.
+
+        Returns
+        -------
+        numpy.array 2-d
+
+        """
+        if arena_size is None:
+            arena_size = self.arena_size
+
+        arena_coverage = np.zeros(arena_size)
+        arena_coverage.flat[self.indices] = self.times
+
+        return arena_coverage
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -341,6 +397,7 @@ class DurationElement(object):
         # TODO: Use utils loader
         self.indices = saved_duration_elem['indices'].value[0]
         self.times = saved_duration_elem['times'].value[0]
+        self.arena_size = None
 
         return self
 
@@ -511,38 +568,8 @@ class Curvature(Feature):
             velocity_module.compute_speed(fps, x[BODY_I, :], y[BODY_I, :],
                                           avg_body_angles_d, BODY_DIFF, ventral_mode)
 
-        
-        # Compute the angle differentials and distances.
-        speed = np.abs(speed)
-
-        # At each frame, we'll compute the differences in motion direction using
-        # some frame in the future relative to the current frame
-        #
-        #i.e. diff_motion[current_frame] = motion_direction[current_frame + frame_scale] - motion_direction[current_frame]
-        #------------------------------------------------
-        
-        frame_scale = velocity_module.get_frames_per_sample(fps, BODY_DIFF)
-        
-        half_frame_scale = int(round((frame_scale + 1) / 2))
-        #substract one to deal with python indexes
-        fs_ind = max(1, frame_scale -1) #ensure this values are larger than 1
-        h_fs_ind = max(1, half_frame_scale - 1)
-
-        diff_motion = np.full(speed.shape, np.nan)
-        diff_motion[:-fs_ind] = motion_direction[fs_ind:] - motion_direction[:-fs_ind]
-        s1 = speed[h_fs_ind:-fs_ind]
-        s2 = speed[(h_fs_ind+fs_ind):]
-        distance = np.full(speed.shape, np.nan)
-        distance[h_fs_ind:-fs_ind] =  (s1+s2)/2 * BODY_DIFF
-
-        
-        #correct out of range
-        with np.errstate(invalid='ignore'):
-            diff_motion[diff_motion >= 180] -= 360
-            diff_motion[diff_motion <= -180] += 360
-            distance[distance < 1] = np.nan
-
-        self.value = (diff_motion / distance) * (np.pi / 180)
+        self.value = compute_path_curvature(speed, motion_direction, fps,
+                                            BODY_DIFF)
 
     @classmethod
     def from_schafer_file(cls, wf, feature_name):
@@ -550,3 +577,70 @@ class Curvature(Feature):
         self.name = feature_name
         self.value = utils.get_nested_h5_field(wf.h, ['path', 'curvature'])
         return self
+
+
+def compute_path_curvature(speed, motion_direction, fps, body_diff):
+    """
+    Compute the path curvature, i.e. the change in motion direction over a
+    time window normalized by the distance travelled during that window.
+
+    This is computed in a single pass over the frames into a preallocated
+    output.
+
+    Parameters
+    ----------
+    speed : numpy.array 1-d
+        [n_frames] Speed of the body, only its magnitude is used
+    motion_direction : numpy.array 1-d
+        [n_frames] Direction of motion, in degrees
+    fps : float
+        Frames per second
+    body_diff : float
+        Time window over which the direction change is computed, in seconds
+
+    Returns
+    -------
+    numpy.array 1-d
+        [n_frames] The curvature, in radians per unit distance. Frames
+        without a complete window, or over which the distance travelled is
+        less than 1, are NaN.
+
+    """
+    n_frames = len(speed)
+    curvature = np.full(n_frames, np.nan)
+
+    # At each frame, we'll compute the differences in motion direction using
+    # some frame in the future relative to the current frame
+    #
+    #i.e. diff_motion[current_frame] = motion_direction[current_frame + frame_scale] - motion_direction[current_frame]
+    #------------------------------------------------
+    frame_scale = velocity_module.get_frames_per_sample(fps, body_diff)
+
+    half_frame_scale = int(round((frame_scale + 1) / 2))
+    #substract one to deal with python indexes
+    fs_ind = max(1, frame_scale - 1)  # ensure this values are larger than 1
+    h_fs_ind = max(1, half_frame_scale - 1)
+
+    # The distance is only defined for frames from h_fs_ind to n_frames -
+    # fs_ind, so those are the only frames with a curvature
+    if n_frames - fs_ind <= h_fs_ind:
+        return curvature
+
+    start = slice(h_fs_ind, n_frames - fs_ind)
+    end = slice(h_fs_ind + fs_ind, n_frames)
+
+    diff_motion = motion_direction[end] - motion_direction[start]
+    distance = np.abs(speed[start]) + np.abs(speed[end])
+    distance *= body_diff / 2
+
+    #correct out of range
+    with np.errstate(invalid='ignore', divide='ignore'):
+        diff_motion[diff_motion >= 180] -= 360
+        diff_motion[diff_motion <= -180] += 360
+        distance[distance < 1] = np.nan
+
+        np.divide(diff_motion, distance, out=curvature[start])
+
+    curvature[start] *= np.pi / 180
+
+    return curvature
@@ -13,11 +13,6 @@ import warnings
 import os
 import h5py
 
-try:
-    import cv2
-except ModuleNotFoundError:
-    raise Exception("OpenCV not installed")
-
 from . import generic_features
 from .generic_features import Feature
 from .. import config, utils
@@ -277,6 +272,63 @@ def get_worm_kinks(features_ref):
     return n_kinks_all
 
 
+def h__findCoils(frame_code, coil_frame_threshold, mimic_old_behaviour):
+    """
+    Find the coils from the frame codes.
+
+    This is currently very reliant on the MRC processor.
+
+    Parameters
+    ----------
+    frame_code : numpy.array [n_frames]
+    coil_frame_threshold : int
+        The minimum number of frames in a coil
+    mimic_old_behaviour : bool
+
+    Returns
+    -------
+    (starts, ends) : numpy.array, numpy.array
+        The first and last frame of each coil
+
+    """
+    # These are values that are specific to the MRC processor
+    COIL_START_CODES = [105, 106]
+    # Code that indicates a frame was successfully segmented
+    FRAME_SEGMENTED = 1
+
+    n_frames = len(frame_code)
+
+    # Algorithm: Whenever a new start is found, find the
+    # first segmented frame; that's the end.
+    coil_start_I = np.flatnonzero(np.isin(frame_code, COIL_START_CODES))
+
+    # NOTE: These are not guaranteed ends, just possible ends ...
+    # Add on a frame to allow closing a coil at the end ...
+    end_coil_I = np.append(np.flatnonzero(frame_code == FRAME_SEGMENTED),
+                           n_frames)
+
+    # Any start found while in a coil is part of that coil, so the starts
+    # that share the same end are one coil, which starts at the first one.
+    end_I = end_coil_I[np.searchsorted(end_coil_I, coil_start_I,
+                                       side='right')]
+    is_new_coil = np.ones(len(end_I), dtype=bool)
+    is_new_coil[1:] = end_I[1:] != end_I[:-1]
+
+    starts = coil_start_I[is_new_coil]
+    end_I = end_I[is_new_coil]
+
+    is_long_enough = (end_I - starts) >= coil_frame_threshold
+    starts = starts[is_long_enough]
+    ends = end_I[is_long_enough] - 1
+
+    if mimic_old_behaviour:
+        if (len(starts) > 0) and (ends[-1] == n_frames - 1):
+            ends[-1] += -1
+            starts[-1] += -1
+
+    return starts, ends
+
+
 def get_worm_coils(features_ref, midbody_distance):
     """
     Get the worm's posture.coils.
@@ -304,52 +356,8 @@ def get_worm_coils(features_ref, midbody_distance):
 
     COIL_FRAME_THRESHOLD = posture_options.coiling_frame_threshold(fps)
 
-    # These are values that are specific to the MRC processor
-    COIL_START_CODES = [105, 106]
-    # Code that indicates a frame was successfully segmented
-    FRAME_SEGMENTED = 1
-
-    # Algorithm: Whenever a new start is found, find the
-    # first segmented frame; that's the end.
-
-    # Add on a frame to allow closing a coil at the end ...
-    coil_start_mask = (frame_code == COIL_START_CODES[0]) | (
-        frame_code == COIL_START_CODES[1])
-    np_false = np.zeros((1,), dtype=bool)
-    coil_start_mask = np.concatenate((coil_start_mask, np_false))
-
-    # NOTE: These are not guaranteed ends, just possible ends ...
-    end_coil_mask = frame_code == FRAME_SEGMENTED
-    np_true = ~np_false
-    end_coil_mask = np.concatenate((end_coil_mask, np_true))
-
-    in_coil = False
-    coil_frame_start = -1
-    n_coils = 0
-    n_frames_plus1 = len(frame_code) + 1
-
-    starts = []
-    ends = []
-
-    for iFrame in range(n_frames_plus1):
-        if in_coil:
-            if end_coil_mask[iFrame]:
-                n_coil_frames = iFrame - coil_frame_start
-                if n_coil_frames >= COIL_FRAME_THRESHOLD:
-                    n_coils += 1
-
-                    starts.append(coil_frame_start)
-                    ends.append(iFrame - 1)
-
-                in_coil = False
-        elif coil_start_mask[iFrame]:
-            in_coil = True
-            coil_frame_start = iFrame
-
-    if options.mimic_old_behaviour:
-        if (len(starts) > 0) and (ends[-1] == len(frame_code) - 1):
-            ends[-1] += -1
-            starts[-1] += -1
+    starts, ends = h__findCoils(frame_code, COIL_FRAME_THRESHOLD,
+                                options.mimic_old_behaviour)
 
     temp = events.EventList(np.transpose(np.vstack((starts, ends))))
 
@@ -379,51 +387,19 @@ class EccentricityAndOrientationProcessor(Feature):
 
         http://en.wikipedia.org/wiki/Image_moment
 
-        Calculated by opencv moments():
+        The area moments of the contour are computed for all frames at once
+        using Green's theorem on the polygon, which is what opencv's
+        moments() does for a contour:
         http://docs.opencv.org/modules/imgproc/doc/structural_analysis_and_shape_descriptors.html
-        
-        
-        This code might not work if there are redundant points in the contour (green approximation fails if the).
-        
-        If there are not contours the code will use the minimal rectangular area.
-        http://docs.opencv.org/2.4/modules/imgproc/doc/structural_analysis_and_shape_descriptors.html?highlight=minarearect#minarearect
-        The function moments only work on a close non overlaping contour.
-        The box width and length are used instead of the ellipse minor and major axis
-        to get an estimate of the eccentricity.
+
+        This code might not work if there are redundant points in the
+        contour (the Green's theorem approximation fails if the contour
+        overlaps itself). The moments only make sense for a closed
+        non-overlapping contour.
+
+        If there are no contours the covariance of the skeleton points is
+        used instead.
         """
-        
-        def _cnt_momentum(cnt):
-            moments = cv2.moments(cnt)
-            return moments['mu11'], moments['mu20'], moments['mu02']
-            
-        def _skel_momentum(skel):
-            mat_cov = np.cov(skel.T)
-            mu20 = mat_cov[0,0]
-            mu02 = mat_cov[1,1]
-            mu11 = mat_cov[0,1]
-            return mu11, mu20, mu02
-            
-            
-        def _momentum_eccentricty_orientation(mu11, mu20, mu02):
-            a1 = (mu20 + mu02) / 2
-            a2 = np.sqrt(4 * mu11**2 +
-                         (mu20 - mu02)**2) / 2
-
-            minor_axis = a1 - a2
-            major_axis = a1 + a2
-            
-            ecc = np.sqrt(1 - minor_axis / major_axis)
-            ang = np.arctan2(2 * mu11, (mu20 - mu02)) / 2
-            ang *= 180 / np.pi
-            return ecc, ang
-
-        def _box_eccentricity_orientation(skel):
-            (CMx, CMy), (L, W), angle = cv2.minAreaRect(skel)
-            if W > L:
-                L, W = W, L  # switch if width is larger than length
-                angle += 90 # this means that the angle is shifted too
-            quirkiness = np.sqrt(1 - W**2 / L**2)
-            return quirkiness, angle
 
         self.name = feature_name
 
@@ -432,36 +408,121 @@ class EccentricityAndOrientationProcessor(Feature):
         #Try to use the contour, otherwise use the skeleton
         try:
             points = wf.nw.contour_without_redundant_points
-            _get_momentum = _cnt_momentum
-            
+            _get_momentum = self.h__contourMoments
+
         except:
             points = wf.nw.skeleton
-            _get_momentum = _skel_momentum
-        
-        
-        
-        # OpenCV does not like float64, this actually make sense for image
-        # data where we do not require a large precition in the decimal part.
-        # This could save quite a lot of space
-        points = points.astype(np.float32)
-        
+            _get_momentum = self.h__skeletonMoments
+
+        # The moments were originally computed by OpenCV, which needed
+        # float32 values. We keep the same precision for the inputs.
+        points = points.astype(np.float32).astype(np.float64)
+
         tot = points.shape[-1]
 
         eccentricity = np.full(tot, np.nan)
         orientation = np.full(tot, np.nan)
-        for ii in range(tot):
-            frame_points = points[:, :, ii]
-            
-            if ~np.any(np.isnan(frame_points)):
-                mu11, mu20, mu02 = _get_momentum(frame_points)
-                eccentricity[ii], orientation[ii] = \
-                _momentum_eccentricty_orientation(mu11, mu20, mu02)
-                
+
+        good_frames_I = np.flatnonzero(
+            ~np.any(np.isnan(points), axis=(0, 1)))
+        x = points[:, 0, good_frames_I]
+        y = points[:, 1, good_frames_I]
+
+        mu11, mu20, mu02 = _get_momentum(x, y)
+
+        a1 = (mu20 + mu02) / 2
+        a2 = np.sqrt(4 * mu11**2 +
+                     (mu20 - mu02)**2) / 2
+
+        minor_axis = a1 - a2
+        major_axis = a1 + a2
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            eccentricity[good_frames_I] = np.sqrt(1 - minor_axis / major_axis)
+        orientation[good_frames_I] = \
+            np.arctan2(2 * mu11, (mu20 - mu02)) / 2 * (180 / np.pi)
+
         wf.timer.toc(self.name)
 
         self.eccentricity = eccentricity
         self.orientation = orientation
 
+    @staticmethod
+    def h__contourMoments(x, y):
+        """
+        Central second order area moments of closed polygons, via Green's
+        theorem.
+
+        Parameters
+        ----------
+        x, y : [n_points x n_frames]
+            The polygon vertices of each frame
+
+        Returns
+        -------
+        (mu11, mu20, mu02) : each [n_frames]
+
+        """
+        # Each vertex paired with the previous one, wrapping around
+        x_prev = np.roll(x, 1, axis=0)
+        y_prev = np.roll(y, 1, axis=0)
+
+        dxy = x_prev * y - x * y_prev
+        m00 = np.sum(dxy, axis=0) / 2
+        m10 = np.sum(dxy * (x_prev + x), axis=0) / 6
+        m01 = np.sum(dxy * (y_prev + y), axis=0) / 6
+        m20 = np.sum(dxy * (x_prev * (x_prev + x) + x**2), axis=0) / 12
+        m11 = np.sum(dxy * (x_prev * (2 * y_prev + y) +
+                            x * (y_prev + 2 * y)), axis=0) / 24
+        m02 = np.sum(dxy * (y_prev * (y_prev + y) + y**2), axis=0) / 12
+
+        # Clockwise contours give negative moments
+        sign = np.where(m00 < 0, -1, 1)
+        m00 = m00 * sign
+        m10 = m10 * sign
+        m01 = m01 * sign
+        m20 = m20 * sign
+        m11 = m11 * sign
+        m02 = m02 * sign
+
+        # As in cv2.moments, degenerate (zero area) contours use a centroid
+        # of 0 rather than dividing by 0
+        is_degenerate = ~(np.abs(m00) > np.finfo(float).eps)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cx = np.where(is_degenerate, 0, m10 / m00)
+            cy = np.where(is_degenerate, 0, m01 / m00)
+
+        mu20 = m20 - m10 * cx
+        mu11 = m11 - m10 * cy
+        mu02 = m02 - m01 * cy
+
+        return mu11, mu20, mu02
+
+    @staticmethod
+    def h__skeletonMoments(x, y):
+        """
+        Covariance of the skeleton points of each frame, used in place of
+        the contour moments.
+
+        Parameters
+        ----------
+        x, y : [n_points x n_frames]
+
+        Returns
+        -------
+        (mu11, mu20, mu02) : each [n_frames]
+
+        """
+        n_points = x.shape[0]
+        dx = x - np.mean(x, axis=0)
+        dy = y - np.mean(y, axis=0)
+
+        mu20 = np.sum(dx * dx, axis=0) / (n_points - 1)
+        mu02 = np.sum(dy * dy, axis=0) / (n_points - 1)
+        mu11 = np.sum(dx * dy, axis=0) / (n_points - 1)
+
+        return mu11, mu20, mu02
+
     @classmethod
     def from_schafer_file(cls, wf, feature_name):
         self = cls.__new__(cls)
@@ -610,35 +671,50 @@ class AmplitudeAndWavelengthProcessor(Feature):
         frames_to_calculate = \
             (np.logical_not(bad_worm_orientation)).nonzero()[0]
 
-        for cur_frame in frames_to_calculate:
-            # Create an evenly sampled x-axis, note that ds varies
-            xx = wwx[:, cur_frame]
-            yy = wwy[:, cur_frame]
-            if xx[0] > xx[-1]: #switch we want to have monotonically inceasing values
-                xx = xx[::-1]
-                yy = yy[::-1]
-            
-            iwwx = utils.colon(xx[0], ds[cur_frame], xx[-1])
-            iwwy = np.interp(iwwx, xx, yy)
-            iwwy = iwwy[::-1]
-            
-            temp = np.fft.fft(iwwy, N_POINTS_FFT)
-
+        # Create an evenly sampled x-axis for each frame, note that ds
+        # varies. We want monotonically increasing x values so frames going
+        # the other way are flipped.
+        xx = wwx[:, frames_to_calculate].T
+        yy = wwy[:, frames_to_calculate].T
+        is_flipped = xx[:, 0] > xx[:, -1]
+        xx[is_flipped] = xx[is_flipped, ::-1]
+        yy[is_flipped] = yy[is_flipped, ::-1]
+
+        # The number of samples of each frame's grid, see utils.colon
+        frame_ds = ds[frames_to_calculate]
+        x_range = xx[:, -1] - xx[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n_steps = (x_range + 2 * np.spacing(x_range)) // frame_ds
+
+        # Frames are processed in groups that share the same grid size, so
+        # that each group is a single 2D block
+        for cur_n_steps in np.unique(n_steps[np.isfinite(n_steps)]):
+            group_I = np.flatnonzero(n_steps == cur_n_steps)
+            cur_frames = frames_to_calculate[group_I]
+            x0 = xx[group_I, 0]
+
+            iwwx = np.linspace(x0, x0 + frame_ds[group_I] * cur_n_steps,
+                               int(cur_n_steps) + 1, axis=1)
+            iwwy = self.h__interpRows(iwwx, xx[group_I], yy[group_I])
+            iwwy = iwwy[:, ::-1]
+
+            temp = np.fft.rfft(iwwy, N_POINTS_FFT, axis=1)[:, 0:HALF_N_FFT]
 
             if options.mimic_old_behaviour:
-                iY = temp[0:HALF_N_FFT]
-                iY = iY * np.conjugate(iY) / N_POINTS_FFT
+                # i.e. temp * conj(temp) / N_POINTS_FFT
+                iY = (temp.real * temp.real + temp.imag * temp.imag) / \
+                    N_POINTS_FFT
             else:
-                iY = np.abs(temp[0:HALF_N_FFT])
-            
-            
+                iY = np.abs(temp)
+
             # Find peaks that are greater than the cutoff
-            peaks, indx = utils.separated_peaks(iY,
-                                                MIN_DIST_PEAKS,
-                                                True,
-                                                (WAVELENGTH_PCT_MAX_CUTOFF *
-                                                 np.amax(iY)))
-            
+            is_peak = utils.separated_peaks_2D(
+                iY,
+                MIN_DIST_PEAKS,
+                True,
+                (WAVELENGTH_PCT_MAX_CUTOFF *
+                 np.amax(iY, axis=1, keepdims=True)))
+
             # This is what the supplemental says, not what was done in
             # the previous code. I'm not sure what was done for the actual
             # paper, but I would guess they used power.
@@ -656,36 +732,36 @@ class AmplitudeAndWavelengthProcessor(Feature):
             # We sort the peaks so that the largest is at the first index
             # and will be primary, this was not done in the previous
             # version of the code
-            I = np.argsort(-1 * peaks)
-            indx = indx[I]
+            peak_values = np.where(is_peak, iY, -np.inf)
+            sorted_I = np.argsort(-1 * peak_values, axis=1,
+                                  kind='stable')[:, :2]
+            n_peaks = np.sum(is_peak, axis=1)
 
-            frequency_values = (indx - 1) / N_POINTS_FFT * \
-                spatial_sampling_frequency[cur_frame]
+            frequency_values = (sorted_I - 1) / N_POINTS_FFT * \
+                spatial_sampling_frequency[cur_frames, np.newaxis]
 
-            all_wavelengths = 1 / frequency_values
+            with np.errstate(divide='ignore'):
+                all_wavelengths = 1 / frequency_values
 
-            p_temp = all_wavelengths[0]
-
-            if indx.size > 1:
-                s_temp = all_wavelengths[1]
-            else:
-                s_temp = np.NaN
+            p_temp = np.where(n_peaks > 0, all_wavelengths[:, 0], np.NaN)
+            s_temp = np.where(n_peaks > 1, all_wavelengths[:, 1], np.NaN)
 
             worm_wavelength_max = (WAVELENGTH_PCT_CUTOFF *
-                                   worm_lengths[cur_frame])
+                                   worm_lengths[cur_frames])
 
             # Cap wavelengths ...
-            if p_temp > worm_wavelength_max:
-                p_temp = worm_wavelength_max
-
+            #
             # ??? Do we really want to keep this as well if p_temp == worm_2x?
             # i.e., should the secondary wavelength be valid if the primary is
             # also limited in this way ?????
-            if s_temp > worm_wavelength_max:
-                s_temp = worm_wavelength_max
+            with np.errstate(invalid='ignore'):
+                p_temp = np.where(p_temp > worm_wavelength_max,
+                                  worm_wavelength_max, p_temp)
+                s_temp = np.where(s_temp > worm_wavelength_max,
+                                  worm_wavelength_max, s_temp)
 
-            primary_wavelength[cur_frame] = p_temp
-            secondary_wavelength[cur_frame] = s_temp
+            primary_wavelength[cur_frames] = p_temp
+            secondary_wavelength[cur_frames] = s_temp
 
         if options.mimic_old_behaviour:
             # In the old code, the first peak (i.e. larger wavelength,
@@ -708,6 +784,44 @@ class AmplitudeAndWavelengthProcessor(Feature):
 
         timer.toc('posture.amplitude_and_wavelength')
 
+    def h__interpRows(self, x, xp, fp):
+        """
+        Equivalent to calling np.interp(x[i], xp[i], fp[i]) for each row i.
+
+        Parameters
+        ----------
+        x : [n_rows x n_x]
+        xp : [n_rows x n_xp]
+            Each row must be increasing
+        fp : [n_rows x n_xp]
+
+        """
+        n_rows, n_xp = xp.shape
+        row_I = np.arange(n_rows)[:, np.newaxis]
+
+        # For each x, the number of xp values at or before it. A stable
+        # sort keeps the xp values ahead of equal x values.
+        merged = np.hstack((xp, x))
+        order = np.argsort(merged, axis=1, kind='stable')
+        n_xp_before = np.cumsum(order < n_xp, axis=1)
+        n_le = np.empty(x.shape, dtype=int)
+        n_le[row_I, order[order >= n_xp].reshape(x.shape) - n_xp] = \
+            n_xp_before[order >= n_xp].reshape(x.shape)
+
+        # Interval to use, x values past the ends are handled below
+        j = np.clip(n_le - 1, 0, n_xp - 2)
+        x_left = xp[row_I, j]
+        f_left = fp[row_I, j]
+        slope = (fp[row_I, j + 1] - f_left) / (xp[row_I, j + 1] - x_left)
+        y = slope * (x - x_left) + f_left
+
+        # Exactly on a sample point, before the start and at or past the end
+        y = np.where(x == x_left, f_left, y)
+        y = np.where(n_le == 0, fp[:, :1], y)
+        y = np.where(n_le == n_xp, fp[:, -1:], y)
+
+        return y
+
     @classmethod
     def from_schafer_file(cls, wf, feature_name):
         self = cls.__new__(cls)
@@ -840,52 +954,8 @@ class Coils(Feature):
 
         COIL_FRAME_THRESHOLD = posture_options.coiling_frame_threshold(fps)
 
-        # These are values that are specific to the MRC processor
-        COIL_START_CODES = [105, 106]
-        # Code that indicates a frame was successfully segmented
-        FRAME_SEGMENTED = 1
-
-        # Algorithm: Whenever a new start is found, find the
-        # first segmented frame; that's the end.
-
-        # Add on a frame to allow closing a coil at the end ...
-        coil_start_mask = (frame_code == COIL_START_CODES[0]) | (
-            frame_code == COIL_START_CODES[1])
-        np_false = np.zeros((1,), dtype=bool)
-        coil_start_mask = np.concatenate((coil_start_mask, np_false))
-
-        # NOTE: These are not guaranteed ends, just possible ends ...
-        end_coil_mask = frame_code == FRAME_SEGMENTED
-        np_true = ~np_false
-        end_coil_mask = np.concatenate((end_coil_mask, np_true))
-
-        in_coil = False
-        coil_frame_start = -1
-        n_coils = 0
-        n_frames_plus1 = len(frame_code) + 1
-
-        starts = []
-        ends = []
-
-        for iFrame in range(n_frames_plus1):
-            if in_coil:
-                if end_coil_mask[iFrame]:
-                    n_coil_frames = iFrame - coil_frame_start
-                    if n_coil_frames >= COIL_FRAME_THRESHOLD:
-                        n_coils += 1
-
-                        starts.append(coil_frame_start)
-                        ends.append(iFrame - 1)
-
-                    in_coil = False
-            elif coil_start_mask[iFrame]:
-                in_coil = True
-                coil_frame_start = iFrame
-
-        if options.mimic_old_behaviour:
-            if (len(starts) > 0) and (ends[-1] == len(frame_code) - 1):
-                ends[-1] += -1
-                starts[-1] += -1
+        starts, ends = h__findCoils(frame_code, COIL_FRAME_THRESHOLD,
+                                    options.mimic_old_behaviour)
 
         temp = events.EventList(np.transpose(np.vstack((starts, ends))))
 
@@ -952,76 +1022,79 @@ class Kinks(Feature):
         n_frames = bend_angles.shape[1]
         n_kinks_all = np.full(n_frames, np.nan, dtype=float)
 
-        #(np.any(np.logical_or(mask_pos,mask_neg),axis=0)).nonzero()[0]
-
         nan_mask = np.isnan(bend_angles)
+        frames_I = (~np.all(nan_mask, axis=0)).nonzero()[0]
 
-        for iFrame in (~np.all(nan_mask, axis=0)).nonzero()[0]:
-            smoothed_bend_angles = filters.convolve1d(
-                bend_angles[:, iFrame], gauss_filter, cval=0, mode='constant')
+        # Smooth all frames at once along the body axis, the result is
+        # [n_frames_to_use x n_angles]
+        smoothed_bend_angles = filters.convolve1d(
+            bend_angles[:, frames_I], gauss_filter, axis=0,
+            cval=0, mode='constant').T
 
-            # This code is nearly identical in getForaging
-            #-------------------------------------------------------
-            n_frames = smoothed_bend_angles.shape[0]
+        with np.errstate(invalid='ignore'):
+            dataSign = np.sign(smoothed_bend_angles)
 
-            with np.errstate(invalid='ignore'):
-                dataSign = np.sign(smoothed_bend_angles)
-
-            if np.any(np.equal(dataSign, 0)):
-                # I don't expect that we'll ever actually reach 0
-                # The code for zero was a bit weird, it keeps counting if no sign
-                # change i.e. + + + 0 + + + => all +
-                #
-                # but it counts for both if sign change
-                # + + 0 - - - => 3 +s and 4 -s
-                
-                #this case does happend. I will continue (default nan) instead of risign an error (AEJ)
-                #raise Exception("Unhandled code case")
-                continue
-
-            sign_change_I = (
-                np.not_equal(dataSign[1:], dataSign[0:-1])).nonzero()[0]
-
-            end_I = np.concatenate(
-                (sign_change_I,
-                 n_frames * np.ones(1, dtype=np.result_type(sign_change_I))))
-
-            wtf1 = np.zeros(1, dtype=np.result_type(sign_change_I))
-            wtf2 = sign_change_I + 1
-            # +2? due to inclusion rules???
-            start_I = np.concatenate((wtf1, wtf2))
-
-            # All NaN values are considered sign changes, remove these ...
-            keep_mask = np.logical_not(np.isnan(smoothed_bend_angles[start_I]))
-
-            start_I = start_I[keep_mask]
-            end_I = end_I[keep_mask]
-
-            # The old code had a provision for having NaN values in the middle
-            # of the worm. I have not translated that feature to the newer code. I
-            # don't think it will ever happen though for a valid frame, only on the
-            # edges should you have NaN values.
-            if start_I.size != 0 and \
-               np.any(np.isnan(smoothed_bend_angles[start_I[0]:end_I[-1]])):
-                #this case does happend. I will continue (default nan) instead of risign an error (AEJ)
-                #raise Exception("Unhandled code case")
-                continue
-
-            #-------------------------------------------------------
-            # End of identical code ...
-
-            lengths = end_I - start_I + 1
-
-            # Adjust lengths for first and last:
-            # Basically we allow NaN values to count towards the length for the
-            # first and last stretches
-            if lengths.size != 0:
-                if start_I[0] != 0:  # Due to leading NaNs
-                    lengths[0] = end_I[0] + 1
-                if end_I[-1] != n_frames:  # Due to trailing NaNs
-                    lengths[-1] = n_frames - start_I[-1]
-
-            n_kinks_all[iFrame] = np.sum(lengths >= length_threshold)
+        is_nan = np.isnan(smoothed_bend_angles)
+        is_valid = ~is_nan
+        angle_I = np.arange(n_angles)
+
+        # The first and last non-NaN values of each frame. Frames where
+        # everything is NaN after smoothing have no stretches and so no kinks.
+        has_values = np.any(is_valid, axis=1)
+        first_I = np.argmax(is_valid, axis=1)
+        last_I = n_angles - 1 - np.argmax(is_valid[:, ::-1], axis=1)
+
+        # I don't expect that we'll ever actually reach 0
+        # The code for zero was a bit weird, it keeps counting if no sign
+        # change i.e. + + + 0 + + + => all +
+        #
+        # but it counts for both if sign change
+        # + + 0 - - - => 3 +s and 4 -s
+        #
+        # this case does happen, these frames are left as NaN instead of
+        # raising an error (AEJ)
+        #
+        # The old code had a provision for having NaN values in the middle
+        # of the worm. I have not translated that feature to the newer code.
+        # Only on the edges should you have NaN values for a valid frame,
+        # frames with NaN values in the middle are left as NaN as well.
+        is_inner = (angle_I > first_I[:, np.newaxis]) & \
+            (angle_I < last_I[:, np.newaxis])
+        is_bad = has_values & (np.any(dataSign == 0, axis=1) |
+                               np.any(is_nan & is_inner, axis=1))
+
+        # Stretches of the same sign, within the non-NaN part of each frame
+        sign_changes = np.not_equal(dataSign[:, 1:], dataSign[:, :-1])
+        is_start = is_valid & np.hstack(
+            (np.ones((len(frames_I), 1), dtype=bool), sign_changes))
+        is_end = is_valid & np.hstack(
+            (sign_changes, np.ones((len(frames_I), 1), dtype=bool)))
+        stretch_frame_I, start_I = np.nonzero(is_start)
+        end_I = np.nonzero(is_end)[1]
+
+        # The last stretch of a frame ends "at" n_angles when there are no
+        # trailing NaNs
+        is_last = end_I == last_I[stretch_frame_I]
+        end_I[is_last & (end_I == n_angles - 1)] = n_angles
+
+        lengths = end_I - start_I + 1
+
+        # Adjust lengths for first and last:
+        # Basically we allow NaN values to count towards the length for the
+        # first and last stretches
+        is_first = start_I == first_I[stretch_frame_I]
+        leading_mask = is_first & (start_I != 0)  # Due to leading NaNs
+        lengths[leading_mask] = end_I[leading_mask] + 1
+        trailing_mask = is_last & (end_I != n_angles)  # Due to trailing NaNs
+        lengths[trailing_mask] = n_angles - start_I[trailing_mask]
+
+        n_kinks = np.bincount(stretch_frame_I,
+                              weights=lengths >= length_threshold,
+                              minlength=len(frames_I))
+        n_kinks[~has_values] = 0
+        n_kinks[is_bad] = np.nan
+
+        n_kinks_all[frames_I] = n_kinks
 
         timer.toc('posture.kinks')
 
@@ -1035,12 +1108,20 @@ class Kinks(Feature):
         return self
 
 
+# The eigenworms are only read from disk once per process, see
+# load_eigen_worms
+_eigen_worms = None
+
+
 def load_eigen_worms():
     """
     Load the eigen_worms, which are stored in a Matlab data file
 
     The eigenworms were computed by the Schafer lab based on N2 worms
 
+    The file is only read the first time this is called, after that the
+    same (read-only) array is returned.
+
     Returns
     ----------
     eigen_worms: [7 x 48]
@@ -1048,15 +1129,20 @@ def load_eigen_worms():
     From http://stackoverflow.com/questions/50499/
 
     """
+    global _eigen_worms
+
+    if _eigen_worms is None:
+        eigen_worm_file_path = os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            config.EIGENWORM_FILE)
 
-    eigen_worm_file_path = os.path.join(
-    os.path.dirname(os.path.realpath(__file__)),
-    config.EIGENWORM_FILE)
+        with h5py.File(eigen_worm_file_path, 'r') as h:
+            eigen_worms = np.transpose(h['eigenWorms'][()])
 
-    h = h5py.File(eigen_worm_file_path, 'r')
-    eigen_worms = h['eigenWorms'].value
+        eigen_worms.setflags(write=False)
+        _eigen_worms = eigen_worms
 
-    return np.transpose(eigen_worms)
+    return _eigen_worms
 
 
 class EigenProjectionProcessor(Feature):
@@ -1080,11 +1166,11 @@ class EigenProjectionProcessor(Feature):
         posture_options = wf.options.posture
         N_EIGENWORMS_USE = posture_options.n_eigenworms_use
         timer = wf.timer
-        timer.toc
+        timer.tic()
         # eigen_worms: [7,48]
-        eigen_worms = load_eigen_worms()
-
-        
+        # Only the components we use are kept, this is a view on the
+        # shared basis
+        eigen_worms = load_eigen_worms()[0:N_EIGENWORMS_USE, :]
 
         sx = wf.nw.skeleton_x
         sy = wf.nw.skeleton_y
@@ -1095,50 +1181,21 @@ class EigenProjectionProcessor(Feature):
             #switch in the angle sign in case of the contour orientation is anticlockwise
             angles = -angles
 
-        n_frames = angles.shape[1]
-
         # need to deal with cases where angle changes discontinuously from -pi
         # to pi and pi to -pi.  In these cases, subtract 2pi and add 2pi
         # respectively to all remaining points.  This effectively extends the
         # range outside the -pi to pi range.  Everything is re-centred later
         # when we subtract off the mean.
-        false_row = np.zeros((1, n_frames), dtype=bool)
-
-        # NOTE: By adding the row of falses, we shift the trues
-        # to the next value, which allows indices to match. Otherwise after every
-        # find statement we would need to add 1, I think this is a bit faster
-        # ...
-
+        #
+        # Frames with NaN values become all NaN, they would anyway once the
+        # mean is subtracted.
         with np.errstate(invalid='ignore'):
-            mask_pos = np.concatenate(
-                (false_row, np.diff(angles, n=1, axis=0) > np.pi), axis=0)
-            mask_neg = np.concatenate(
-                (false_row, np.diff(angles, n=1, axis=0) < -np.pi), axis=0)
-
-        # Only fix the frames we need to, in which there is a jump in going
-        # from one segment to the next ...
-        fix_frames_I = (
-            np.any(np.logical_or(mask_pos, mask_neg), axis=0)).nonzero()[0]
-
-        for cur_frame in fix_frames_I:
+            angles = np.unwrap(angles, axis=0)
 
-            positive_jump_I = (mask_pos[:, cur_frame]).nonzero()[0]
-            negative_jump_I = (mask_neg[:, cur_frame]).nonzero()[0]
+        angles -= np.mean(angles, axis=0)
 
-            # subtract 2pi from remainging data after positive jumps
-            # Note that the jumps impact all subsequent frames
-            for cur_pos_jump in positive_jump_I:
-                angles[cur_pos_jump:, cur_frame] -= 2 * np.pi
+        eigen_projections = np.dot(eigen_worms, angles)
 
-            # add 2pi to remaining data after negative jumps
-            for cur_neg_jump in negative_jump_I:
-                angles[cur_neg_jump:, cur_frame] += 2 * np.pi
-
-        angles = angles - np.mean(angles, axis=0)
-        
-        
-        eigen_projections = np.dot(eigen_worms[0:N_EIGENWORMS_USE, :], angles)
-        
         #change signs for anticlockwise
         #if nw.video_info.ventral_mode == 2:
         #    eigen_projections = -eigen_projections
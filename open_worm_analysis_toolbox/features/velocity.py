@@ -10,8 +10,8 @@ import numpy as np
 
 __ALL__ = ['get_angles',
            'get_partition_angles',
-           'h__computeAngularSpeed',
            'compute_speed',
+           'compute_partition_speeds',
            'get_frames_per_sample']
 
 
@@ -130,66 +130,6 @@ def get_partition_angles(nw, partition_key, data_key='skeleton',
     return get_angles(segment_x, segment_y, head_to_tail)
 
 
-def h__computeAngularSpeed(time, segment_x, segment_y,
-                           left_I, right_I, ventral_mode):
-    """
-
-    This function is called by compute_speeed().
-
-    TODO: These units are wrong ...
-    TODO: This is actually angular velocity
-
-    Parameters
-    ----------
-    time :
-    segment_x : numpy array, shape (p,n)
-        The x's of the partition being considered.
-    segment_y : numpy array, shape (p,n)
-        The y's of the partition being considered.
-    left_I : numpy array
-        For each frame, an index (earlier in time) from which to compute
-        the desired value. These values only exist for cases in which
-        both left_I and right_I were computed to be valid.
-    right_I : numpy array
-        For each frame, an index (later in time) from which to compute the
-        desired vlaue.
-    ventral_mode :
-        0, 1, or 2, specifying that the ventral side is...
-          0 = unknown
-          1 = clockwise
-          2 = anticlockwise
-
-    Returns
-    -------
-    a numpy array of shape n, in units of degrees per second
-
-    See Also
-    --------
-    compute_speed
-    get_angles
-
-    """
-    # Compute the body part direction for each frame
-    point_angle_d = get_angles(segment_x, segment_y, head_to_tail=False)
-
-    angular_speed = point_angle_d[right_I] - point_angle_d[left_I]
-
-    # Correct any jumps that result during the subtraction process
-    # i.e. 1 - 359 ~= -358
-    # by forcing -180 <= angular_speed[i] <= 180
-    angular_speed = (angular_speed + 180) % (360) - 180
-
-    # Change units from degrees per frame to degrees per second
-    angular_speed = angular_speed  / time
-
-    # Sign the direction for dorsal/ventral locomotion.
-    # if ventral_mode is anything but anticlockwise, then negate angular_speed:
-    if(ventral_mode < 2):
-        angular_speed = -angular_speed
-
-    return angular_speed
-
-
 def h__getSpeedIndices(frames_per_sample, good_frames_mask):
     """
 
@@ -255,19 +195,21 @@ def h__getSpeedIndices(frames_per_sample, good_frames_mask):
     frame 0: left index is invalid, so we don't compute the value
     frame 1: compute value taking values at frame 0 (left) and frame 2 (right)
 
-    This is a frame by frame approach, but below we actually loop over
-    the shifts since the shifts tends to be much less than in size than the
-    # of frames
+    This is a frame by frame approach. Rather than looping over frames (or
+    over shifts), we find for every frame the closest good frame at or
+    before it, and the closest good frame at or after it. These are prefix
+    scans (np.maximum.accumulate going forward, np.minimum.accumulate going
+    backward) over the indices of the good frames, and take O(n) regardless
+    of the sample scale.
 
-    i.e. (by shift approach explained)
-    For all frames, check 1 to the left. For all valid frames, set these
-    as the left_I values for the current frames.
-    Do the same thing as well for frames that are 1 to the right.
-    Now we are done with a shift size of 1.
-
-    Now repeat this process for a shift size of 2, however only override left_I
-    and right_I values if they were not set for a shift size of 1.
+    e.g. for the data above:
+    frame      : 0 1 2 3 4 5 6 7 8 9
+    last_good  : 0 0 2 3 4 4 6 6 8 8    (closest good frame <= frame)
+    next_good  : 0 2 2 3 4 6 6 8 8 10   (closest good frame >= frame)
 
+    For frame i, left_I is last_good[i - half_scale] and right_I is
+    next_good[i + half_scale]. These are only valid if they lie within the
+    maximum shift (frames_per_sample - 1) of frame i.
 
     """
 
@@ -286,111 +228,34 @@ def h__getSpeedIndices(frames_per_sample, good_frames_mask):
     # First frame for which we can assign a valid velocity:
     start_index = half_scale
     # Final frame for which we can assign a valid velocity, plus one:
-    end_index = num_frames - half_scale
-
-    # These are the indices we will use to compute the speed. We add
-    # a half scale here to avoid boundary issues (i.e. because we pad the. We'll subtract it out later.
-    # See below for more details
-    middle_I = np.array(np.arange(start_index, end_index, 1) + half_scale,
-                        dtype='int32')
-
-    """
-     Our start_index frame can only have one valid start frame (frame 0)
-     afterwards it is invalid. In other words, if frame 0 is not good, we
-     can't check frame -1, or -2.
-
-     However, in general I'd prefer to avoid doing some check on the bounds
-     of the frames, i.e. for looking at starting frames, I'd like to avoid
-     checking if the frame value is 0 or greater.
-
-     To get around this we'll pad with bad values (which we'll never match)
-     then shift the final indices. In this way, we can check these "frames",
-     as they will have positive indices.
-
-     e.g.
-       scale = 5
-       half_scale = 2
+    end_index = max(num_frames - half_scale, start_index)
 
-     This means the first frame in which we could possibly get a valid
-     velocity is frame 2, computed using frames 0 and 4
+    # These are the frames at which we will compute the speed
+    middle_I = np.arange(start_index, end_index, dtype='int32')
 
+    # For each frame, the closest good frame at or before it. Frames without
+    # any good frame before them get -1.
+    frame_I = np.arange(num_frames, dtype='int32')
+    last_good_I = np.maximum.accumulate(
+        np.where(good_frames_mask, frame_I, -1))
 
-     F   F   F T T  <- example good_frames_mask_padded values
-             0 1 2  <- true indices (frame numbers)
-     0   1   2 3 4  <- temporary indices
-
-     NOTE: Now if frame 0 is bad, we can go left by half_scale + 1 to temp
-     index 1 (frame -1) or even further to temp_index 0 (frame -2). we'll
-     never use those values however because below we state that the values
-     at those indices are bad (see good_frames_mask_padded)
-
-    """
-
-    # This tells us whether each value is useable or not for velocity
-    # Better to do this out of the loop.
-    # For real indices (frames 1:num_frames), we rely on whether or not the
-    # mean position is NaN, for fake padding frames they can never be good so we
-    # set them to be false
-    stub_mask = np.zeros(half_scale, dtype=bool)
-    good_frames_mask_padded = \
-        np.concatenate((stub_mask, good_frames_mask, stub_mask))
+    # For each frame, the closest good frame at or after it. Frames without
+    # any good frame after them get num_frames.
+    next_good_I = np.minimum.accumulate(
+        np.where(good_frames_mask, frame_I, num_frames)[::-1])[::-1]
 
     # These will be the final indices from which we estimate the velocity.
     # i.e. delta_position(I) = position(right_indices(I)) -
     #                          position(left_indices(I))
-    left_I = np.empty(len(middle_I), dtype='int32')
-    right_I = np.empty(len(middle_I), dtype='int32')
-    # numpy integer arrays cannot accept NaN, which is a float concept, but
-    # filling them with NaN fills them with the largest negative number
-    # possible, -2**31.  We can easily filter for this later.
-    left_I.fill(np.NaN)
-    right_I.fill(np.NaN)
-
-    # Track which ends we haven't yet matched, for each of the middle_I's.
-    # since we are loopering over each possible shift, we need to track
-    # whether valid ends have been found for each of the middle_I's.
-    unmatched_left_mask = np.ones(len(middle_I), dtype=bool)
-    unmatched_right_mask = np.ones(len(middle_I), dtype=bool)
-
-    # Instead of looping over each centered velocity, we loop over each possible
-    # shift. A shift is valid if the frame of the shift is good, and we have yet
-    # to encounter a match for that centered index
-    for shift_size in range(half_scale, frames_per_sample):
-        # We grab indices that are the appropriate distance from the current
-        # value. If we have not yet found a bound on the given side, and the
-        # index is valid, we keep it.
-        left_indices_temp = middle_I - shift_size
-        right_indices_temp = middle_I + shift_size
-
-        is_good_left_mask = good_frames_mask_padded[left_indices_temp]
-        is_good_right_mask = good_frames_mask_padded[right_indices_temp]
-
-        use_left_mask = unmatched_left_mask & is_good_left_mask
-        use_right_mask = unmatched_right_mask & is_good_right_mask
-
-        # Change only those left_I's to our newly shifted outwards
-        # left_indices_temp, that the use_left_mask says should be used.
-        left_I[use_left_mask] = left_indices_temp[use_left_mask]
-        right_I[use_right_mask] = right_indices_temp[use_right_mask]
-
-        # Flag the matched items as being matched
-        unmatched_left_mask[use_left_mask] = False
-        unmatched_right_mask[use_right_mask] = False
-
-    # Remove the offset used to pad the numbers (discussed above)
-    # We have to avoid decrementing negative numbers because our negative
-    # number is our NaN proxy and it's already as negative as it can be
-    # without wrapping back up to positive again
-    left_I[left_I > 0] -= half_scale
-    right_I[right_I > 0] -= half_scale
-    middle_I -= half_scale
+    left_I = last_good_I[middle_I - half_scale]
+    right_I = next_good_I[middle_I + half_scale]
 
     # Filter down to usable values, in which both left and right are defined
-    # Remember than np.NaN is not valid number for integer numpy arrays
-    # so instead of checking for which entries are NaN, we check for
-    # which entries are negative, since no array indices can be
-    # negative!
-    valid_indices_mask = (left_I >= 0) & (right_I >= 0)
+    # and no further than the maximum shift from the frame
+    valid_indices_mask = (left_I >= 0) & \
+        (left_I >= middle_I - scale_minus_1) & \
+        (right_I < num_frames) & \
+        (right_I <= middle_I + scale_minus_1)
     left_I = left_I[valid_indices_mask]
     right_I = right_I[valid_indices_mask]
     middle_I = middle_I[valid_indices_mask]
@@ -398,11 +263,6 @@ def h__getSpeedIndices(frames_per_sample, good_frames_mask):
     keep_mask = np.zeros(num_frames, dtype=bool)
     keep_mask[middle_I] = True
 
-    # sum(keep_mask) should equal the number of valid velocity values
-    # left_I and right_I should store just these valid velocity values
-    assert sum(keep_mask) == len(left_I) == len(right_I)
-    assert all(left_I >= 0) and all(left_I < num_frames)
-    assert all(right_I >= 0) and all(right_I < num_frames)
     return keep_mask, left_I, right_I
 
 
@@ -417,6 +277,9 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
     time is expanded up to a maximum of 2*sample_time (or technically,
     1 sample_time in either direction)
 
+    This is a wrapper around compute_partition_speeds() for a single
+    partition.
+
     Parameters
     ----------
     sx, sy: Two numpy arrays of shape (p, n) where p is the size of the
@@ -446,82 +309,159 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
 
     Known Callers
     -------------
-    LocomotionVelocity
+    path_features.Curvature
+
+    See Also
+    --------
+    compute_partition_speeds
 
     """
 
-    num_frames = np.shape(sx)[1]
-    speed = np.full((num_frames), np.nan)
-    angular_speed = np.full((num_frames), np.nan)
-    motion_direction = np.full((num_frames), np.nan)
+    partitions = [(0, np.shape(sx)[0])]
+    speed, angular_speed, motion_direction = \
+        compute_partition_speeds(fps, sx, sy, partitions, avg_body_angle,
+                                 [sample_time], ventral_mode)
 
-    # We need to go from a time over which to compute the velocity
-    # to a # of samples. The # of samples should be odd.
-    frames_per_sample = get_frames_per_sample(fps, sample_time)
+    return speed[0], angular_speed[0], motion_direction[0]
 
-    # If we don't have enough frames to satisfy our sampling scale,
-    # return with nothing.
-    if(frames_per_sample > num_frames):
-        return speed, angular_speed, motion_direction
 
-    # Compute the indices that we will use for computing the velocity. We
-    # calculate the velocity roughly centered on each sample, but with a
-    # considerable width between frames that smooths the velocity estimate.
-    good_frames_mask = ~np.isnan(avg_body_angle)
-    keep_mask, left_I, right_I = h__getSpeedIndices(frames_per_sample,
-                                                    good_frames_mask)
-
-    # 1) Compute speed
-    # --------------------------------------------------------
-    # Centroid of the current skeletal segment, frame-by-frame:
-    x_mean = np.mean(sx, 0)
-    y_mean = np.mean(sy, 0)
+def compute_partition_speeds(fps, skeleton_x, skeleton_y, partitions,
+                             avg_body_angle, sample_times, ventral_mode=0):
+    """
 
-    dX = x_mean[right_I] - x_mean[left_I]
-    dY = y_mean[right_I] - y_mean[left_I]
+    Computes the speed, angular speed and motion direction of several
+    partitions of the worm in a single call.
 
-    distance = np.sqrt(dX ** 2 + dY ** 2)
-    time = (right_I - left_I) / fps
+    The work that is shared between partitions is only done once:
+    - the speed indices (see h__getSpeedIndices) depend only on the
+      avg_body_angle and the sample scale, so they are computed once per
+      unique sample scale (e.g. once for the 1/4 second tip scale and once
+      for the 1/2 second body scale)
+    - the centroids and average angles of all partitions are reduced from
+      the skeleton in one pass (a matrix product of partition weights with
+      the skeleton points)
 
-    #import pdb
-    # pdb.set_trace()
+    Parameters
+    ----------
+    fps : float
+    skeleton_x, skeleton_y : numpy arrays of shape (49, n)
+        The worm skeleton's x and y coordinates, respectively.
+    partitions : list of (start, stop) tuples
+        Index ranges into the skeleton points, e.g. the values of
+        WormPartition.worm_partitions. As with those values, the stop
+        index is not inclusive. Partitions may overlap.
+    avg_body_angle : numpy array of shape (n)
+        See compute_speed()
+    sample_times : list of floats
+        Time over which to compute velocity, in seconds, for each partition.
+    ventral_mode : int (0,1,2)
+        See compute_speed()
 
-    speed[keep_mask] = distance / time
+    Returns
+    -------
+    (speed, angular_speed, motion_direction)
+    Three numpy arrays of shape (len(partitions), n). Row i holds the values
+    that compute_speed() would return for partition i.
 
-    # 2) Compute angular speed (Formally known as direction :/)
-    # --------------------------------------------------------
-    angular_speed[keep_mask] = h__computeAngularSpeed(time, sx, sy,
-                                                      left_I, right_I,
-                                                      ventral_mode)
+    Known Callers
+    -------------
+    locomotion_features.LocomotionVelocity
+    compute_speed
 
-    # 3) Sign the speed.
-    # ------------------------------------------------------------
-    #   We want to know how the worm's movement direction compares
-    #   to the average angle it had (apparently at the start)
-    motion_direction[keep_mask] = np.degrees(np.arctan2(dY, dX))
+    """
 
-    # This recentres the definition, as we are really just concerned
-    # with the change, not with the actual value
-    body_direction = np.full((num_frames), np.nan)
-    body_direction[keep_mask] = motion_direction[keep_mask] - \
-        avg_body_angle[left_I]
+    num_partitions = len(partitions)
+    num_frames = np.shape(skeleton_x)[1]
+    speed = np.full((num_partitions, num_frames), np.nan)
+    angular_speed = np.full((num_partitions, num_frames), np.nan)
+    motion_direction = np.full((num_partitions, num_frames), np.nan)
 
-    # Force all angles to be within -pi and pi
-    with np.errstate(invalid='ignore'):
-        body_direction = (body_direction + 180) % (360) - 180
+    # Centroid of each skeletal partition, frame-by-frame (num_partitions, n)
+    x_mean, y_mean = h__getPartitionMeans(skeleton_x, skeleton_y, partitions)
 
-    # Sign speed[i] as negative if the angle
-    # body_direction[i] lies in Q2 or Q3
-    with np.errstate(invalid='ignore'):
-        speed[abs(body_direction) > 90] = -speed[abs(body_direction) > 90]
+    # Body part direction for each partition and frame (num_partitions, n)
+    # This is get_angles() with head_to_tail=False for each partition.
+    point_angle_d = h__getPartitionAngles(skeleton_x, skeleton_y, partitions)
 
-    # (Added for wormPathCurvature)
-    # Sign motion_direction[i] as negative if the angle
-    # body_direction[i] lies in Q3 or Q4
+    good_frames_mask = ~np.isnan(avg_body_angle)
 
-    with np.errstate(invalid='ignore'):
-        motion_direction[body_direction < 0] = - \
-            motion_direction[body_direction < 0]
+    # We need to go from a time over which to compute the velocity
+    # to a # of samples. The # of samples should be odd.
+    frames_per_sample = np.array([get_frames_per_sample(fps, x)
+                                  for x in sample_times])
+
+    for cur_frames_per_sample in np.unique(frames_per_sample):
+        # If we don't have enough frames to satisfy our sampling scale,
+        # leave these partitions as NaN.
+        if cur_frames_per_sample > num_frames:
+            continue
+
+        rows = np.flatnonzero(frames_per_sample == cur_frames_per_sample)
+
+        # Compute the indices that we will use for computing the velocity.
+        # We calculate the velocity roughly centered on each sample, but
+        # with a considerable width between frames that smooths the
+        # velocity estimate.
+        keep_mask, left_I, right_I = \
+            h__getSpeedIndices(int(cur_frames_per_sample), good_frames_mask)
+        keep_I = np.flatnonzero(keep_mask)
+
+        # 1) Compute speed
+        # --------------------------------------------------------
+        dX = x_mean[rows][:, right_I] - x_mean[rows][:, left_I]
+        dY = y_mean[rows][:, right_I] - y_mean[rows][:, left_I]
+
+        distance = np.sqrt(dX ** 2 + dY ** 2)
+        time = (right_I - left_I) / fps
+
+        cur_speed = distance / time
+
+        # 2) Compute angular speed (Formally known as direction :/)
+        # --------------------------------------------------------
+        cur_angular_speed = \
+            point_angle_d[rows][:, right_I] - point_angle_d[rows][:, left_I]
+
+        # Correct any jumps that result during the subtraction process
+        # i.e. 1 - 359 ~= -358
+        # by forcing -180 <= angular_speed[i] <= 180
+        with np.errstate(invalid='ignore'):
+            cur_angular_speed = (cur_angular_speed + 180) % (360) - 180
+
+        # Change units from degrees per frame to degrees per second
+        cur_angular_speed = cur_angular_speed / time
+
+        # Sign the direction for dorsal/ventral locomotion.
+        # if ventral_mode is anything but anticlockwise, then negate
+        # angular_speed:
+        if(ventral_mode < 2):
+            cur_angular_speed = -cur_angular_speed
+
+        # 3) Sign the speed.
+        # ------------------------------------------------------------
+        #   We want to know how the worm's movement direction compares
+        #   to the average angle it had (apparently at the start)
+        cur_motion_direction = np.degrees(np.arctan2(dY, dX))
+
+        # This recentres the definition, as we are really just concerned
+        # with the change, not with the actual value
+        body_direction = cur_motion_direction - avg_body_angle[left_I]
+
+        # Force all angles to be within -pi and pi
+        with np.errstate(invalid='ignore'):
+            body_direction = (body_direction + 180) % (360) - 180
+
+            # Sign speed[i] as negative if the angle
+            # body_direction[i] lies in Q2 or Q3
+            cur_speed[abs(body_direction) > 90] *= -1
+
+            # (Added for wormPathCurvature)
+            # Sign motion_direction[i] as negative if the angle
+            # body_direction[i] lies in Q3 or Q4
+            cur_motion_direction[body_direction < 0] *= -1
+
+        speed[np.ix_(rows, keep_I)] = cur_speed
+        angular_speed[np.ix_(rows, keep_I)] = cur_angular_speed
+        motion_direction[np.ix_(rows, keep_I)] = cur_motion_direction
 
     if(ventral_mode == 2):  # i.e. if ventral side is anticlockwise:
         motion_direction = -motion_direction
@@ -529,6 +469,74 @@ def compute_speed(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
     return speed, angular_speed, motion_direction
 
 
+def h__getPartitionWeights(partitions, num_points):
+    """
+    Returns a (num_partitions, num_points) array in which each row is 1 over
+    the partition's range of points and 0 elsewhere.
+    """
+    weights = np.zeros((len(partitions), num_points))
+    for i, (start, stop) in enumerate(partitions):
+        weights[i, start:stop] = 1
+
+    return weights
+
+
+def h__getPartitionMeans(skeleton_x, skeleton_y, partitions):
+    """
+    The mean x and y of each partition, for each frame.
+
+    As with np.mean, a partition's mean is NaN for a frame if any of the
+    points of that partition are NaN.
+
+    Returns
+    -------
+    (x_mean, y_mean) : numpy arrays of shape (num_partitions, n)
+    """
+    weights = h__getPartitionWeights(partitions, np.shape(skeleton_x)[0])
+    num_points = np.sum(weights, axis=1)[:, None]
+
+    output = []
+    for data in (skeleton_x, skeleton_y):
+        nan_mask = np.isnan(data)
+        means = np.dot(weights, np.where(nan_mask, 0, data)) / num_points
+        means[np.dot(weights, nan_mask) > 0] = np.nan
+        output.append(means)
+
+    return output
+
+
+def h__getPartitionAngles(skeleton_x, skeleton_y, partitions):
+    """
+    Batched form of get_angles(segment_x, segment_y, head_to_tail=False),
+    computed for each partition of the skeleton.
+
+    Going from tail to head (head_to_tail=False) simply negates the
+    differences between sequential points so we can work with the skeleton
+    as stored and negate the mean.
+
+    Returns
+    -------
+    numpy array of shape (num_partitions, n), in degrees
+    """
+
+    # A partition of p points has p-1 differences
+    diff_partitions = [(start, stop - 1) for start, stop in partitions]
+    weights = h__getPartitionWeights(diff_partitions,
+                                     np.shape(skeleton_x)[0] - 1)
+
+    average_diffs = []
+    for data in (skeleton_x, skeleton_y):
+        diffs = np.diff(data, n=1, axis=0)
+        is_valid = ~np.isnan(diffs)
+        totals = np.dot(weights, np.where(is_valid, diffs, 0))
+        counts = np.dot(weights, is_valid)
+        # As with np.nanmean, a partition without any valid values is NaN
+        with np.errstate(invalid='ignore', divide='ignore'):
+            average_diffs.append(-totals / counts)
+
+    return np.degrees(np.arctan2(average_diffs[1], average_diffs[0]))
+
+
 def get_frames_per_sample(fps, sample_time):
     """
     Converts a specified sample_time from seconds to # of samples.
@@ -24,6 +24,14 @@ import pandas as pd
 
 from .. import config
 
+# The values of VideoInfo.segmentation_status, which are indexed by
+# VideoInfo.segmentation_status_code
+SEGMENTATION_STATUS_CHARS = np.array(['s', 'm', 'd', 'f'])
+
+# For frame codes 0 to 4, the index into SEGMENTATION_STATUS_CHARS.
+# Codes past the end of this table are treated as 4.
+_FRAME_CODE_TO_STATUS_CODE = np.array([3, 0, 1, 2, 3], dtype=np.uint8)
+
 
 class VideoInfo(object):
     """
@@ -172,6 +180,25 @@ class VideoInfo(object):
         """
         return self.frame_code == 1
 
+    @property
+    def segmentation_status_code(self):
+        """
+        The segmentation status as a compact uint8 array, holding indices
+        into SEGMENTATION_STATUS_CHARS (see segmentation_status)
+
+        """
+        try:
+            return self._segmentation_status_code
+        except AttributeError:
+            # Frame codes above 3 (and any invalid values) are clipped onto
+            # the last entry, i.e. segmentation failed
+            with np.errstate(invalid='ignore'):
+                frame_code = np.asarray(self.frame_code).astype(np.int64)
+            self._segmentation_status_code = np.take(
+                _FRAME_CODE_TO_STATUS_CODE, frame_code, mode='clip')
+
+            return self._segmentation_status_code
+
     @property
     def segmentation_status(self):
         """
@@ -184,25 +211,8 @@ class VideoInfo(object):
             f = Segmentation failed (aka frame codes 100+)
 
         """
-        try:
-            return self._segmentation_status
-        except AttributeError:
-            s = self.frame_code == 1
-            m = self.frame_code == 2
-            d = self.frame_code == 3
-
-            self._segmentation_status = np.empty(self.num_frames, dtype='<U1')
-            for frame_index in range(self.num_frames):
-                if s[frame_index]:
-                    self._segmentation_status[frame_index] = 's'
-                elif m[frame_index]:
-                    self._segmentation_status[frame_index] = 'm'
-                elif d[frame_index]:
-                    self._segmentation_status[frame_index] = 'd'
-                else:
-                    self._segmentation_status[frame_index] = 'f'
-
-            return self._segmentation_status
+        return np.take(SEGMENTATION_STATUS_CHARS,
+                       self.segmentation_status_code)
 
 
 class ExperimentInfo(object):
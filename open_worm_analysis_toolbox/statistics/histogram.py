@@ -23,35 +23,58 @@ https://github.com/JimHokanson/SegwormMatlabClasses/blob/master/
 import scipy as sp
 import numpy as np
 
-from .. import config, utils
+from .. import utils
 
 #%%
 
 
+def _std_from_moments(num_valid_samples, m2):
+    """
+    The (population) standard deviation given the # of valid samples and
+    the sum of squared differences from the mean. NaN if there are no valid
+    samples.
+
+    """
+    if num_valid_samples == 0:
+        return np.nan
+    else:
+        return np.sqrt(m2 / num_valid_samples)
+
+
 class Histogram(object):
     """
     Encapsulates the notion of a single histogram for a single feature.
 
     All bins in this histogram have an equal bin width.
 
-    A Histogram object can be created by one of two class methods:
+    A Histogram object can be created by one of three class methods:
         1. create_histogram factory method, which accepts raw data.
         2. merged_histogram_factory method, which accepts a list of
            histograms and then returns a new, merged, histogram from them.
+        3. from_counts, which accepts previously computed counts and
+           moments, e.g. from a HistogramStore.
 
     Attributes
     -----------------
     name
-    data: numpy array - this may contain NaN values
     specs: open_worm_analysis_toolbox.features.worm_features.FeatureProcessingSpec
     histogram_type: str
     motion_type: str
     data_type: str
 
+    bin_offset: int
+    num_bins: int
+    sparse_bin_indices: numpy array of ints
+    sparse_counts: numpy array of ints
     counts: numpy array of ints
     pdf: numpy array of floats
     mean: float
+    std: float
     num_samples: int
+        Includes NaN values
+    num_valid_samples: int
+    m2: float
+        The sum of squared differences from the mean, of the valid samples
     bin_boundaries: numpy array
     bin_midpoints: numpy array
     first_bin_midpoint: float
@@ -59,10 +82,14 @@ class Histogram(object):
 
     Notes
     -----------------
+    The raw data is not kept. Only the counts and the moments (number of
+    valid samples, mean and m2) are, which is all that is needed to merge
+    histograms, see MergedHistogram.
+
+    See HistogramStore for saving histograms to disk.
+
     TODO: Missing Features:
-        - saving to disk
         - version comparison
-        - allow loading from a saved file
 
     """
     #%%
@@ -105,7 +132,7 @@ missing_dependency: False
          """
                 
         # The underlying data itself
-        self.data = feature.value
+        data = feature.value
         #JAH: Any requirements on the data???
         #   - ideally we would have a NaN version here
         #   - self.valid_data
@@ -126,10 +153,11 @@ missing_dependency: False
         #   Yes - although the name has been made unique by feature expansion
         #   (if done)
 
-        if self.data is not None:
+        if data is not None:
             # Find a set of bins that will cover the data
-            # i.e. populate self.bin_boundaries
-            self.compute_covering_bins()
+            # i.e. populate self.bin_offset, self.sparse_counts, etc.
+            self.compute_covering_bins(data)
+            self.compute_moments(data)
 
     #%%
     @classmethod
@@ -167,16 +195,48 @@ missing_dependency: False
             return None
         else:
             return cls(feature)
+
+    @classmethod
+    def from_counts(cls, specs, bin_offset, num_bins, sparse_bin_indices,
+                    sparse_counts, num_samples, num_valid_samples, mean, m2):
+        """
+        Create a Histogram from its counts and moments rather than from
+        the raw data.
+
+        Parameters
+        ------------------
+        specs: FeatureProcessingSpec
+        bin_offset: int
+        num_bins: int
+        sparse_bin_indices: numpy array of ints
+            The non-empty bins, relative to bin_offset
+        sparse_counts: numpy array of ints
+        num_samples: int
+        num_valid_samples: int
+        mean: float
+        m2: float
+
+        """
+        hist = cls.__new__(cls)
+        hist.specs = specs
+        hist.name = specs.name
+
+        hist.bin_offset = int(bin_offset)
+        hist.num_bins = int(num_bins)
+        hist.sparse_bin_indices = np.asarray(sparse_bin_indices)
+        hist.sparse_counts = np.asarray(sparse_counts)
+
+        hist._num_samples = int(num_samples)
+        hist.num_valid_samples = int(num_valid_samples)
+        hist._mean = mean
+        hist.m2 = m2
+
+        return hist
     #%%
 
     @property
     def num_samples(self):
-        try:
-            return self._num_samples
-        except AttributeError:
-            self._num_samples = len(self.data)
-
-            return self._num_samples
+        return self._num_samples
 
     def __repr__(self):
         return utils.print_object(self)
@@ -200,41 +260,63 @@ missing_dependency: False
     def last_bin_midpoint(self):
         return self.bin_midpoints[-1]
 
-    @property
-    def num_bins(self):
+    #%%
+
+    def compute_moments(self, data):
         """
-        An integer; the number of bins.
+        Compute the # of samples and the moments of the data.
+
+        Parameters
+        ----------
+        data: numpy array
+            This may contain NaN values, which are ignored
+
+        Returns
+        -------
+        None
+            However, self.num_samples, self.num_valid_samples, self.mean and
+            self.m2 are populated.
 
         """
-        return len(self.bin_midpoints)
-    #%%
+        self._num_samples = len(data)
 
-    def compute_covering_bins(self):
+        data = np.ravel(data)
+        data = data[~np.isnan(data)]
+
+        self.num_valid_samples = data.size
+        if data.size == 0:
+            self._mean = np.NaN
+            self.m2 = np.NaN
+        else:
+            self._mean = np.mean(data)
+            self.m2 = np.sum((data - self._mean) ** 2)
+
+    def compute_covering_bins(self, data):
         """
-        Compute histogram bin boundaries that will be enough to cover
-        the given data
+        Compute the histogram bins that will be enough to cover the given
+        data, and the counts in each bin
 
         Parameters
         ----------
-        None, but we will use member variables:
-        self.data: numpy array
+        data: numpy array
             This is the data for which we must have enough bins to cover
+        
+        We will also use member variables:
         self.bin_width: float
             The width of the bins
 
         Returns
         -------
         None
-            However, self.bin_boundaries, a numpy array, is populated.
-            The bin_boundaries are the boundaries of the bins that will
-            accomodate the data given.
+            However, self.bin_offset, self.sparse_bin_indices and
+            self.sparse_counts are populated.
+            
+            Bin #k is [k*bin_width, (k+1)*bin_width), and the bins that
+            cover the data are bin_offset to bin_offset + num_bins - 1.
             All bins are right half-open except the last, which is closed.
-            i.e. if the array edges = (a1, a2, ..., a(n+1) was returned,
-                 there are n bins and
-                 bin #1 = [a1, a2)
-                 bin #2 = [a2, a3)
-                 ...
-                 bin #n = [an, an+1]
+            Only the non-empty bins are stored: sparse_bin_indices (relative
+            to bin_offset) and their sparse_counts. See bin_boundaries and
+            counts for the dense view.
 
         Notes
         -----
@@ -249,73 +331,53 @@ missing_dependency: False
         -   New:
             -   boundaries -70 to 21
 
+        Since only the non-empty bins are stored, outliers don't cost any
+        memory beyond their own bin.
+
         Formerly:
         function [bins,edges] = h__computeBinInfo(data,bin_width)
 
         """
         bin_width = self.specs.bin_width
         
-        # Compute the data range.  We apply np.ravel because for some reason
+        # We apply np.ravel because for some reason
         # with posture.bends.head.mean the data was coming in like:
-        # >> self.data
+        # >> data
         # array([[-33.1726576 ], [-33.8501644 ],[-32.60058523], ...])
         # Applying ravel removes any extraneous array structure so it becomes:
         # array([-33.1726576, -33.8501644, -32.60058523, ...])
-        min_data = np.nanmin(np.ravel(self.data))
-        max_data = np.nanmax(np.ravel(self.data))
-        
-        #Is this valid??????
-        #JAH 2018/09 - this is a bit of a patch ...
+        data = np.ravel(data)
+        data = data[np.isfinite(data)]
         
-        #No valid data gives min and max as NaNs
-        if np.isnan(min_data):
-            #Not for arange exact stopping is not respected ...
-            self.bin_boundaries = np.arange(0,1.01*bin_width,bin_width)
+        #No valid data gives a single empty bin
+        if data.size == 0:
+            self.bin_offset = 0
+            self.num_bins = 1
+            self.sparse_bin_indices = np.array([], dtype=np.int64)
+            self.sparse_counts = np.array([], dtype=np.int64)
             return
 
-        
-
         # Let's "snap the bins to a grid" if you will, so that they will
         # line up when we try to merge multiple histograms later.
         # so if the bin_width = 2 and the min_data = 11, we will
         # start the first bin at 10, since that is a multiple of the
         # bin width.
-        min_boundary = np.floor(min_data / bin_width) * bin_width
-        max_boundary = np.ceil(max_data / bin_width) * bin_width
-
-        # If we have a singular value, then we will get a singular edge,
-        # which isn't good for binning. We always need to make sure that
-        # our data is bounded by a high and low end. Given how hist works
-        # (it is inclusive on the low end, when we only have one edge we
-        # add a second edge by increasing the high end, NOT by decreasing
-        # the low end.
-        #
-        # i.e. In Matlab you can't bound 3 by having edges at 2 & 3, the
-        #      edges would need to be at 3 & 4
-        if min_boundary == max_boundary:
-            max_boundary = min_boundary + bin_width
-
-        num_bins = (max_boundary - min_boundary) / bin_width
-
-        if num_bins > config.MAX_NUMBER_BINS:
-            raise Exception("Given the specified resolution of " +
-                            str(bin_width) + ", the number of data " +
-                            "bins exceeds the maximum, which has been " +
-                            "set to MAX_NUMBER_BINS = " +
-                            str(config.MAX_NUMBER_BINS))
+        bin_indices = np.floor(data / bin_width).astype(np.int64)
 
+        # The last bin is closed, i.e. if the maximum falls exactly on a
+        # bin edge it goes in the bin below that edge. This is not the case
+        # if it is also the minimum, since then we would have no bins; like
+        # Matlab's hist we add a bin on the high end, NOT on the low end.
+        min_bin = bin_indices.min()
+        max_bin = max(int(np.ceil(data.max() / bin_width)) - 1, min_bin)
+        bin_indices = np.minimum(bin_indices, max_bin)
 
+        unique_indices, counts = np.unique(bin_indices, return_counts=True)
 
-        self.bin_boundaries = np.arange(min_boundary,
-                                        max_boundary + bin_width,
-                                        step=bin_width)
-
-
-        # Because of the nature of floating point figures we can't guarantee
-        # that these asserts work without the extra buffer of + self.bin_width
-        # (though this bound could probably be greatly improved)
-        assert(min_data >= self.bin_boundaries[0] - bin_width)
-        assert(max_data <= self.bin_boundaries[-1] + bin_width)
+        self.bin_offset = min_bin
+        self.num_bins = max_bin - min_bin + 1
+        self.sparse_bin_indices = unique_indices - min_bin
+        self.sparse_counts = counts
 
     @property
     def bin_width(self):
@@ -325,6 +387,15 @@ missing_dependency: False
         """
         return self.specs.bin_width
 
+    @property
+    def bin_boundaries(self):
+        """
+        The boundaries of all of the bins. See compute_covering_bins().
+
+        """
+        bin_width = self.specs.bin_width
+        return (self.bin_offset + np.arange(self.num_bins + 1)) * bin_width
+
     @property
     def bin_midpoints(self):
         """
@@ -347,18 +418,15 @@ missing_dependency: False
         Returns
         ----------------
         numpy array of int
-            The values of the histogram
+            The values of the histogram, for all bins (including the empty
+            ones)
 
         """
         try:
             return self._counts
         except AttributeError:
-            try:
-                self._counts, _ = np.histogram(self.data,
-                                           bins=self.bin_boundaries)
-            except ValueError:
-                self._counts, _ = np.histogram(self.data[~np.isnan(self.data)],
-                                           bins=self.bin_boundaries)
+            self._counts = np.zeros(self.num_bins, dtype=np.int64)
+            self._counts[self.sparse_bin_indices] = self.sparse_counts
 
             return self._counts
 
@@ -385,40 +453,37 @@ missing_dependency: False
     @property
     def mean(self):
         """
-        A float.  The mean of the data.
+        A float.  The mean of the data (ignoring NaN values).
 
         """
-        try:
-            return self._mean
-        except AttributeError:
-            self._mean = np.nanmean(self.data)
-
-            return self._mean
+        return self._mean
 
     @property
     def std(self):
         """
-        The standard deviation.
+        The standard deviation (ignoring NaN values).
 
         """
-        try:
-            return self._std
-        except AttributeError:
-            num_samples = len(self.data)
-            if num_samples == 1:
-                self._std = 0
-            else:
-                self._std = np.nanstd(self.data)
-                #JAH 2018/09 => not handling nan properly, using nanstd instead
-                # We can optimize standard deviation computation
-                # since we've already calculated the mean above
-                #self._std = np.sqrt \
-                #    (
-                #        (1 / (num_samples - 1)) *
-                #        sum((self.data - self.mean)**2)
-                #    )
+        if self.num_samples == 1:
+            return 0
+        else:
+            return _std_from_moments(self.num_valid_samples, self.m2)
 
-            return self._std
+    def merge(self, other):
+        """
+        Merge with another histogram of the same feature.
+
+        Parameters
+        ------------------
+        other: Histogram or MergedHistogram
+
+        Returns
+        ------------------
+        MergedHistogram
+            A new instance. The videos of other come after those of self.
+
+        """
+        return MergedHistogram.merged_histogram_factory([self, other])
 
     @property
     def num_videos(self):
@@ -437,6 +502,11 @@ class MergedHistogram(Histogram):
     A Histogram, plus some extra data about the individual histograms
     that make it up.
 
+    Merged histograms only hold the counts and the moments of the underlying
+    histograms, never the raw data. They can be merged with each other
+    (see merge()) in O(# of bins) and the merging is associative, so
+    histograms from many videos can be merged as they become available.
+
     Extra attributes:
     --------------------
     name
@@ -445,7 +515,13 @@ class MergedHistogram(Histogram):
         this merged histogram.
     std_per_video: numpy array of floats
         Same as mean_per_video but for standard deviation.
+    m2_per_video: numpy array of floats
     num_samples_per_video: numpy array of ints
+    num_valid_samples_per_video: numpy array of ints
+    pooled_mean: float
+        The mean of all of the (valid) samples of all of the videos. This
+        is different from the mean, which is the mean of mean_per_video.
+    pooled_std: float
     num_videos: int
     num_valid_videos: int
     all_videos_valid: bool
@@ -455,11 +531,42 @@ class MergedHistogram(Histogram):
     """
 
     def __init__(self, specs):
-        self.data = None
         self.specs = specs
         #super(MergedHistogram, self).__init__(data, specs)
 
     #%%
+    @classmethod
+    def from_histogram(cls, histogram):
+        """
+        Create a MergedHistogram from a single Histogram.
+
+        Parameters
+        ------------------
+        histogram: Histogram
+
+        """
+        merged_hist = cls(specs=histogram.specs)
+        merged_hist.name = histogram.name
+
+        merged_hist.bin_offset = histogram.bin_offset
+        merged_hist.num_bins = histogram.num_bins
+        merged_hist.sparse_bin_indices = histogram.sparse_bin_indices
+        merged_hist.sparse_counts = histogram.sparse_counts
+
+        merged_hist._num_samples = histogram.num_samples
+        merged_hist.num_valid_samples = histogram.num_valid_samples
+        merged_hist.pooled_mean = histogram.mean
+        merged_hist.m2 = histogram.m2
+
+        merged_hist.num_samples_per_video = np.array([histogram.num_samples])
+        merged_hist.num_valid_samples_per_video = \
+            np.array([histogram.num_valid_samples])
+        merged_hist.mean_per_video = np.array([histogram.mean])
+        merged_hist.std_per_video = np.array([histogram.std])
+        merged_hist.m2_per_video = np.array([histogram.m2])
+
+        return merged_hist
+
     @classmethod
     def merged_histogram_factory(cls, histograms):
         """
@@ -487,7 +594,7 @@ class MergedHistogram(Histogram):
 
         Parameters
         ------------------
-        histograms: a list of Histogram objects
+        histograms: a list of Histogram (or MergedHistogram) objects
 
         Returns
         ------------------
@@ -500,75 +607,99 @@ class MergedHistogram(Histogram):
         """
         
         #Note: Some histograms may be none ...
-        histograms = [x for x in histograms if x is not None]
+        histograms = [x if isinstance(x, MergedHistogram)
+                      else cls.from_histogram(x)
+                      for x in histograms if x is not None]
         
         if len(histograms) == 0:
             return None
         
-        
         # Create an output object with same meta properties
         merged_hist = cls(specs=histograms[0].specs)
         merged_hist.name = histograms[0].name
 
-        # Let's concatenate all the underlying data in case anyone downstream
-        # wants to see it.  It's not needed for the bin and count calculation,
-        # since we do that efficiently by aligning the bins.
-        merged_hist.data = np.concatenate([x.data for x in histograms])
-
-        # Align all bins
+        # Align all bins and sum the counts
         # ---------------------------------------------------------------
-        num_bins = [x.num_bins for x in histograms]
-        first_bin_midpoints = [x.first_bin_midpoint for x in histograms]
-        min_bin_midpoint = min(first_bin_midpoints)
-        max_bin_midpoint = max([x.last_bin_midpoint for x in histograms])
-
-        cur_bin_width = merged_hist.specs.bin_width
-        new_bin_midpoints = np.arange(min_bin_midpoint,
-                                      max_bin_midpoint + cur_bin_width,
-                                      step=cur_bin_width)
-
-        # Colon operator was giving warnings about non-integer indices :/
-        # - @JimHokanson
-        start_indices = ((first_bin_midpoints - min_bin_midpoint) /
-                         cur_bin_width)
-        start_indices = start_indices.round()
-        end_indices = start_indices + num_bins
-
-        num_histograms = len(histograms)
-        new_counts = np.zeros((num_histograms, len(new_bin_midpoints)))
-
-        start_indices = start_indices.astype(np.int64)
-        end_indices = end_indices.astype(np.int64)
-
-        for i in range(num_histograms):
-            cur_start = start_indices[i]
-            if not np.isnan(cur_start):
-                cur_end = end_indices[i]
-                new_counts[i, cur_start:cur_end] = histograms[i].counts
-
-        num_samples_array = np.array([x.num_samples for x in histograms])
+        # All bins are on the same grid so we can align them using the
+        # integer bin offsets. Only the non-empty bins are merged.
+        bin_offsets = np.array([x.bin_offset for x in histograms])
+        bin_ends = bin_offsets + [x.num_bins for x in histograms]
+        min_bin_offset = bin_offsets.min()
+
+        merged_hist.bin_offset = min_bin_offset
+        merged_hist.num_bins = bin_ends.max() - min_bin_offset
+
+        all_bin_indices = np.concatenate(
+            [x.bin_offset - min_bin_offset + x.sparse_bin_indices
+             for x in histograms])
+        all_counts = np.concatenate([x.sparse_counts for x in histograms])
+
+        merged_hist.sparse_bin_indices, unique_I = \
+            np.unique(all_bin_indices, return_inverse=True)
+        merged_hist.sparse_counts = \
+            np.bincount(unique_I, weights=all_counts,
+                        minlength=len(merged_hist.sparse_bin_indices)
+                        ).astype(np.int64)
+
+        # Combine the moments
+        # ---------------------------------------------------------------
+        # This is the parallel form of Welford's algorithm (Chan et al.)
+        # for any number of sets of samples at once
+        n = np.array([x.num_valid_samples for x in histograms])
+        means = np.array([x.pooled_mean for x in histograms])
+        m2s = np.array([x.m2 for x in histograms])
+        is_valid = n > 0
+
+        merged_hist._num_samples = sum(x.num_samples for x in histograms)
+        merged_hist.num_valid_samples = n.sum()
+        if merged_hist.num_valid_samples == 0:
+            merged_hist.pooled_mean = np.nan
+            merged_hist.m2 = np.nan
+        else:
+            n = n[is_valid]
+            means = means[is_valid]
+            merged_hist.pooled_mean = np.sum(n * means) / n.sum()
+            merged_hist.m2 = \
+                np.sum(m2s[is_valid]) + \
+                np.sum(n * (means - merged_hist.pooled_mean) ** 2)
 
         # Update final properties
         # Note that each of these is now no longer a scalar as in the
         # single-video case; it is now a numpy array
         # ---------------------------------------------------------------
-        merged_hist._bin_midpoints = new_bin_midpoints
-        merged_hist._counts = new_counts
-        merged_hist._pdf = (sum(merged_hist._counts, 0) /
-                            sum(num_samples_array))
+        for attr_name in ['num_samples_per_video',
+                          'num_valid_samples_per_video',
+                          'mean_per_video',
+                          'std_per_video',
+                          'm2_per_video']:
+            setattr(merged_hist, attr_name,
+                    np.concatenate([getattr(x, attr_name)
+                                    for x in histograms]))
+
+        return merged_hist
 
-        merged_hist.mean_per_video = \
-            np.array([x.mean for x in histograms])
+    @property
+    def pdf(self):
+        """
+        The probability distribution function (PDF), over the samples of
+        all videos.
 
-        merged_hist.std_per_video = \
-            np.array([x.std for x in histograms])
+        """
+        try:
+            return self._pdf
+        except AttributeError:
+            self._pdf = self.counts / self.num_samples
 
-        merged_hist.num_samples_per_video = \
-            np.array([x.num_samples for x in histograms])
+            return self._pdf
 
-        merged_hist._num_samples = sum(merged_hist.num_samples_per_video)
+    @property
+    def pooled_std(self):
+        """
+        The standard deviation of all of the (valid) samples of all of the
+        videos.
 
-        return merged_hist
+        """
+        return _std_from_moments(self.num_valid_samples, self.m2)
 
     @property
     def mean(self):
@@ -588,6 +719,7 @@ class MergedHistogram(Histogram):
             # I'm pretty sure this is not very good; we should be calculating
             # standard deviation from a concatenation of the underlying data,
             # not from just the means of the videos. - @MichaelCurrie
+            # (see pooled_std)
             self._std = np.std(self.mean_per_video)
 
             return self._std
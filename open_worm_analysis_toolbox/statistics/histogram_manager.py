@@ -4,6 +4,7 @@
 Entry Point
 -----------
 mv.HistogramManager(feature_path_or_object_list)
+mv.HistogramManager.from_store(store_file_path, feature_names)
 
 The current processing approach is to take a set of features from an
 experiment and to summarize each of these features as a binned data set
@@ -19,6 +20,8 @@ than just having a list of histograms.
 Formerly SegwormMatlabClasses/+seg_worm/+stats/@hist/manager.m
 
 """
+import multiprocessing
+
 import h5py
 import numpy as np
 import six  # For compatibility with Python 2.x
@@ -30,6 +33,7 @@ from .. import utils
 from ..features.worm_features import WormFeatures
 
 from .histogram import Histogram, MergedHistogram
+from .histogram_store import HistogramStore
 
 # This is where I'd like to go with things ...
 # Names need some work
@@ -52,6 +56,33 @@ class HistogramSet(object):
 #===================================================
 
 
+def _get_histograms(worm_features):
+    """
+    Returns
+    -------
+    (list, numpy array)
+        The names of the features, and their histograms (None if a feature
+        has no data)
+
+    """
+    hist_names = [x.spec.name for x in worm_features]
+    histograms = np.array([Histogram.create_histogram(f)
+                           for f in worm_features])
+
+    return hist_names, histograms
+
+
+def _get_file_histograms(file_path):
+    """
+    Load the features from a file and compute their histograms.
+
+    This is run in the worker processes of HistogramManager so it needs to
+    be defined at the module level.
+
+    """
+    return _get_histograms(WormFeatures.from_disk(file_path))
+
+
 #%%
 class HistogramManager(object):
     """
@@ -73,7 +104,8 @@ class HistogramManager(object):
     """
     #%%
 
-    def __init__(self, feature_path_or_object_list, verbose=False):
+    def __init__(self, feature_path_or_object_list, verbose=False,
+                 n_processes=None):
         """
         Parameters
         ----------
@@ -83,6 +115,12 @@ class HistogramManager(object):
         feature_path_or_object_list: list of strings or feature objects
             Full paths to all feature files making up this histogram, or
             their in-memory object equivalents.
+        verbose : bool
+        n_processes : int (optional)
+            The number of processes used to load the feature files and
+            compute their histograms. Defaults to the number of CPUs. Use
+            1 to do everything in this process. In-memory feature objects
+            are always processed in this process.
 
         Outline:
         -------
@@ -100,57 +138,76 @@ class HistogramManager(object):
             print("Number of feature files passed into the histogram manager:",
                   len(feature_path_or_object_list))
 
-        # This will have shape (len(feature_path_or_object_list), 726)
-        temp_hist_array = []
-        
-        all_hist_names = [];
-
         n_videos = len(feature_path_or_object_list)
 
-        # Loop over all feature files and get histogram objects for each
-        for feature_path_or_object in feature_path_or_object_list:
-            worm_features = None
+        # For each video, the names of the features and their histograms.
+        # This will have len(feature_path_or_object_list) entries with
+        # ~726 histograms each.
+        video_histograms = [None] * n_videos
+
+        # Feature files are loaded, and their histograms computed, in
+        # separate processes. Only the histograms are sent back, so we never
+        # hold onto more than a few sets of features at a time.
+        file_I = [i for i, x in enumerate(feature_path_or_object_list)
+                  if isinstance(x, six.string_types)]
+
+        if n_processes != 1 and len(file_I) > 1:
+            pool = multiprocessing.Pool(n_processes)
+            try:
+                file_paths = [feature_path_or_object_list[i] for i in file_I]
+                for i, cur_histograms in \
+                        zip(file_I, pool.imap(_get_file_histograms,
+                                              file_paths)):
+                    video_histograms[i] = cur_histograms
+            except:
+                # Don't wait for the remaining files if one has failed
+                pool.terminate()
+                raise
+            else:
+                pool.close()
+            finally:
+                pool.join()
+
+        # Loop over all remaining feature files and get histogram objects
+        # for each
+        for i, feature_path_or_object in \
+                enumerate(feature_path_or_object_list):
+            if video_histograms[i] is not None:
+                continue
 
             if isinstance(feature_path_or_object, six.string_types):
                 # If we have a string, it's a filepath to an HDF5 feature file
-                file_path = feature_path_or_object
-                worm_features = WormFeatures.from_disk(file_path)
+                video_histograms[i] = \
+                    _get_file_histograms(feature_path_or_object)
             else:
                 # Otherwise the worm features have been passed directly
                 # as an instance of WormFeatures (we hope)
-                worm_features = feature_path_or_object
+                video_histograms[i] = \
+                    _get_histograms(feature_path_or_object)
 
-            # TODO: Need to add on info to properties
-            # worm_features.info -> obj.info
-
-            new_histogram_set = self.init_histograms(worm_features)
-            
-            #Note that names from features are always valid, unlike
-            #the histogram
-            hist_names = np.array([x.spec.name for x in worm_features])
-            
-            temp_hist_array.append(new_histogram_set)
+        # TODO: Need to add on info to properties
+        # worm_features.info -> obj.info
 
+        #Note that names from features are always valid, unlike
+        #the histogram
+        all_hist_names = []
+        for hist_names, _ in video_histograms:
             all_hist_names.extend(hist_names)
 
-
         unique_names = np.unique(all_hist_names)
         
         n_features = len(unique_names)
+
+        name_to_row = {name: k for k, name in enumerate(unique_names)}
         
         #JAH: I rewrote this code to ensure that we had a matrix shaped
         #group of histograms, with None as the default value for missing
         hist_matrix = np.full([n_features,n_videos],None,object)
         
-        #TODO: This could be sped up a bit ...
-        for i in range(n_videos):
-            vid_hists = temp_hist_array[i]
+        for i, (_, vid_hists) in enumerate(video_histograms):
             for hist in vid_hists:
                 if hist is not None:
-                    hist_name = hist.name
-                    for k, name in enumerate(unique_names):
-                        if name == hist_name:
-                            hist_matrix[k,i] = hist
+                    hist_matrix[name_to_row[hist.name], i] = hist
         
         self.row_names = unique_names
         self.hist_matrix = hist_matrix
@@ -159,6 +216,55 @@ class HistogramManager(object):
         self.merged_histograms = \
             HistogramManager.merge_histograms(self.hist_matrix)
 
+    @classmethod
+    def from_store(cls, file_path, feature_names=None):
+        """
+        Load previously computed histograms from a HistogramStore.
+
+        Parameters
+        ----------
+        file_path : string
+            Path to the HistogramStore file
+        feature_names : list of strings (optional)
+            The features to load. Only these are read from the file.
+            Defaults to all features in the store.
+
+        See Also
+        --------
+        to_store
+
+        """
+        with HistogramStore(file_path, 'r') as store:
+            if feature_names is None:
+                feature_names = store.feature_names
+
+            hist_matrix = np.full([len(feature_names), store.num_videos],
+                                  None, object)
+            for i, name in enumerate(feature_names):
+                hist_matrix[i, :] = store.get_histograms(name)
+
+        self = cls.__new__(cls)
+        self.row_names = np.array(feature_names)
+        self.hist_matrix = hist_matrix
+        self.merged_histograms = cls.merge_histograms(hist_matrix)
+
+        return self
+
+    def to_store(self, file_path, overwrite=False):
+        """
+        Append the histograms of all videos to a HistogramStore, creating
+        it if it doesn't exist.
+
+        Parameters
+        ----------
+        file_path : string
+        overwrite : bool
+            If True, replace any existing file rather than appending to it
+
+        """
+        with HistogramStore(file_path, 'w' if overwrite else 'a') as store:
+            store.append(self)
+
     def __getitem__(self, index):
         return self.merged_histograms[index]
 
@@ -258,7 +364,7 @@ class HistogramManager(object):
 
         """
 
-        return np.array([Histogram.create_histogram(f) for f in worm_features])
+        return _get_histograms(worm_features)[1]
 
     @staticmethod
     def merge_histograms(hist_matrix, verbose=False):
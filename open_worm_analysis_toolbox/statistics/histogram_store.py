@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+An on-disk store of per-video histograms, which replaces pickling
+HistogramManager objects.
+
+Entry Point
+-----------
+with HistogramStore(file_path) as store:
+    store.append(histogram_manager)
+
+hm = HistogramManager.from_store(file_path, feature_names)
+
+File Layout
+-----------
+The store is an HDF5 file with one group per feature, so a feature can be
+read without touching any of the others. Appending videos only writes
+their new rows:
+
+/                    attrs: schema_version, num_videos
+/<feature name>      attrs: specs, the feature specification as JSON
+    histograms       one row per histogram, with the fields:
+                       video_index - the video (of the store)
+                       bin_offset, num_bins
+                       num_samples, num_valid_samples, mean, m2
+                       bins_end - the end of the histogram's rows in bins
+    bins             the non-empty bins of all histograms, with the fields:
+                       bin_index - relative to the histogram's bin_offset
+                       count
+
+Videos in which a feature has no histogram simply have no row.
+
+Each feature holds just two datasets as every HDF5 dataset carries a few
+KB of overhead, which would otherwise dominate the size of the file.
+
+"""
+import json
+
+import h5py
+import numpy as np
+
+from .. import utils
+from ..features.worm_features import FeatureProcessingSpec
+
+from .histogram import Histogram
+
+# This should be incremented whenever the layout above changes
+SCHEMA_VERSION = 1
+
+_HISTOGRAMS_DTYPE = np.dtype([('video_index', np.int64),
+                              ('bin_offset', np.int64),
+                              ('num_bins', np.int64),
+                              ('num_samples', np.int64),
+                              ('num_valid_samples', np.int64),
+                              ('mean', np.float64),
+                              ('m2', np.float64),
+                              ('bins_end', np.int64)])
+
+_BINS_DTYPE = np.dtype([('bin_index', np.int64),
+                        ('count', np.int64)])
+
+# Chunk sizes, in rows. The datasets are compressed so that the unused
+# part of the last chunk of each feature takes little space.
+_HISTOGRAMS_CHUNK_SIZE = 64
+_BINS_CHUNK_SIZE = 512
+
+
+class HistogramStore(object):
+    """
+    Histograms of many features for many videos, in an HDF5 file.
+
+    Attributes
+    ----------
+    file_path : string
+    num_videos : int
+        The total # of videos that have been appended to the store
+    feature_names : list of strings
+
+    See Also
+    --------
+    HistogramManager.from_store
+
+    """
+
+    def __init__(self, file_path, mode='a'):
+        """
+        Parameters
+        ----------
+        file_path : string
+        mode : string
+            'r' for read only, 'a' to create the file or append to it,
+            'w' to overwrite any existing file
+
+        """
+        self.file_path = file_path
+        self.h = h5py.File(file_path, mode)
+
+        if 'schema_version' not in self.h.attrs:
+            # Only a new (empty) file can become a store
+            if mode == 'r' or len(self.h.keys()) > 0:
+                self.h.close()
+                raise Exception('%s is not a histogram store' % file_path)
+            self.h.attrs['schema_version'] = SCHEMA_VERSION
+            self.h.attrs['num_videos'] = 0
+        elif self.h.attrs['schema_version'] != SCHEMA_VERSION:
+            version = self.h.attrs['schema_version']
+            self.h.close()
+            raise Exception('Histogram store %s has schema version %d, '
+                            'expected %d' % (file_path, version,
+                                             SCHEMA_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.h.close()
+
+    def __repr__(self):
+        return utils.print_object(self)
+
+    @property
+    def num_videos(self):
+        return int(self.h.attrs['num_videos'])
+
+    @property
+    def feature_names(self):
+        return list(self.h.keys())
+
+    def __contains__(self, feature_name):
+        return feature_name in self.h
+
+    def append(self, histogram_manager):
+        """
+        Add the videos of a HistogramManager to the store.
+
+        Only the new histograms are written, existing ones are not read.
+
+        Parameters
+        ----------
+        histogram_manager : HistogramManager
+
+        """
+        self.append_hist_matrix(histogram_manager.row_names,
+                                histogram_manager.hist_matrix)
+
+    def append_hist_matrix(self, row_names, hist_matrix):
+        """
+        Parameters
+        ----------
+        row_names : list of strings
+            The feature names for each row of hist_matrix
+        hist_matrix : [n_features x n_videos] numpy array of Histogram
+            None if a feature has no histogram for a video
+
+        """
+        first_video_index = self.num_videos
+
+        for name, row in zip(row_names, hist_matrix):
+            video_I = [i for i, h in enumerate(row) if h is not None]
+            if len(video_I) == 0:
+                continue
+
+            histograms = row[video_I]
+            g = self._get_feature_group(name, histograms[0].specs)
+
+            bins = np.zeros(sum(len(h.sparse_counts) for h in histograms),
+                            _BINS_DTYPE)
+            bins['bin_index'] = np.concatenate(
+                [h.sparse_bin_indices for h in histograms])
+            bins['count'] = np.concatenate(
+                [h.sparse_counts for h in histograms])
+
+            rows = np.zeros(len(histograms), _HISTOGRAMS_DTYPE)
+            rows['video_index'] = np.array(video_I) + first_video_index
+            for field in ('bin_offset', 'num_bins', 'num_samples',
+                          'num_valid_samples', 'mean', 'm2'):
+                rows[field] = [getattr(h, field) for h in histograms]
+            # The ends of the new bins follow on from the existing ones
+            rows['bins_end'] = g['bins'].shape[0] + \
+                np.cumsum([len(h.sparse_counts) for h in histograms])
+
+            h__appendToDataset(g['histograms'], rows)
+            h__appendToDataset(g['bins'], bins)
+
+        self.h.attrs['num_videos'] = \
+            first_video_index + hist_matrix.shape[1]
+
+    def _get_feature_group(self, name, specs):
+        """
+        Get the group of a feature, creating it if needed.
+
+        """
+        if name in self.h:
+            g = self.h[name]
+            bin_width = self.get_specs(name).bin_width
+            if bin_width != specs.bin_width:
+                raise Exception('The bin width of %s (%g) does not match '
+                                'the store (%g)' % (name, specs.bin_width,
+                                                    bin_width))
+            return g
+
+        g = self.h.create_group(name)
+
+        # The module etc. aren't needed to use the histograms
+        g.attrs['specs'] = json.dumps(
+            {key: value for key, value in vars(specs).items()
+             if isinstance(value, (str, bool, int, float))})
+
+        g.create_dataset('histograms', shape=(0,), dtype=_HISTOGRAMS_DTYPE,
+                         maxshape=(None,), chunks=(_HISTOGRAMS_CHUNK_SIZE,),
+                         compression='gzip')
+        g.create_dataset('bins', shape=(0,), dtype=_BINS_DTYPE,
+                         maxshape=(None,), chunks=(_BINS_CHUNK_SIZE,),
+                         compression='gzip')
+
+        return g
+
+    def get_specs(self, feature_name):
+        """
+        Returns
+        -------
+        FeatureProcessingSpec
+            The specification of the feature, as far as it was stored
+
+        """
+        specs = FeatureProcessingSpec.__new__(FeatureProcessingSpec)
+        specs.__dict__.update(
+            json.loads(self.h[feature_name].attrs['specs']))
+
+        return specs
+
+    def get_histograms(self, feature_name):
+        """
+        Read the histograms of a single feature.
+
+        Parameters
+        ----------
+        feature_name : string
+
+        Returns
+        -------
+        numpy array of Histogram
+            One entry for each video in the store, None for videos in which
+            the feature has no histogram
+
+        """
+        output = np.full(self.num_videos, None, object)
+
+        if feature_name not in self.h:
+            return output
+
+        g = self.h[feature_name]
+        specs = self.get_specs(feature_name)
+
+        rows = g['histograms'][()]
+        bins = g['bins'][()]
+        bins_start = np.concatenate(([0], rows['bins_end'][:-1]))
+
+        for row, start in zip(rows, bins_start):
+            cur_bins = bins[start:row['bins_end']]
+            output[row['video_index']] = Histogram.from_counts(
+                specs,
+                bin_offset=row['bin_offset'],
+                num_bins=row['num_bins'],
+                sparse_bin_indices=cur_bins['bin_index'],
+                sparse_counts=cur_bins['count'],
+                num_samples=row['num_samples'],
+                num_valid_samples=row['num_valid_samples'],
+                mean=row['mean'],
+                m2=row['m2'])
+
+        return output
+
+
+def h__appendToDataset(dataset, values):
+    """
+    Append rows to the end of a resizable 1D dataset.
+
+    """
+    if len(values) == 0:
+        return
+
+    n_existing = dataset.shape[0]
+    dataset.resize((n_existing + len(values),))
+    dataset[n_existing:] = values
@@ -44,6 +44,9 @@ class StatisticsManager(object):
         minimum p_wilcoxon from all objects in worm_statistics_objects
     min_q_wilcoxon: float
         minimum q_wilcoxon from all objects in worm_statistics_objects
+    feature_names: list of strings
+    results_table: Pandas dataframe
+        The results for all features, one row per feature
 
     (HELPER ATTRIBUTES:)
     valid_p_studentst_array: numpy array
@@ -54,6 +57,13 @@ class StatisticsManager(object):
         False Discovery Rate (FDR) (i.e. q-values) for p_studentst
     q_wilcoxon_array: numpy array
         False Discovery Rate (FDR) (i.e. q-values) for p_wilcoxon
+    t_statistic_array: numpy array
+        Student's t statistic for each feature
+    t_welch_array, p_welch_array: numpy array
+        Welch's t-test, which unlike the Student's t-test doesn't assume
+        equal variances, for each feature
+    z_wilcoxon_array: numpy array
+        The rank-sum statistic for each feature
 
     Methods
     ---------------------------------------
@@ -90,13 +100,42 @@ class StatisticsManager(object):
                len(ctl_histogram_manager))
         num_features = len(exp_histogram_manager)
 
+        # Run the tests for all features at once, on [n_videos x n_features]
+        # matrices of the means per video
+        exp_means = _get_mean_per_video_matrix(exp_histogram_manager)
+        ctl_means = _get_mean_per_video_matrix(ctl_histogram_manager)
+
+        self.t_statistic_array, p_studentst_array = \
+            utils.ttest_ind_2D(exp_means, ctl_means)
+        self.t_welch_array, self.p_welch_array = \
+            utils.ttest_ind_2D(exp_means, ctl_means, equal_var=False)
+        self.z_wilcoxon_array, p_wilcoxon_array = \
+            utils.ranksums_2D(exp_means, ctl_means)
+
+        self.feature_names = list(exp_histogram_manager.row_names)
+
         # Initialize a WormStatistics object for each of 726 features,
         # comparing experiment and control.
         self.worm_statistics_objects = np.array([None] * num_features)
         for feature_index in range(num_features):
-            self.worm_statistics_objects[feature_index] = WormStatistics(
-                exp_histogram_manager[feature_index],
-                ctl_histogram_manager[feature_index])
+            exp_histogram = exp_histogram_manager[feature_index]
+            ctl_histogram = ctl_histogram_manager[feature_index]
+            worm_statistics = WormStatistics(exp_histogram, ctl_histogram)
+            self.worm_statistics_objects[feature_index] = worm_statistics
+
+            if exp_histogram is None or ctl_histogram is None:
+                continue
+
+            # Use the batched results rather than having each object run
+            # its own tests. Fisher's exact test is still used, by the
+            # object, when only one of the two has valid videos.
+            worm_statistics._t_statistic = \
+                self.t_statistic_array[feature_index]
+            if not worm_statistics.is_exclusive:
+                worm_statistics._p_studentst = \
+                    p_studentst_array[feature_index]
+                worm_statistics._p_wilcoxon = \
+                    p_wilcoxon_array[feature_index]
 
         # Q-values, as introduced by Storey et al. (2002), attempt to
         # account for the False Discovery Rate from multiple hypothesis
@@ -138,6 +177,39 @@ class StatisticsManager(object):
         # Filter the NaN entries
         return p_wilcoxon_array[~np.isnan(p_wilcoxon_array)]
 
+    @property
+    def results_table(self):
+        """
+        Returns
+        -----------
+        Pandas dataframe
+            One row for each feature with the # of valid videos, the
+            means and the test results of the experiment vs the control.
+
+        """
+        return pd.DataFrame({
+            'feature_name': self.feature_names,
+            'num_exp_videos': [np.NaN if x.exp_histogram is None
+                               else x.exp_histogram.num_valid_videos
+                               for x in self.worm_statistics_objects],
+            'num_ctl_videos': [np.NaN if x.ctl_histogram is None
+                               else x.ctl_histogram.num_valid_videos
+                               for x in self.worm_statistics_objects],
+            'exp_mean': [np.NaN if x.exp_histogram is None
+                         else x.exp_histogram.mean
+                         for x in self.worm_statistics_objects],
+            'ctl_mean': [np.NaN if x.ctl_histogram is None
+                         else x.ctl_histogram.mean
+                         for x in self.worm_statistics_objects],
+            't_statistic': self.t_statistic_array,
+            'p_studentst': self.p_studentst_array,
+            'q_studentst': self.q_studentst_array,
+            't_welch': self.t_welch_array,
+            'p_welch': self.p_welch_array,
+            'z_wilcoxon': self.z_wilcoxon_array,
+            'p_wilcoxon': self.p_wilcoxon_array,
+            'q_wilcoxon': self.q_wilcoxon_array})
+
     @property
     def min_p_wilcoxon(self):
         return np.nanmin(self.p_wilcoxon_array)
@@ -189,6 +261,29 @@ class StatisticsManager(object):
             hspace=0.6)  # blank space between plots
 
 
+def _get_mean_per_video_matrix(histogram_manager):
+    """
+    Returns
+    -----------
+    numpy array [n_videos x n_features]
+        The mean of each video for each feature, in the order of the
+        videos of each merged histogram. NaN for invalid or missing
+        videos.
+
+    """
+    num_features = len(histogram_manager)
+    histograms = [histogram_manager[i] for i in range(num_features)]
+    num_videos = max([0] + [h.num_videos for h in histograms
+                            if h is not None])
+
+    means = np.full((num_videos, num_features), np.NaN)
+    for i, h in enumerate(histograms):
+        if h is not None:
+            means[:h.num_videos, i] = h.mean_per_video
+
+    return means
+
+
 #%%
 class WormStatistics(object):
     """
@@ -253,6 +348,9 @@ class WormStatistics(object):
         seg_worm.stats.helpers.swtest
 
         """
+        self.exp_histogram = exp_histogram
+        self.ctl_histogram = ctl_histogram
+
         if exp_histogram is None or ctl_histogram is None:
             self._z_score_experiment = np.NaN
             self._p_wilcoxon = np.NaN
@@ -269,8 +367,6 @@ class WormStatistics(object):
         #assert(exp_histogram.motion_type == ctl_histogram.motion_type)
         #assert(exp_histogram.data_type == ctl_histogram.data_type)
 
-        self.exp_histogram = exp_histogram
-        self.ctl_histogram = ctl_histogram
         self.USE_OLD_CODE = USE_OLD_CODE
 
     #%%
@@ -613,8 +709,12 @@ class WormStatistics(object):
 
         # Plot the Control histogram
         if use_alternate_plot:
-            x = self.exp_histogram.data
-            y = self.ctl_histogram.data
+            # The histograms don't hold the raw data so we use the bin
+            # midpoints, each repeated by its count
+            x = np.repeat(self.exp_histogram.bin_midpoints,
+                          self.exp_histogram.counts)
+            y = np.repeat(self.ctl_histogram.bin_midpoints,
+                          self.ctl_histogram.counts)
 
             truncated_length = min(len(x), len(y))
 
@@ -7,7 +7,6 @@ that are the equivalent of the same-named functions in Matlab, e.g. gausswin
 
 """
 from __future__ import division
-from itertools import groupby
 
 import os
 import sys
@@ -16,6 +15,7 @@ import csv
 
 import numpy as np
 import scipy as sp
+from scipy.ndimage import maximum_filter1d
 
 import matplotlib.pyplot as plt
 
@@ -25,6 +25,7 @@ __ALL__ = ['scatter',
            'plotx',
            'imagesc',
            'separated_peaks',
+           'separated_peaks_2D',
            'gausswin',
            'colon',
            'print_object'
@@ -110,9 +111,9 @@ def separated_peaks(x, dist, use_max, value_cutoff):
       True: find the maximum peaks
       False: find the minimum peaks
 
-    chainCodeLengths
-      The chain-code length at each index;
-      if empty, the array indices are used instead
+    value_cutoff
+      Peaks must be greater than (use_max) or less than (not use_max)
+      this value
 
 
     Returns
@@ -135,119 +136,123 @@ def separated_peaks(x, dist, use_max, value_cutoff):
     Used in seg_worm.feature_helpers.posture.getAmplitudeAndWavelength
     Used in locomotion_bends.py
 
-    See also MINPEAKSDIST, COMPUTECHAINCODELENGTHS
+    See also MINPEAKSDIST, COMPUTECHAINCODELENGTHS, separated_peaks_2D
 
     """
 
-    chain_code_lengths = colon(1, 1, x.size)
-
     # Is the vector larger than the search window?
     winSize = 2 * dist + 1
-    if chain_code_lengths[-1] < winSize:
+    if x.size < winSize:
         temp_I = np.argmax(x)
         return (x[temp_I], temp_I)
 
-    # xt - "x for testing" in some places in the code below
-    # it will be quicker (and/or easier) to assume that we want the largest
-    # value. By negating the data we can look for maxima (which will tell us
-    # where the minima are)
-    if not use_max:
-        xt = -1 * x
-    else:
-        xt = x
+    is_peak_mask = separated_peaks_2D(x[np.newaxis, :],
+                                      dist, use_max, value_cutoff)[0]
+
+    indices = is_peak_mask.nonzero()[0]
+    peaks = x[indices]
+
+    return (peaks, indices)
+
+
+def separated_peaks_2D(x, dist, use_max, value_cutoff):
+    """
+    Batched version of separated_peaks, finding the peaks in each row of
+    a 2D array (e.g. a set of spectra) in one call.
+
+    Parameters
+    ---------------------------------------
+    x: numpy array [n_rows x n_values]
+    dist, use_max, value_cutoff:
+      See separated_peaks
+
+    Returns
+    ---------------------------------------
+    is_peak_mask: boolean numpy array [n_rows x n_values]
+      True at the peaks of each row. As in separated_peaks, rows shorter
+      than the search window only have their maximum marked.
+
+    Notes
+    ---------------------------------------
+    A point can only be a peak if it is larger than both of its
+    neighbors (smaller for minima). Candidates are visited from the
+    largest down, and each visited candidate rules out the candidates
+    near it. A visited candidate is a peak if it is the largest value
+    in its window, which is looked up from a sliding window maximum
+    computed once for the whole array rather than per candidate.
+
+    """
+    n_rows, n_points = x.shape
+    is_peak_mask = np.zeros((n_rows, n_points), dtype=bool)
+
+    if n_points < 2 * dist + 1:
+        is_peak_mask[np.arange(n_rows), np.argmax(x, axis=1)] = True
+        return is_peak_mask
+
+    # The squared magnitude of an fft is complex with a zero imaginary
+    # part, Numpy orders complex values by their real part first
+    xr = x.real if np.iscomplexobj(x) else x
 
     # NOTE: I added left/right neighbor comparisions which really helped with
     # the fft ..., a point can't be a peak if it is smaller than either of its
     # neighbors
-
-    np_true = np.ones(1, dtype=np.bool)
+    #
+    # xt - "x for testing", by negating the data we can look for maxima
+    # (which will tell us where the minima are)
+    np_true = np.ones((n_rows, 1), dtype=bool)
     if use_max:
-        #                                           %> left                     > right
-        # Matlab version:
-        # could_be_a_peak = x > value_cutoff & [true x(2:end) > x(1:end-1)] &
-        # [x(1:end-1) > x(2:end) true];
-
-        # greater than values to the left
-        could_be_a_peak = (
-            x > value_cutoff) & np.concatenate(
-            (np_true, x[
-                1:] > x[
-                0:-1]))
-        # could_be_a_peak = np.logical_and(
-        # x > value_cutoff, np.concatenate((np.ones(1, dtype=np.bool), x[1:] >
-        # x[0:-1])))
-
-        # greater than values to the right
-        could_be_a_peak = could_be_a_peak & np.concatenate(
-            (x[0:-1] > x[1:], np_true))
-
-        # could_be_a_peak = np.logical_and(
-        # could_be_a_peak, np.concatenate((x[0:-1] > x[1:], np.ones(1,
-        # dtype=np.bool))))
-
-        I1 = could_be_a_peak.nonzero()[0]
-        I2 = np.argsort(-1 * x[I1])  # -1 => we want largest first
-        I = I1[I2]
+        xt = xr
+        could_be_a_peak = (xr > value_cutoff) & \
+            np.hstack((np_true, xr[:, 1:] > xr[:, :-1])) & \
+            np.hstack((xr[:, :-1] > xr[:, 1:], np_true))
     else:
-        #raise Exception("Not yet implemented")
-        # pdb.set_trace()
-        # could_be_a_peak = x < value_cutoff & [true x(2:end) < x(1:end-1)] & [x(1:end-1) < x(2:end) true];
-        #I1     = find(could_be_a_peak);
-        #[~,I2] = sort(x(I1));
-        #I = I1(I2);
-
-        could_be_a_peak = (
-            x < value_cutoff) & np.concatenate(
-            (np_true, x[
-                1:] < x[
-                0:-1]))
-        could_be_a_peak = could_be_a_peak & np.concatenate(
-            (x[0:-1] < x[1:], np_true))
-
-        I1 = could_be_a_peak.nonzero()[0]
-        I2 = np.argsort(x[I1])
-        I = I1[I2]
-
-    n_points = x.size
+        xt = -1 * xr
+        could_be_a_peak = (xr < value_cutoff) & \
+            np.hstack((np_true, xr[:, 1:] < xr[:, :-1])) & \
+            np.hstack((xr[:, :-1] < xr[:, 1:], np_true))
 
     # This code would need to be fixed if real distances
     # are input ...
-    too_close = dist - 1
-
-    temp_I = colon(0, 1, n_points - 1)
-    start_I = temp_I - too_close  # Note, separated by dist is ok
-    # This sets the off limits area, so we go in by 1
-    end_I = temp_I + too_close
-
-    start_I[start_I < 0] = 0
-    end_I[end_I > n_points] = n_points
-
-    is_peak_mask = np.zeros(n_points, dtype=bool)
-    # A peak and thus can not be used as a peak
-
-    for cur_index in I:
-        # NOTE: This gets updated in the loop so we can't just iterate
-        # over these values
-        if could_be_a_peak[cur_index]:
-            # NOTE: Even if a point isn't the local max, it is greater
-            # than anything that is by it that is currently not taken
-            # (because of sorting), so it prevents these points
-            # from undergoing the expensive search of determining
-            # whether they are the min or max within their
-            # else from being used, so we might as well mark those indices
-            # within it's distance as taken as well
-            temp_indices = slice(int(start_I[cur_index]), int(end_I[cur_index]))
-            could_be_a_peak[temp_indices] = False
-
-            # This line is really slow ...
-            # It would be better to precompute the max within a window
-            # for all windows ...
-            is_peak_mask[cur_index] = np.max(xt[temp_indices]) == xt[cur_index]
+    too_close = int(dist) - 1
+
+    # Each candidate takes the window [i - too_close, i + too_close), and
+    # is a peak if it is the max within that window. An even sized filter
+    # is placed so that it covers exactly this range.
+    is_nan = np.isnan(xr)
+    has_nan = is_nan.any()
+    if has_nan:
+        # NaN values would break the running maximum, so they are removed
+        # here and instead rule out every window they fall in
+        xt = np.where(is_nan, -np.inf, xt)
+
+    window_max = maximum_filter1d(xt, 2 * too_close, axis=1, mode='nearest')
+    is_window_max = window_max == xt
+    if has_nan:
+        is_window_max &= maximum_filter1d(is_nan.view(np.uint8),
+                                          2 * too_close, axis=1,
+                                          mode='nearest') == 0
+
+    for i_row in range(n_rows):
+        I1 = could_be_a_peak[i_row].nonzero()[0]
+        if use_max:
+            I2 = np.argsort(-1 * x[i_row, I1])  # -1 => we want largest first
+        else:
+            I2 = np.argsort(x[i_row, I1])
 
-    indices = is_peak_mask.nonzero()[0]
-    peaks = x[indices]
+        # NOTE: Even if a point isn't the local max, it is greater than
+        # anything that is by it that is currently not taken (because of
+        # sorting), so we mark the indices within its distance as taken
+        is_free = could_be_a_peak[i_row].copy()
+        is_checked = np.zeros(n_points, dtype=bool)
+        for cur_index in I1[I2].tolist():
+            if is_free[cur_index]:
+                is_free[max(cur_index - too_close, 0):
+                        cur_index + too_close] = False
+                is_checked[cur_index] = True
 
-    return (peaks, indices)
+        is_peak_mask[i_row] = is_checked & is_window_max[i_row]
+
+    return is_peak_mask
 
 
 def colon(r1, inc, r2):
@@ -458,7 +463,7 @@ def interpolate_with_threshold(array,
     threshold: int
       The maximum size of a contiguous set of missing data points
       that gets interpolated.  Sets larger than this are left as NaNs.
-      If threshold is set to NaN then all points are interpolated.
+      If threshold is set to None then all points are interpolated.
 
     make_copy: bool
       If True, do not modify the array parameter
@@ -492,21 +497,6 @@ def interpolate_with_threshold(array,
     http://stackoverflow.com/questions/2745329/
 
     """
-
-    """
-  # (SKIP THIS, THIS IS FOR THE N-DIMENSIONAL CASE WHICH WE
-  # HAVE NOT IMPLEMENTED YET)
-    # Check that any frames with NaN in at least one dimension must
-    # have it in all:
-    frames_with_at_least_one_NaN = np.all(np.isnan(array), frame_dimension)
-    frames_with_no_NaNs          = np.all(~np.isnan(array), frame_dimension)
-    # check that each frame is either True for one of these arrays or
-    # the other but not both.
-    assert(np.logical_xor(frames_with_at_least_one_NaN, frames_with_no_NaNs))
-    frame_dropped = frames_with_at_least_one_NaN
-
-  """
-
     if make_copy:
         # Use a new array so we don't modify the original array passed to us
         new_array = np.copy(array)
@@ -516,77 +506,30 @@ def interpolate_with_threshold(array,
     if(threshold == 0):  # everything gets left as NaN
         return new_array
 
-    # Say array = [10, 12, 15, nan, 17, nan, nan, nan, -5]
-    # Then np.isnan(array) =
-    # [False, False, False, True, False True, True, True, False]
-    # Let's obtain the "x-coordinates" of the NaN entries.
-    # e.g. [3, 5, 6, 7]
-    x = np.flatnonzero(np.isnan(new_array))
-
-    # (If we weren't using a threshold and just interpolating all NaNs,
-    # we could skip the next four lines.)
-    if(threshold is not None):
-        # Group these together using a fancy trick from
-        # http://stackoverflow.com/questions/2154249/, since
-        # the lambda function x:x[0]-x[1] on an enumerated list will
-        # group consecutive integers together
-        # e.g. [[(0, 3)], [(1, 5), (2, 6), (3, 7)]]
-        x_grouped = [
-            list(group) for key,
-            group in groupby(
-                enumerate(x),
-                lambda i:i[0] -
-                i[1])]
-
-        # We want to know the first element from each "run", and the run's length
-        # e.g. [(3, 1), (5, 3)]
-        x_runs = [(i[0][1], len(i)) for i in x_grouped]
-
-        # We need only interpolate on runs of length <= threshold
-        # e.g. if threshold = 2, then we have only [(3, 1)]
-        x_runs = [i for i in x_runs if i[1] <= threshold]
-
-        # now expand the remaining runs
-        # e.g. if threshold was 5, then x_runs would be [(3,1), (5,3)] so
-        #      x would be [3, 5, 6, 7]
-        # this give us the x-coordinates of the values to be interpolated:
-
-        if x_runs:
-            x = np.concatenate([(i[0] + list(range(i[1]))) for i in x_runs])
-        else:
-            # consider th case that there where not valid groups remaining to
-            # interpolate
-            return new_array
-
-    # The x-coordinates of the data points, must be increasing.
-    xp = np.flatnonzero(~np.isnan(new_array))
-    # The y-coordinates of the data points, same length as xp
-    yp = array[~np.isnan(new_array)]
-
     if extrapolate:
         # TODO
         # :/  Might need to use scipy
-        # also, careful of the "left" and "right" settings below
         pass
 
-    # Place the interpolated values into the array
-    # the "left" and "right" here mean that we want to leave NaNs in place
-    # if the array begins and/or ends with a sequence of NaNs (i.e. don't
-    # try to extrapolate)
-    new_array[x] = np.interp(x, xp, yp, left=np.NaN, right=np.NaN)
+    # The row view shares memory with new_array so the values are filled
+    # in place
+    _interpolate_nan_runs(new_array.reshape(1, -1), threshold)
 
     return new_array
 
 
 def interpolate_with_threshold_2D(array, threshold=None, extrapolate=False):
     """
-    Interpolate two-dimensional data along the second axis.  Each "row"
-    is treated as a separate interpolation.  So if the first axis has 4
-    rows of n frames in the second axis, we are interpolating 4 times.
+    Interpolate a 2D array along its second axis (i.e. each row is
+    interpolated independently), but only for runs of missing data no
+    longer than threshold.
+
+    All rows are processed at once, so e.g. (49, n) skeleton data does
+    not require a loop over the skeleton points.
 
     Parameters
     ---------------------------------------
-    x_old       : [m x n_frames]
+    array: 2-dimensional numpy array
       The array to be interpolated along the second axis
 
     threshold: int (Optional)
@@ -597,25 +540,66 @@ def interpolate_with_threshold_2D(array, threshold=None, extrapolate=False):
       If yes, values are extrapolated to the start and end, along the second
       axis (the axis being interpolated)
 
-    Notes
-    ---------------------------------------
-    This could be optimized with a specialized function for the case
-    when all the NaN entries line up along the first dimension.  We'd
-    only need to calculate the mask once rather than m times.
-
     """
     new_array = array.copy()
 
-    # NOTE: This version is a bit weird because the size of y is not 1d
-    for i1 in range(np.shape(array)[0]):
-        new_array[i1, :] = interpolate_with_threshold(array[i1, :],
-                                                      threshold,
-                                                      make_copy=True,
-                                                      extrapolate=extrapolate)
+    if(threshold == 0):
+        return new_array
+
+    if extrapolate:
+        # TODO: See interpolate_with_threshold
+        pass
+
+    _interpolate_nan_runs(new_array, threshold)
 
     return new_array
 
 
+def _interpolate_nan_runs(array, threshold):
+    """
+    Fill, in place, the NaN runs in each row of a 2D array that are
+    bounded by valid values on both sides and are no longer than
+    threshold (all bounded runs if threshold is None).
+
+    Runs touching either end of a row are left as NaN.
+
+    """
+    nan_mask = np.isnan(array)
+    if not nan_mask.any():
+        return
+
+    n_frames = array.shape[1]
+    frame_I = np.arange(n_frames)
+
+    # For every entry, the index of the closest valid value at or before
+    # it, and at or after it, in the same row. Rows with no valid values
+    # get -1 and n_frames, so nothing in them is filled.
+    #
+    # e.g. [10, 12, 15, nan, 17, nan, nan, nan, -5]
+    # left:  [0, 1, 2, 2, 4, 4, 4, 4, 8]
+    # right: [0, 1, 2, 4, 4, 8, 8, 8, 8]
+    left_I = np.maximum.accumulate(
+        np.where(nan_mask, -1, frame_I), axis=1)
+    right_I = np.minimum.accumulate(
+        np.where(nan_mask, n_frames, frame_I)[:, ::-1], axis=1)[:, ::-1]
+
+    fill_mask = nan_mask & (left_I >= 0) & (right_I < n_frames)
+
+    if threshold is not None:
+        # Each NaN entry knows the length of the run it belongs to
+        fill_mask &= (right_I - left_I - 1) <= threshold
+
+    row_I, x = np.nonzero(fill_mask)
+    x0 = left_I[row_I, x]
+    x1 = right_I[row_I, x]
+    y0 = array[row_I, x0]
+    y1 = array[row_I, x1]
+
+    # Same form as np.interp uses, for consistent results
+    slope = (y1 - y0) / (x1 - x0)
+    array[row_I, x] = slope * (x - x0) + y0
+
+
 def gausswin(L, alpha=2.5):
     """
     An N-point Gaussian window with alpha proportional to the
@@ -1036,6 +1020,115 @@ def compute_normal_vectors(curve, clockwise_orientation=True):
     return normal_vector[0, :], normal_vector[1, :]
 
 
+def ttest_ind_2D(x, y, equal_var=True):
+    """
+    Batched version of scipy.stats.ttest_ind, testing each column of x
+    against the same column of y in one call. NaN values are ignored.
+
+    Parameters
+    ---------------------------------------
+    x: numpy array [n_x_samples x n_columns]
+    y: numpy array [n_y_samples x n_columns]
+    equal_var: bool
+      If True use Student's t-test, otherwise use Welch's t-test, which
+      doesn't assume that the two populations have the same variance.
+
+    Returns
+    ---------------------------------------
+    (t_statistic, p_value): numpy arrays [n_columns]
+      NaN for columns with too few samples
+
+    """
+    n1 = np.sum(~np.isnan(x), axis=0)
+    n2 = np.sum(~np.isnan(y), axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean1 = np.nansum(x, axis=0) / n1
+        mean2 = np.nansum(y, axis=0) / n2
+        # Sums of squared differences from the means
+        ss1 = np.nansum((x - mean1) ** 2, axis=0)
+        ss2 = np.nansum((y - mean2) ** 2, axis=0)
+
+        if equal_var:
+            df = n1 + n2 - 2.0
+            pooled_var = (ss1 + ss2) / df
+            denom = np.sqrt(pooled_var * (1.0 / n1 + 1.0 / n2))
+        else:
+            vn1 = ss1 / (n1 - 1) / n1
+            vn2 = ss2 / (n2 - 1) / n2
+            df = (vn1 + vn2) ** 2 / \
+                (vn1 ** 2 / (n1 - 1) + vn2 ** 2 / (n2 - 1))
+            # As in scipy, when both variances are 0
+            df = np.where(np.isnan(df), 1, df)
+            denom = np.sqrt(vn1 + vn2)
+
+        df = np.where(df > 0, df, np.nan)
+        t = (mean1 - mean2) / denom
+        p = 2 * sp.stats.t.sf(np.abs(t), df)
+
+    return t, p
+
+
+def ranksums_2D(x, y):
+    """
+    Batched version of scipy.stats.ranksums (the Wilcoxon rank-sum test),
+    testing each column of x against the same column of y in one call.
+    NaN values are ignored.
+
+    Parameters
+    ---------------------------------------
+    x: numpy array [n_x_samples x n_columns]
+    y: numpy array [n_y_samples x n_columns]
+
+    Returns
+    ---------------------------------------
+    (z_statistic, p_value): numpy arrays [n_columns]
+      NaN for columns without samples in both x and y
+
+    Notes
+    ---------------------------------------
+    As in scipy, ties are given their average rank but there is no tie
+    correction to the variance.
+
+    """
+    data = np.vstack((x, y))
+    n_samples, n_columns = data.shape
+    is_x = np.zeros(data.shape, dtype=bool)
+    is_x[:len(x)] = True
+
+    # Rank all of the columns at once by sorting by column and then value.
+    # NaN values sort last so they don't affect the ranks of the others.
+    column_I = np.broadcast_to(np.arange(n_columns), data.shape)
+    order = np.lexsort((data.ravel(), column_I.ravel()))
+    sorted_data = data.ravel()[order]
+    sorted_columns = column_I.ravel()[order]
+
+    # Ties get the average of the ranks they span
+    is_new_value = np.ones(len(order), dtype=bool)
+    is_new_value[1:] = ((sorted_data[1:] != sorted_data[:-1]) |
+                        (sorted_columns[1:] != sorted_columns[:-1]))
+    value_I = np.cumsum(is_new_value) - 1
+    value_starts = np.append(np.flatnonzero(is_new_value), len(order))
+    average_ranks = 0.5 * (value_starts[value_I] +
+                           value_starts[value_I + 1] + 1)
+
+    ranks = np.empty(len(order))
+    ranks[order] = average_ranks - sorted_columns * n_samples
+    ranks = ranks.reshape(data.shape)
+
+    is_valid = ~np.isnan(data)
+    n1 = np.sum(is_valid & is_x, axis=0)
+    n2 = np.sum(is_valid & ~is_x, axis=0)
+    rank_sum = np.sum(ranks, axis=0, where=is_valid & is_x)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = n1 * (n1 + n2 + 1) / 2.0
+        z = (rank_sum - expected) / np.sqrt(n1 * n2 * (n1 + n2 + 1) / 12.0)
+        p = 2 * sp.stats.norm.sf(np.abs(z))
+
+    return z, p
+
+
 def compute_q_values2(pvalues,
                      vlambda=None):
     
@@ -65,7 +65,8 @@ setup(
     'open_worm_analysis_toolbox.statistics.feature_metadata'],
     install_requires=['atlas', 'nose', 'pandas', 'statsmodels',
                       'h5py', 'seaborn']
-    # Actually also requires openCV, numpy, scipy, matplotlib and numpy
+    # Actually also requires numpy, scipy and matplotlib (and openCV for
+    # some of the tests)
     # but I don't want to force pip to install these here since pip is bad
     # at that for those packages.
 )
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests of the event finding code in features/events.py
+
+"""
+import sys
+import os
+import operator
+
+import numpy as np
+
+# We must add .. to the path so that we can perform the
+# import of open_worm_analysis_toolbox while running this as
+# a top-level script (i.e. with __name__ = '__main__')
+sys.path.append('..')
+from open_worm_analysis_toolbox.features import events
+
+
+def test_start_stop_indices():
+    ef = events.EventFinder()
+
+    data = np.array([1., 2., 3., 4., 5., 6., 7.])
+    mask = np.array([False, False, True, True, False, True, True])
+    starts_and_stops = ef.get_start_stop_indices(data, mask)
+
+    assert(np.array_equal(starts_and_stops, [[2, 3], [5, 6]]))
+
+    # Leading NaN values are swallowed into the first event
+    data[:2] = np.nan
+    starts_and_stops = ef.get_start_stop_indices(data, mask)
+
+    assert(np.array_equal(starts_and_stops, [[0, 3], [5, 6]]))
+
+    # No events at all
+    starts_and_stops = ef.get_start_stop_indices(data, np.zeros(7, bool))
+
+    assert(starts_and_stops.size == 0)
+
+
+def test_remove_gaps():
+    ef = events.EventFinder()
+
+    starts_and_stops = np.array([[0, 1], [3, 4], [6, 6], [10, 12]])
+
+    # Gaps are 1, 1 and 3 frames long
+    merged = ef.remove_gaps(starts_and_stops, 1, operator.le)
+    assert(np.array_equal(merged, [[0, 6], [10, 12]]))
+
+    merged = ef.remove_gaps(starts_and_stops, 1, operator.lt)
+    assert(np.array_equal(merged, starts_and_stops))
+
+    merged = ef.remove_gaps(starts_and_stops, 3, operator.le)
+    assert(np.array_equal(merged, [[0, 12]]))
+
+
+def test_state_start_stop_indices():
+    ef = events.EventFinder()
+
+    data = np.array([np.nan, 2., 2., 0., -2., -2., 0., 0., 2., np.nan])
+    with np.errstate(invalid='ignore'):
+        masks = [data >= 1, data <= -1, data == 0]
+
+    all_starts_and_stops = events.get_state_start_stop_indices(data, masks)
+
+    # These should match finding the runs of each mask separately
+    for mask, starts_and_stops in zip(masks, all_starts_and_stops):
+        expected = ef.get_start_stop_indices(data, mask)
+        assert(np.array_equal(starts_and_stops, expected))
+
+    assert(np.array_equal(all_starts_and_stops[0], [[0, 2], [8, 9]]))
+
+
+def test_get_events():
+    ef = events.EventFinder()
+    ef.min_speed_threshold = 1
+    ef.min_frames_threshold = 2
+    ef.min_distance_threshold = np.full(12, 3.)
+
+    speed = np.array([0, 2, 2, 0, 2, 0, 1, 1, 1, 0, 5, 0], dtype=float)
+    event_list = ef.get_events(speed)
+
+    # [1, 2] is kept since its distance (4) is over the mean threshold (3),
+    # [4, 4] and [10, 10] are too short in time and [6, 8] is too short a
+    # distance (3 is not over 3)
+    assert(np.array_equal(event_list.start_frames, [1]))
+    assert(np.array_equal(event_list.end_frames, [2]))
+
+
+if __name__ == '__main__':
+    print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')
+    test_start_stop_indices()
+    test_remove_gaps()
+    test_state_start_stop_indices()
+    test_get_events()
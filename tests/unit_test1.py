@@ -5,12 +5,16 @@ Some unit tests of the open-worm-analysis-toolbox package
 """
 import sys
 import os
+import tempfile
+from types import SimpleNamespace
 
+import numpy as np
 # We must add .. to the path so that we can perform the
 # import of open_worm_analysis_toolbox while running this as
 # a top-level script (i.e. with __name__ = '__main__')
 sys.path.append('..')
 import open_worm_analysis_toolbox as mv
+from open_worm_analysis_toolbox.statistics.histogram import Histogram
 #import scipy as sp
 
 
@@ -37,16 +41,192 @@ def test_round_to_odd():
     assert(round_to_odd(-12) in (-11, -13))
 
 
+def test_interpolate_with_threshold():
+    interp = mv.utils.interpolate_with_threshold
+    nan = np.nan
+
+    a = np.array([10, 12, 15, nan, 17, nan, nan, nan, -5, nan])
+
+    # The trailing NaN is never filled since we don't extrapolate
+    assert(np.array_equal(interp(a),
+                          [10, 12, 15, 16, 17, 11.5, 6, 0.5, -5, nan],
+                          equal_nan=True))
+    assert(np.array_equal(interp(a, 2),
+                          [10, 12, 15, 16, 17, nan, nan, nan, -5, nan],
+                          equal_nan=True))
+    assert(np.array_equal(interp(a, 0), a, equal_nan=True))
+
+    # Rows are interpolated independently
+    b = np.vstack((a, a[::-1]))
+    b2 = mv.utils.interpolate_with_threshold_2D(b, 3)
+    assert(np.array_equal(b2[0], interp(a, 3), equal_nan=True))
+    assert(np.array_equal(b2[1], interp(a[::-1], 3), equal_nan=True))
+
+
+def test_separated_peaks():
+    x = np.array([0, 5, 0, 3, 0, 0, 1, 0, 0, 0, 4, 0, 2, 0.])
+
+    # 3 is within 2 of the larger 5, and 2 is within 2 of 4
+    peaks, indices = mv.utils.separated_peaks(x, 3, True, 0)
+    assert(np.array_equal(indices, [1, 6, 10]))
+    assert(np.array_equal(peaks, [5, 1, 4]))
+
+    peaks, indices = mv.utils.separated_peaks(-x, 3, False, 0)
+    assert(np.array_equal(indices, [1, 6, 10]))
+
+    # The batched version gives the same answer for each row
+    is_peak = mv.utils.separated_peaks_2D(np.vstack((x, x[::-1])), 3, True, 0)
+    assert(np.array_equal(np.flatnonzero(is_peak[0]), [1, 6, 10]))
+    assert(np.array_equal(np.flatnonzero(is_peak[1]),
+                          mv.utils.separated_peaks(x[::-1], 3, True, 0)[1]))
+
+
+def test_contour_moments():
+    from open_worm_analysis_toolbox.features.posture_features import \
+        EccentricityAndOrientationProcessor as Processor
+
+    # A 4 x 2 rectangle, counter-clockwise in the first frame and
+    # clockwise in the second
+    x = np.array([0, 4, 4, 0.])
+    y = np.array([0, 0, 2, 2.])
+    x = np.column_stack((x, x[::-1]))
+    y = np.column_stack((y, y[::-1]))
+
+    mu11, mu20, mu02 = Processor.h__contourMoments(x, y)
+    assert(np.allclose(mu20, 4**3 * 2 / 12))
+    assert(np.allclose(mu02, 4 * 2**3 / 12))
+    assert(np.allclose(mu11, 0))
+
+    # A degenerate (zero area) contour gives finite moments, as in OpenCV
+    x = np.array([[0, 1, 2, 1.]]).T
+    mu11, mu20, mu02 = Processor.h__contourMoments(x, 2 * x)
+    assert(np.all(np.isfinite([mu11, mu20, mu02])))
+
+
+def test_movement_feature_view():
+    from open_worm_analysis_toolbox.features.feature_manipulations import \
+        MovementFeatureView
+
+    feature = SimpleNamespace(name='test', value=np.array([-1., 2., -3.]),
+                              spec=None)
+    spec = SimpleNamespace(name='test.absolute')
+    mask = np.array([True, False, True])
+
+    view = MovementFeatureView(feature, spec, mask, True)
+    assert(np.array_equal(view.value, [1, 3]))
+    assert(view.mask is None)
+
+    # Features may be emptied by setting their value to None
+    view = MovementFeatureView(feature, spec, mask, True)
+    view.value = None
+    assert(view.value is None)
+
+
+def make_histogram(data, bin_width=0.5):
+    # A histogram of a stand-in for a feature
+    spec = SimpleNamespace(name='test', bin_width=bin_width)
+    return Histogram(SimpleNamespace(value=np.array(data), spec=spec))
+
+
+def test_histogram_bins():
+    h = make_histogram([-0.2, 0.1, 0.3, 2.0, np.nan, 1000.2])
+
+    # Only the non-empty bins are stored, the outlier doesn't need any more
+    assert(h.bin_offset == -1)
+    assert(np.array_equal(h.sparse_bin_indices, [0, 1, 5, 2001]))
+    assert(np.array_equal(h.sparse_counts, [1, 2, 1, 1]))
+    assert(h.num_bins == 2002)
+    assert(h.counts.sum() == 5)
+
+    # The last bin is closed
+    h = make_histogram([0.1, 1.0])
+    assert(np.array_equal(h.counts, [1, 1]))
+    assert(np.allclose(h.bin_boundaries, [0, 0.5, 1]))
+
+
+def test_histogram_merge():
+    # A maximum sitting exactly on a bin edge is counted in the (closed)
+    # last bin, which the merge can't move, so avoid one here
+    a = np.array([0.1, 0.3, np.nan, 2.2])
+    b = np.array([-1.2, 0.4, 5.1])
+
+    merged = make_histogram(a).merge(make_histogram(b))
+    both = np.concatenate((a, b))
+    expected = make_histogram(both)
+
+    # The merge only needs the counts and moments, not the samples
+    assert(merged.bin_offset == expected.bin_offset)
+    assert(np.array_equal(merged.counts, expected.counts))
+    assert(merged.num_samples == 7)
+    assert(np.isclose(merged.pooled_mean, np.nanmean(both)))
+    assert(np.isclose(merged.pooled_std, np.nanstd(both)))
+    assert(np.allclose(merged.mean_per_video, [np.nanmean(a), np.mean(b)]))
+
+
+def test_histogram_store():
+    hist_matrix = np.full([2, 2], None, object)
+    hist_matrix[0, 0] = make_histogram([0.1, 0.3, np.nan, 2.2])
+    hist_matrix[0, 1] = make_histogram([-1.2, 0.4, 5.1])
+    hm = SimpleNamespace(row_names=['test', 'missing'],
+                         hist_matrix=hist_matrix)
+
+    file_path = os.path.join(tempfile.mkdtemp(), 'histograms.h5')
+
+    # The second append should add videos, rather than replace them
+    for i in range(2):
+        with mv.HistogramStore(file_path) as store:
+            store.append(hm)
+
+    loaded = mv.HistogramManager.from_store(file_path, ['test', 'missing'])
+    assert(loaded.num_videos == 4)
+    assert(loaded[1] is None)
+
+    expected = hist_matrix[0, 0].merge(hist_matrix[0, 1])
+    expected = expected.merge(expected)
+    assert(loaded[0].bin_offset == expected.bin_offset)
+    assert(np.array_equal(loaded[0].counts, expected.counts))
+    assert(np.allclose(loaded[0].mean_per_video, expected.mean_per_video))
+    assert(np.allclose(loaded[0].std_per_video, expected.std_per_video))
+
+    # Overwriting replaces the videos
+    loaded.to_store(file_path, overwrite=True)
+    assert(mv.HistogramManager.from_store(file_path).num_videos == 4)
+
+    # Other HDF5 files aren't turned into stores
+    with mv.HistogramStore(file_path, 'w') as store:
+        store.h.create_group('not_a_histogram_store')
+        del store.h.attrs['schema_version']
+    try:
+        mv.HistogramStore(file_path)
+        assert(False)
+    except Exception as e:
+        assert('not a histogram store' in str(e))
+
+
 def test_ttest():
-    # From http://docs.scipy.org/doc/scipy-0.15.1/reference/generated/
-    # scipy.stats.ttest_ind.html
-    # TODO
-    #rvs1 = sp.stats.norm.rvs(loc=5,scale=10,size=500)
-    #rvs2 = sp.stats.norm.rvs(loc=5,scale=10,size=500)
-    #p1 = sp.stats.ttest_ind(rvs1, rvs2)
-    #p2 = sp.stats.ttest_ind(rvs1, rvs2)
-
-    assert(True)
+    import scipy.stats
+
+    # Each column is tested separately, ignoring NaN values
+    x = np.array([[1.0, 2.0, np.nan],
+                  [2.0, np.nan, 4.0],
+                  [4.0, 3.0, 5.0]])
+    y = np.array([[2.0, 8.0, 1.0],
+                  [5.0, 3.0, np.nan]])
+
+    for equal_var in (True, False):
+        t, p = mv.utils.ttest_ind_2D(x, y, equal_var)
+        for i in range(x.shape[1]):
+            a = x[~np.isnan(x[:, i]), i]
+            b = y[~np.isnan(y[:, i]), i]
+            expected = scipy.stats.ttest_ind(a, b, equal_var=equal_var)
+            assert(np.allclose([t[i], p[i]], expected[:2], equal_nan=True))
+
+    z, p = mv.utils.ranksums_2D(x, y)
+    for i in range(x.shape[1]):
+        a = x[~np.isnan(x[:, i]), i]
+        b = y[~np.isnan(y[:, i]), i]
+        assert(np.allclose([z[i], p[i]], scipy.stats.ranksums(a, b)))
+
 
 if __name__ == '__main__':
     print('RUNNING TEST ' + os.path.split(__file__)[1] + ':')